@@ -0,0 +1,192 @@
+"""
+This module contains the Catalog of saved exclusion lists. The catalog holds metadata for every saved list (interval
+count, file size, bounding box, charge histogram, timestamps and format version) so that clients can inspect saved
+lists without loading them into the active exclusion list. The catalog is persisted as json and kept in sync on
+save, load and delete.
+
+At startup, saved files which are not catalogued, or which changed (size or modification time) since they were, get
+a partial entry. The partial entries are then completed in a background thread, by reading the saved states without
+building their indexes (see complete_partial_entries).
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Any
+
+from constants import EXCLUSION_LIST_FORMAT_VERSION
+from exclusion_list import ExclusionList
+
+_log = logging.getLogger(__name__)
+
+
+def get_timestamp(seconds: float = None) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+
+@dataclasses.dataclass
+class CatalogEntry:
+    exid: str
+    byte_size: int
+    created: str
+    updated: str
+    interval_count: Optional[int] = None
+    bounding_box: Optional[Dict[str, List[Optional[float]]]] = None
+    charge_counts: Optional[Dict[str, int]] = None
+    format_version: Optional[int] = None
+    mtime: Optional[float] = None
+
+    def is_complete(self) -> bool:
+        return self.interval_count is not None
+
+
+def is_stale(entry: CatalogEntry, file_path: str) -> bool:
+    """
+    Check whether the saved file changed since its entry was made: a rewrite can keep the same size.
+    """
+    return entry.byte_size != os.path.getsize(file_path) or entry.mtime != os.path.getmtime(file_path)
+
+
+@dataclasses.dataclass
+class Catalog:
+    """
+    Catalog of saved exclusion lists. The entries are changed by the server and by the thread completing partial
+    entries, under the catalog's lock.
+    """
+    file_path: str
+    entries: Dict[str, CatalogEntry] = dataclasses.field(default_factory=dict)
+    _lock: threading.RLock = dataclasses.field(default_factory=threading.RLock, repr=False)
+
+    @staticmethod
+    def from_file(file_path: str) -> 'Catalog':
+        """
+        Read the catalog from a json file. A missing or unreadable file results in an empty catalog.
+        """
+        catalog = Catalog(file_path=file_path)
+        if not os.path.exists(file_path):
+            return catalog
+
+        try:
+            with open(file_path, 'r') as f:
+                catalog.entries = {exid: CatalogEntry(**entry) for exid, entry in json.load(f).items()}
+        except Exception as e:
+            _log.error(f'Error when reading exclusion list catalog, rebuilding: {e}')
+
+        return catalog
+
+    def write(self) -> None:
+        """
+        Write the catalog to its json file. The file is replaced atomically so that a crash never leaves a partial
+        catalog behind.
+        """
+        with self._lock:
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({exid: dataclasses.asdict(entry) for exid, entry in self.entries.items()}, f, indent=2)
+            os.replace(tmp_path, self.file_path)
+
+    def sync(self, data_folder: str, extension: str = '.pkl') -> None:
+        """
+        Drop entries whose saved file no longer exists and add partial entries (file size and modification time only)
+        for saved files that are not yet catalogued or changed since they were. Partial entries are completed by
+        complete_partial_entries, or the next time the list is loaded or saved.
+        """
+        saved_files = {}
+        if os.path.exists(data_folder):
+            saved_files = {f[:-len(extension)]: os.path.join(data_folder, f) for f in os.listdir(data_folder)
+                           if f.endswith(extension)}
+
+        with self._lock:
+            for exid in [exid for exid in self.entries if exid not in saved_files]:
+                self.entries.pop(exid)
+
+            for exid, file_path in saved_files.items():
+                entry = self.entries.get(exid)
+                if entry is None or is_stale(entry, file_path):
+                    mtime = os.path.getmtime(file_path)
+                    self.entries[exid] = CatalogEntry(exid=exid, byte_size=os.path.getsize(file_path),
+                                                      created=get_timestamp(mtime), updated=get_timestamp(mtime),
+                                                      mtime=mtime)
+
+            self.write()
+
+    def complete_partial_entries(self, data_folder: str, extension: str = '.pkl') -> int:
+        """
+        Complete the partial entries by reading their saved states, without building indexes. Meant to run in a
+        background thread at startup: the lock is only held to update an entry, and an entry whose file changed
+        while it was read (e.g. the list was saved again) is left to the save.
+
+        Returns:
+            int: The number of completed entries.
+        """
+        with self._lock:
+            partial_exids = [exid for exid, entry in self.entries.items() if not entry.is_complete()]
+
+        completed = 0
+        for exid in partial_exids:
+            file_path = os.path.join(data_folder, exid + extension)
+            try:
+                mtime = os.path.getmtime(file_path)
+                state = ExclusionList.read_state(file_path)
+                summary = ExclusionList.state_summary(state)
+                format_version = state.get('format_version')
+            except Exception as e:
+                _log.error(f'Error when reading saved exclusion list {exid} for the catalog: {e}')
+                continue
+
+            with self._lock:
+                entry = self.entries.get(exid)
+                if entry is None or entry.is_complete() or is_stale(entry, file_path) or entry.mtime != mtime:
+                    continue
+                self.entries[exid] = dataclasses.replace(entry, interval_count=summary['interval_count'],
+                                                         bounding_box=summary['bounding_box'],
+                                                         charge_counts=summary['charge_counts'],
+                                                         format_version=format_version)
+                self.write()
+            completed += 1
+
+        return completed
+
+    def update(self, exid: str, file_path: str, summary: Dict[str, Any],
+               format_version: int = EXCLUSION_LIST_FORMAT_VERSION) -> CatalogEntry:
+        """
+        Create or refresh the entry of a saved exclusion list from the list's summary (see ExclusionList.summary).
+        The creation time of an existing entry is kept.
+        """
+        now = get_timestamp()
+        with self._lock:
+            previous = self.entries.get(exid)
+            entry = CatalogEntry(exid=exid,
+                                 byte_size=os.path.getsize(file_path),
+                                 created=previous.created if previous is not None else now,
+                                 updated=now,
+                                 interval_count=summary['interval_count'],
+                                 bounding_box=summary['bounding_box'],
+                                 charge_counts=summary['charge_counts'],
+                                 format_version=format_version,
+                                 mtime=os.path.getmtime(file_path))
+            self.entries[exid] = entry
+            self.write()
+        return entry
+
+    def complete(self, exid: str, file_path: str, exclusion_list: ExclusionList) -> None:
+        """
+        Fill in a partial entry from a freshly loaded exclusion list, keeping its timestamps.
+        """
+        with self._lock:
+            entry = self.entries.get(exid)
+            if entry is not None and entry.is_complete():
+                return
+
+            completed = self.update(exid, file_path, exclusion_list.summary(), exclusion_list.format_version)
+            if entry is not None:
+                completed.created, completed.updated = entry.created, entry.updated
+                self.write()
+
+    def remove(self, exid: str) -> None:
+        with self._lock:
+            if self.entries.pop(exid, None) is not None:
+                self.write()
@@ -0,0 +1,78 @@
+"""
+Fixtures shared by the tests.
+"""
+
+import importlib
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Optional
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """
+    A fresh server module (main) with an empty active list, in an empty working directory (its data folders and log
+    files are relative to it).
+    """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join('data', 'pickles'))
+    sys.modules.pop('main', None)
+    yield importlib.import_module('main')
+    sys.modules.pop('main', None)
+
+
+@pytest.fixture
+def client(server):
+    """
+    A test client of the server, whose startup and shutdown events run before and after the test.
+    """
+    with TestClient(server.app) as client:
+        yield client
+
+
+class LiveServer:
+    """
+    A server app served over http by uvicorn in a background thread, for the clients using requests (the plugin).
+    """
+
+    def __init__(self, app, port: Optional[int] = None):
+        if port is None:
+            with socket.socket() as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+        self.port = port
+        self.url = f'http://127.0.0.1:{port}'
+        self._server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'LiveServer':
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            assert self._thread.is_alive() and time.monotonic() < deadline, 'server did not start'
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._thread = None
+
+
+@pytest.fixture
+def live_server(server):
+    """
+    The server module, served over http.
+    """
+    live_server = LiveServer(server.app).start()
+    yield live_server
+    live_server.stop()
@@ -1,3 +1,8 @@
 import os
 PROCESS_CANDIDATES_FILE = "data/process_candidates.py"
-DATA_FOLDER = str(os.path.join('data', 'pickles'))
\ No newline at end of file
+DATA_FOLDER = str(os.path.join('data', 'pickles'))
+STATE_FILE = str(os.path.join('data', 'state.json'))
+CATALOG_FILE = str(os.path.join('data', 'catalog.json'))
+JOBS_FOLDER = str(os.path.join('data', 'jobs'))
+EXCLUSION_LIST_FORMAT_VERSION = 2
+CHECKPOINT_EXID = 'checkpoint'
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from .exclusionms.components import ExclusionPoint
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+LATENCY_WINDOW = 256
+MIN_BATCH_SIZE = 16
+MAX_BATCH_SIZE = 1024
+AT_RISK_FRACTION = 0.5  # p95 batch latency above this fraction of the budget puts the budget at risk
+HEALTHY_FRACTION = 0.2  # p95 batch latency below this fraction of the budget lets batches grow again
+
+# the list endpoint takes a json object per point, the batch endpoint one json list per dimension (a smaller payload)
+ENDPOINTS = ('/exclusionms/points/exclusion_search', '/exclusionms/points/exclusion_search_batch')
+
+
+class LatencyWindow:
+    """
+    Rolling window of the last latencies, in milliseconds.
+    """
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._latencies = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency_ms: float) -> None:
+        self._latencies.append(latency_ms)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def report(self) -> Dict[str, Optional[float]]:
+        return {'count': len(self._latencies), 'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+class BudgetedExclusionChecker:
+    """
+    Checks candidates against the Exclusion-MS server, optionally within a per-cycle time budget.
+
+    The points are sent in batches, each with the remaining budget as request timeout and as the X-Deadline-Ms header
+    (so the server sheds the request instead of answering late). Points which could not be checked in time are
+    reported by the fallback instead: the local replica when there is one, otherwise as not excluded (the candidates
+    pass unfiltered, the check fails open). Each such cycle is recorded as a miss.
+
+    Without a budget (budget_ms None), the requests have no timeout or deadline, as before budgets were added, and
+    only points whose request failed are reported by the fallback.
+
+    The batch latencies are kept in a rolling window. When the p95 batch latency puts the budget at risk, batches are
+    halved and the compact batch endpoint is used; when it is well within the budget, batches grow again.
+    """
+
+    def __init__(self, exclusion_api_ip: str, budget_ms: Optional[float] = None, batch_size: int = MAX_BATCH_SIZE):
+        self._exclusion_api_ip = exclusion_api_ip
+        self._session = requests.Session()
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.endpoint = ENDPOINTS[0]
+        self.latencies = LatencyWindow()
+        self.cycle_latencies = LatencyWindow()
+        self.cycles = 0
+        self.misses = 0
+        self.errors = 0
+        self.degraded_points = 0
+
+    def get_excluded_points(self, exclusion_points: List[ExclusionPoint],
+                            fallback: Optional[Callable[[List[ExclusionPoint]], List[bool]]] = None) -> List[bool]:
+        """
+        Check whether each point is excluded, within the time budget if there is one.
+
+        Args:
+            exclusion_points (List[ExclusionPoint]): The points to check.
+            fallback (Optional[Callable]): Checks the points which the server did not answer in time. If None, they
+                are reported as not excluded.
+
+        Returns:
+            List[bool]: Whether each point is excluded.
+        """
+        start_time = time.monotonic()
+        deadline = None if self.budget_ms is None else start_time + self.budget_ms / 1000
+        flags = []
+        try:
+            while len(flags) < len(exclusion_points):
+                remaining_ms = None if deadline is None else (deadline - time.monotonic()) * 1000
+                if remaining_ms is not None and remaining_ms <= 0:
+                    break
+                batch = exclusion_points[len(flags):len(flags) + self.batch_size]
+                batch_flags = self._post(batch, remaining_ms)
+                if batch_flags is None:
+                    break
+                flags.extend(batch_flags)
+        except requests.Timeout:
+            _log.debug(f'Exclusion check exceeded the budget of {self.budget_ms} ms')
+        except Exception as ex:
+            self.errors += 1
+            _log.error(f'exception when excluding candidates: {ex}')
+
+        self.cycles += 1
+        self.cycle_latencies.record((time.monotonic() - start_time) * 1000)
+        if len(flags) < len(exclusion_points):
+            unchecked_points = exclusion_points[len(flags):]
+            self.misses += 1
+            self.degraded_points += len(unchecked_points)
+            flags.extend(fallback(unchecked_points) if fallback is not None else [False] * len(unchecked_points))
+        self._adapt()
+        return flags
+
+    def _post(self, batch: List[ExclusionPoint], remaining_ms: Optional[float]) -> Optional[List[bool]]:
+        if self.endpoint == ENDPOINTS[0]:
+            payload = [{'charge': point.charge, 'mass': point.mass, 'rt': point.rt, 'ook0': point.ook0,
+                        'intensity': point.intensity} for point in batch]
+        else:
+            payload = {'charge': [point.charge for point in batch], 'mass': [point.mass for point in batch],
+                       'rt': [point.rt for point in batch], 'ook0': [point.ook0 for point in batch],
+                       'intensity': [point.intensity for point in batch]}
+
+        start_time = time.monotonic()
+        try:
+            if remaining_ms is None:
+                response = self._session.post(url=f'{self._exclusion_api_ip}{self.endpoint}', json=payload)
+            else:
+                response = self._session.post(url=f'{self._exclusion_api_ip}{self.endpoint}', json=payload,
+                                              headers={'X-Deadline-Ms': f'{remaining_ms:.1f}'},
+                                              timeout=remaining_ms / 1000)
+        finally:
+            # timed out batches are recorded too, they are the ones putting the budget at risk
+            self.latencies.record((time.monotonic() - start_time) * 1000)
+        response.raise_for_status()
+
+        # a shed request is answered with "not excluded" for every point, which is not an answer
+        if response.headers.get('X-Deadline-Status') == 'shed':
+            return None
+        return response.json()
+
+    def _adapt(self) -> None:
+        p95 = self.latencies.percentile(95)
+        if self.budget_ms is None or p95 is None or len(self.latencies) < 8:
+            return
+
+        if p95 > self.budget_ms * AT_RISK_FRACTION:
+            if self.endpoint != ENDPOINTS[1]:
+                _log.info(f'Exclusion check p95 latency {p95:.1f} ms puts the budget at risk, using {ENDPOINTS[1]}')
+                self.endpoint = ENDPOINTS[1]
+            self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+        elif p95 < self.budget_ms * HEALTHY_FRACTION:
+            self.batch_size = min(MAX_BATCH_SIZE, self.batch_size * 2)
+
+    def report(self) -> Dict:
+        return {'budget_ms': self.budget_ms, 'batch_size': self.batch_size, 'endpoint': self.endpoint,
+                'cycles': self.cycles, 'misses': self.misses, 'errors': self.errors,
+                'degraded_points': self.degraded_points, 'batch_latency_ms': self.latencies.report(),
+                'cycle_latency_ms': self.cycle_latencies.report()}
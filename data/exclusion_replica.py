@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from .exclusionms.components import ExclusionInterval, ExclusionPoint
+
+_log = logging.getLogger(__name__)
+_log.setLevel(logging.INFO)
+
+MASS_BIN_WIDTH = 0.02
+MAX_MASS_BIN_SPAN = 64
+FIELDS = ('interval_id', 'charge', 'min_mass', 'max_mass', 'min_rt', 'max_rt', 'min_ook0', 'max_ook0',
+          'min_intensity', 'max_intensity', 'exclusion')
+
+# (interval_id, charge, min_mass, max_mass, min_rt, max_rt, min_ook0, max_ook0, min_intensity, max_intensity, exclusion)
+IntervalTuple = Tuple
+
+
+def interval_to_tuple(interval: ExclusionInterval) -> IntervalTuple:
+    return tuple(getattr(interval, field) for field in FIELDS)
+
+
+def dict_to_tuple(interval: Dict) -> IntervalTuple:
+    return tuple(interval[field] for field in FIELDS)
+
+
+class ExclusionReplica:
+    """
+    In-process replica of the active exclusion list of the Exclusion-MS server.
+
+    The replica pulls a snapshot of the active list from /exclusionms/sync/snapshot and then follows the mutations
+    made on the server (adds, removes, clears, loads and offset changes) by long polling /exclusionms/sync/mutations
+    from a background thread. Exclusion checks are answered in-process, so they do not wait for the network.
+
+    Intervals added by the plugin itself (its dynamic exclusion intervals) are applied to the replica immediately with
+    add_local, before the server has them; the server's echo of such an add is then skipped. The server remains the
+    source of truth and is still responsible for persisting the list.
+
+    The replica is not ready while a snapshot reload failed, until a reload succeeds, so that checks fall back to the
+    server instead of answering from a list which no longer follows it.
+    """
+
+    def __init__(self, exclusion_api_ip: str, poll_timeout: float = 10.0, request_timeout: float = 30.0,
+                 retry_interval: float = 1.0):
+        self._exclusion_api_ip = exclusion_api_ip
+        self._poll_timeout = poll_timeout
+        self._request_timeout = request_timeout
+        self._retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._intervals = Counter()
+        self._mass_bins: Dict[int, List[IntervalTuple]] = {}
+        self._wide_intervals: List[IntervalTuple] = []
+        self._pending = Counter()  # local intervals whose add was not yet received from the server
+        self._offset = {'mass': 0.0, 'rt': 0.0, 'ook0': 0.0, 'intensity': 0.0}
+        self._epoch = None
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.ready = False
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(self._intervals.values())
+
+    def start(self) -> None:
+        """
+        Pull the snapshot and start following the server's mutations in a background thread.
+        """
+        self._load_snapshot()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='exclusion-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Stop following the server's mutations.
+
+        Args:
+            wait (bool): Whether to wait for the background thread to finish, else call join later (e.g. after
+                releasing a lock the thread's callers need).
+        """
+        self._stop_event.set()
+        self.ready = False
+        if wait:
+            self.join()
+
+    def join(self) -> None:
+        """
+        Wait for the background thread to finish after stop, for at most one long poll.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout=self._poll_timeout + self._request_timeout)
+            self._thread = None
+
+    def add_local(self, interval: ExclusionInterval) -> None:
+        """
+        Apply an interval which the plugin is about to post to the server.
+        """
+        interval_tuple = interval_to_tuple(interval)
+        with self._lock:
+            self._add(interval_tuple)
+            self._pending[interval_tuple] += 1
+
+    def get_excluded_points(self, exclusion_points: List[ExclusionPoint]) -> List[bool]:
+        """
+        Check whether each point is excluded, applying the server's offset to the points like the server does.
+        """
+        with self._lock:
+            return [self._is_excluded(self._apply_offset(point)) for point in exclusion_points]
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                response = requests.get(url=f'{self._exclusion_api_ip}/exclusionms/sync/mutations',
+                                        params={'since': self._seq, 'timeout': self._poll_timeout,
+                                                'epoch': self._epoch},
+                                        timeout=self._poll_timeout + self._request_timeout)
+                if response.status_code == 410:
+                    _log.info('Exclusion replica fell behind the server, reloading snapshot')
+                    self._load_snapshot()
+                    continue
+                response.raise_for_status()
+
+                for mutation in response.json()['mutations']:
+                    if self._stop_event.is_set():
+                        break
+                    if mutation['seq'] > self._seq:
+                        self._apply(mutation)
+            except Exception as ex:
+                _log.error(f'Error when updating exclusion replica: {ex}')
+                self._stop_event.wait(self._retry_interval)
+
+    def _load_snapshot(self) -> None:
+        try:
+            response = requests.get(url=f'{self._exclusion_api_ip}/exclusionms/sync/snapshot',
+                                    timeout=self._request_timeout)
+            response.raise_for_status()
+            snapshot = response.json()
+            columns = snapshot['intervals']
+            intervals = list(zip(*(columns[field] for field in FIELDS)))
+        except Exception:
+            # the list no longer follows the server until a reload succeeds
+            self.ready = False
+            raise
+
+        with self._lock:
+            self._clear()
+            for interval_tuple in intervals:
+                self._add(interval_tuple)
+
+            # local intervals which the server already had when the snapshot was taken are no longer pending
+            if self._pending:
+                snapshot_intervals = Counter(interval_tuple for interval_tuple in intervals
+                                             if interval_tuple in self._pending)
+                for interval_tuple, count in list(self._pending.items()):
+                    received = min(count, snapshot_intervals[interval_tuple])
+                    for _ in range(count - received):
+                        self._add(interval_tuple)
+                    self._pending[interval_tuple] -= received
+                self._pending += Counter()
+
+            self._offset = snapshot['offset']
+            self._epoch = snapshot['epoch']
+            self._seq = snapshot['seq']
+            self.ready = True
+
+        _log.info(f'Exclusion replica loaded {len(intervals)} intervals at seq {self._seq}')
+
+    def _apply(self, mutation: Dict) -> None:
+        op = mutation['op']
+        if op == 'reset':
+            self._load_snapshot()
+            return
+
+        with self._lock:
+            if op == 'add':
+                for interval in mutation['intervals']:
+                    interval_tuple = dict_to_tuple(interval)
+                    if self._pending[interval_tuple] > 0:
+                        self._pending[interval_tuple] -= 1
+                    else:
+                        self._add(interval_tuple)
+                self._pending += Counter()
+            elif op == 'remove':
+                for interval in mutation['intervals']:
+                    self._remove(dict_to_tuple(interval))
+            elif op == 'remove_prefix':
+                self._remove_prefix(mutation['prefix'])
+            elif op == 'clear':
+                self._clear()
+                for interval_tuple, count in self._pending.items():
+                    for _ in range(count):
+                        self._add(interval_tuple)
+            elif op == 'offset':
+                self._offset = mutation['offset']
+            else:
+                _log.warning(f'Unknown exclusion list mutation: {op}')
+            self._seq = mutation['seq']
+
+    @staticmethod
+    def _get_mass_bins(interval_tuple: IntervalTuple) -> Optional[range]:
+        min_mass, max_mass = interval_tuple[2], interval_tuple[3]
+        if min_mass is None or max_mass is None or not (math.isfinite(min_mass) and math.isfinite(max_mass)):
+            return None
+
+        first_bin = math.floor(min_mass / MASS_BIN_WIDTH)
+        last_bin = math.floor(max_mass / MASS_BIN_WIDTH)
+        if last_bin - first_bin >= MAX_MASS_BIN_SPAN:
+            return None
+        return range(first_bin, last_bin + 1)
+
+    def _clear(self) -> None:
+        self._intervals = Counter()
+        self._mass_bins = {}
+        self._wide_intervals = []
+
+    def _add(self, interval_tuple: IntervalTuple) -> None:
+        self._intervals[interval_tuple] += 1
+        mass_bins = self._get_mass_bins(interval_tuple)
+        if mass_bins is None:
+            self._wide_intervals.append(interval_tuple)
+            return
+        for mass_bin in mass_bins:
+            self._mass_bins.setdefault(mass_bin, []).append(interval_tuple)
+
+    def _remove(self, interval_tuple: IntervalTuple) -> None:
+        if self._intervals[interval_tuple] == 0:
+            _log.warning(f'Exclusion replica does not have removed interval {interval_tuple[0]}')
+            return
+
+        self._intervals[interval_tuple] -= 1
+        if self._intervals[interval_tuple] == 0:
+            del self._intervals[interval_tuple]
+
+        mass_bins = self._get_mass_bins(interval_tuple)
+        if mass_bins is None:
+            self._wide_intervals.remove(interval_tuple)
+            return
+        for mass_bin in mass_bins:
+            intervals = self._mass_bins[mass_bin]
+            intervals.remove(interval_tuple)
+            if not intervals:
+                del self._mass_bins[mass_bin]
+
+    def _remove_prefix(self, prefix: str) -> None:
+        for interval_tuple, count in list(self._intervals.items()):
+            if interval_tuple[0].rsplit('_', 1)[0] == prefix:
+                for _ in range(count):
+                    self._remove(interval_tuple)
+
+    def _apply_offset(self, point: ExclusionPoint) -> Tuple:
+        offset = self._offset
+        return (point.charge,
+                point.mass + offset['mass'] if point.mass else point.mass,
+                point.rt + offset['rt'] if point.rt else point.rt,
+                point.ook0 + offset['ook0'] if point.ook0 else point.ook0,
+                point.intensity + offset['intensity'] if point.intensity else point.intensity)
+
+    def _is_excluded(self, point: Tuple) -> bool:
+        charge, mass, rt, ook0, intensity = point
+        if mass is None:
+            candidates = self._intervals
+        else:
+            candidates = self._mass_bins.get(math.floor(mass / MASS_BIN_WIDTH), [])
+            if self._wide_intervals:
+                candidates = candidates + self._wide_intervals
+
+        for (_, interval_charge, min_mass, max_mass, min_rt, max_rt, min_ook0, max_ook0, min_intensity,
+             max_intensity, exclusion) in candidates:
+            if not exclusion:
+                continue
+            if charge is not None and interval_charge is not None and interval_charge != charge:
+                continue
+            if not _contains(min_mass, max_mass, mass) or not _contains(min_rt, max_rt, rt) or \
+                    not _contains(min_ook0, max_ook0, ook0) or not _contains(min_intensity, max_intensity, intensity):
+                continue
+            return True
+        return False
+
+
+def _contains(min_bound: Optional[float], max_bound: Optional[float], value: Optional[float]) -> bool:
+    if value is None:
+        return True
+    return (min_bound is None or value >= min_bound) and (max_bound is None or value < max_bound)
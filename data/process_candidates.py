@@ -5,8 +5,10 @@ import time
 from threading import Lock
 
 from .exclusionms.apihandler import load_active_exclusion_list, save_active_exclusion_list, get_exclusion_list_files, \
-    clear_active_exclusion_list, add_exclusion_interval_query, get_excluded_points
+    clear_active_exclusion_list, add_exclusion_interval_query
 from .exclusionms.components import DynamicExclusionTolerance, IncorrectToleranceException, ExclusionPoint
+from .exclusion_budget import BudgetedExclusionChecker
+from .exclusion_replica import ExclusionReplica
 from .paserproducer.ddaproducer import DdaPasefProducer
 from .paserproducer.prddataclasses import MsMsInfo
 from .paserproducer.sampleinfo import has_key_pac_qualifier
@@ -80,6 +82,8 @@ class DdaPasefPlugin:
         self._uid = paser_key_dict['uid']
         self._exid = None
         self._dynamic_tolerance = None
+        self._replica = None
+        self._exclusion_checker = None
         if paser_key_dict.get('exlist'):
             self._exid = str(paser_key_dict.get('exlist').get('exid'))
             if paser_key_dict.get('exlist').get('dynamic') is True and paser_key_dict.get('exlist').get('tolerance'):
@@ -127,6 +131,20 @@ class DdaPasefPlugin:
         except Exception as ex:
             _log.error(f"Error Loading ExclusionList {ex}. Disabling exclusion list for run.", exc_info=True)
             self._exid = None
+
+        if self._exid is not None:
+            # optional per-cycle time budget of the server check, candidates pass unfiltered when it is exceeded
+            budget_ms = getattr(self._config.exclusion_api, 'budget_ms', None)
+            self._exclusion_checker = BudgetedExclusionChecker(self._config.exclusion_api.ip, budget_ms=budget_ms)
+
+        try:
+            if self._exid is not None:
+                self._replica = ExclusionReplica(self._config.exclusion_api.ip)
+                self._replica.start()
+                _log.info(f"Exclusion list replica loaded {len(self._replica)} intervals")
+        except Exception as ex:
+            _log.error(f"Error starting exclusion list replica {ex}. Checking candidates on the server.")
+            self._replica = None
         """
         ------------------ Exclusion-MS analysis_started End ------------------ 
         """
@@ -142,6 +160,7 @@ class DdaPasefPlugin:
         topic are send to shutdown the workflow. For that purpose 3 try-except blocks are used.
         """
         _log.info("stopping analysis")
+        stopped_replica = None
         with self._lock:
             # we might have the error case that acquisition was not dda-PASEF but a different
             # scan mode. In that case nothing was send and error message should be written
@@ -169,6 +188,18 @@ class DdaPasefPlugin:
             """
             ------------------  Exclusion-MS analysis_stopped Start ------------------ 
             """
+            try:
+                # only signal the replica thread under the lock, it is joined after the lock is released
+                if self._replica is not None:
+                    stopped_replica = self._replica
+                    self._replica = None
+                    stopped_replica.stop(wait=False)
+            except Exception as ex:
+                _log.error(f"Error stopping exclusion list replica: {ex}")
+
+            if self._exclusion_checker is not None:
+                _log.info(f"Exclusion check report: {self._exclusion_checker.report()}")
+
             try:
                 if self._exid is not None:
                     save_active_exclusion_list(self._config.exclusion_api.ip, self._exid)
@@ -189,6 +220,18 @@ class DdaPasefPlugin:
                 self._is_initialized = False
                 _log.info("analysis stopped")
 
+        """
+        ------------------  Exclusion-MS analysis_stopped (replica join) Start ------------------ 
+        """
+        if stopped_replica is not None:
+            try:
+                stopped_replica.join()
+            except Exception as ex:
+                _log.error(f"Error stopping exclusion list replica: {ex}")
+        """
+        ------------------  Exclusion-MS analysis_stopped (replica join) End ------------------ 
+        """
+
     def _get_analysis_time(self, monotonic_time):
         """Return current analysis time, or -1 if not acquiring data.
 
@@ -279,8 +322,11 @@ class DdaPasefPlugin:
                                                        intensity=candidate.precursor.intensity))
 
             try:
-                exclusion_flags = get_excluded_points(self._config.exclusion_api.ip,
-                                                      exclusion_points=exclusion_points)
+                if self._replica is not None and self._replica.ready:
+                    exclusion_flags = self._replica.get_excluded_points(exclusion_points)
+                else:
+                    fallback = self._replica.get_excluded_points if self._replica is not None else None
+                    exclusion_flags = self._exclusion_checker.get_excluded_points(exclusion_points, fallback=fallback)
 
                 for i in sorted([i for i, flag in enumerate(exclusion_flags) if flag], reverse=True):
                     candidates.pop(i)
@@ -378,6 +424,9 @@ class DdaPasefPlugin:
         exclusion_point = ExclusionPoint(charge=charge, mass=mass, rt=rt, ook0=ook0, intensity=intensity)
         exclusion_interval = self._dynamic_tolerance.construct_interval(interval_id=interval_id,
                                                                         exclusion_point=exclusion_point)
+        # exclude the precursor locally right away, the replica skips the server's echo of the add
+        if self._replica is not None:
+            self._replica.add_local(exclusion_interval)
         try:
             add_exclusion_interval_query(exclusion_api_ip=self._config.exclusion_api.ip,
                                          exclusion_interval=exclusion_interval)
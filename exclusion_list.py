@@ -0,0 +1,1634 @@
+"""
+This module contains the ExclusionList class, the active exclusion list used by the server.
+
+Intervals are stored in a compact, column oriented representation instead of as ExclusionInterval objects:
+
+- the bounds of each interval are stored in float arrays, with NaN for null (unbounded) bounds.
+- charges and exclusion flags are stored in int8 arrays.
+- interval ids are split into an interned prefix (the run uid) and an integer suffix (the ms2 spectrum id).
+- the uuid of each interval, generated when it is added as MassIntervalTree does, is split into two uint64 arrays.
+
+Each interval occupies a slot (its index in the arrays). Slots of removed intervals are reused. Intervals are indexed by
+mass with fixed width mass bins, and by id prefix, so that all intervals of a run can be removed in a single bulk
+operation. ExclusionInterval objects are only materialized when intervals are returned to the API.
+
+During a run, point queries arrive with an rt close to the current acquisition time. The intervals whose rt range
+overlaps a window of rt buckets around the current acquisition time are kept in a second, "hot" mass index. Point
+queries with an rt inside the window only search the hot index, queries outside it search the full index. Queries do
+not move the window: the acquisition time is given by advance_hot_window (the server calls it for real-time point
+queries), and the window only moves forward, in small steps (step_hot_window) which the server runs between requests.
+The hot index is updated from an index of slots by rt bucket.
+
+Before searching the indexes, point queries with a charge and a mass are checked against a counting Bloom filter of the
+(charge, mass bin) pairs, and optionally ook0 bins, covered by the intervals. Most points are not excluded, and for
+those the filter usually gives a definite negative answer without touching the indexes.
+"""
+
+import bisect
+import itertools
+import math
+import pickle
+import sys
+import time
+import uuid
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Callable, Any, Iterable, Iterator, Tuple, Hashable, Union
+
+from exclusionms.components import ExclusionInterval, ExclusionPoint, convert_min_bounds, convert_max_bounds
+from exclusionms.db import IntervalStatus
+from intervaltree import IntervalTree
+
+from constants import EXCLUSION_LIST_FORMAT_VERSION
+from prefilter import CountingBloomFilter
+from utils import ProgressReader
+
+DIMENSIONS = ['mass', 'rt', 'ook0', 'intensity']
+BOUND_COLUMNS = [f'{side}_{dimension}' for dimension in DIMENSIONS for side in ('min', 'max')]
+UUID_COLUMNS = ['uuid_high', 'uuid_low']
+
+MASS_BIN_WIDTH = 0.02
+MAX_MASS_BIN_SPAN = 64
+
+RT_BUCKET_WIDTH = 30.0
+MAX_RT_BUCKET_SPAN = 64
+HOT_RT_BUCKETS = 4
+HOT_WINDOW_REWIND_QUERIES = 64
+
+PREFILTER_HASHES = 3
+PREFILTER_COUNTERS_PER_KEY = 8
+MIN_PREFILTER_SIZE = 1 << 16
+MAX_PREFILTER_OOK0_BIN_SPAN = 4
+PREFILTER_SAMPLE_INTERVAL = 16
+
+NULL_CHARGE = -128
+FREE_SLOT = -1
+NO_SUFFIX = -1
+OVERFLOW_SUFFIX = -2
+UINT64_MASK = (1 << 64) - 1
+
+
+def get_interval_prefix(interval_id: str) -> str:
+    """
+    Get the prefix of an interval id. Dynamic exclusion intervals use ids of the form '<uid>_<ms2_spectrum_id>', so
+    the prefix is everything before the last underscore. Ids without an underscore are their own prefix.
+
+    Args:
+        interval_id (str): The interval id.
+
+    Returns:
+        str: The interval id prefix.
+    """
+    return interval_id.rsplit('_', 1)[0]
+
+
+def to_float(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def from_float(value: float) -> Optional[float]:
+    return None if value != value else value
+
+
+class SlotList:
+    """
+    A list of slots with O(1) removal. Removed slots are counted as tombstones and skipped when iterating, and the array
+    is compacted when more than half of it are tombstones. A slot which is removed and then reused may be in the array
+    twice; the tombstone skips its first occurrence.
+    """
+    __slots__ = ('slots', 'removed', 'tombstones')
+
+    def __init__(self, slots: Iterable[int] = ()):
+        self.slots = array('I', slots)
+        self.removed: Optional[Counter] = None
+        self.tombstones = 0
+
+    def __len__(self) -> int:
+        return len(self.slots) - self.tombstones
+
+    def __iter__(self) -> Iterator[int]:
+        if self.tombstones == 0:
+            return iter(self.slots)
+        return self._iter_live()
+
+    def _iter_live(self) -> Iterator[int]:
+        removed = Counter(self.removed)
+        for slot in self.slots:
+            if removed[slot] > 0:
+                removed[slot] -= 1
+                continue
+            yield slot
+
+    def append(self, slot: int) -> None:
+        self.slots.append(slot)
+
+    def remove(self, slot: int) -> None:
+        if self.removed is None:
+            self.removed = Counter()
+        self.removed[slot] += 1
+        self.tombstones += 1
+        if 2 * self.tombstones > len(self.slots):
+            self.slots = array('I', self._iter_live())
+            self.removed = None
+            self.tombstones = 0
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.slots) + (sys.getsizeof(self.removed) if self.removed is not None else 0)
+
+
+def _stage(name: str, slots_in: int, slots_out: int, start_time: float, null_bounds: int = 0,
+           skipped: bool = False) -> Dict[str, Any]:
+    return {'stage': name, 'in': slots_in, 'out': slots_out, 'null_bounds': null_bounds, 'skipped': skipped,
+            'ms': (time.perf_counter() - start_time) * 1000}
+
+
+class ExclusionList:
+    """
+    A compact data structure for managing ExclusionIntervals.
+
+    Attributes:
+        min_mass, max_mass, ..., min_intensity, max_intensity (array): Interval bounds by slot, NaN if null.
+        charge (array): Interval charges by slot, NULL_CHARGE if null.
+        exclusion (array): 1 for exclusion intervals, 0 for inclusion intervals and FREE_SLOT for free slots.
+        prefix (array): Index of the interval id prefix in prefixes by slot.
+        suffix (array): Integer interval id suffix by slot, NO_SUFFIX if the id is its own prefix or OVERFLOW_SUFFIX
+            if the id is stored in overflow_ids.
+        prefixes (List[str]): Interned interval id prefixes.
+        overflow_ids (Dict[int, str]): Interval ids which cannot be split into a prefix and an integer suffix.
+        data (Dict[int, Any]): The data of intervals with data.
+        mass_bins (Dict[int, array]): Slots by mass bin, for intervals spanning at most max_mass_bin_span bins.
+        wide_slots (SlotList): Slots of intervals with null mass bounds or spanning more than max_mass_bin_span bins.
+        prefix_slots (Dict[int, SlotList]): Slots by prefix index.
+        id_slots (Dict[Hashable, Union[int, List[int]]]): Slot (or slots, for duplicate ids) by interval id key, see
+            _get_id_key. Ids stored in overflow_ids are their own key.
+        rt_buckets (Dict[int, SlotList]): Slots by rt bucket, for intervals spanning at most max_rt_bucket_span buckets.
+        rt_wide_slots (SlotList): Slots of intervals with null rt bounds or spanning more than max_rt_bucket_span
+            buckets. They are always hot.
+        hot_first_bucket, hot_last_bucket (Optional[int]): The rt buckets of the hot window, None before the first
+            step towards a target. Every interval overlapping these buckets is in the hot index.
+        hot_target (Optional[Tuple[int, int]]): The rt buckets the hot window is moving to.
+        hot_behind (int): Number of consecutive advance_hot_window calls with an rt behind the target.
+        hot_step_bucket (Optional[int]): The rt bucket entering (hot_step_entering) or leaving the hot index in the
+            current step, with the slots still to move in hot_pending[hot_pending_pos:]. Slots removed from the list
+            during the step are in hot_cancelled.
+        hot_refs (Dict[int, int]): Number of hot window buckets overlapped by each hot slot (excluding rt_wide_slots).
+        hot_mass_bins, hot_wide_slots: The mass index of the hot slots.
+        prefilter (CountingBloomFilter): (charge, mass bin, ook0 bin) keys of the intervals in mass_bins. The ook0
+            bin is None when prefilter_ook0_bin_width is None or the interval has null or wide ook0 bounds.
+        wide_charge_counts (Counter): Charges of the intervals in wide_slots, which are not in the prefilter.
+        prefilter_charge_counts (Counter): Charges of the intervals in the prefilter.
+    """
+
+    def __init__(self, mass_bin_width: float = MASS_BIN_WIDTH, max_mass_bin_span: int = MAX_MASS_BIN_SPAN,
+                 rt_bucket_width: float = RT_BUCKET_WIDTH, max_rt_bucket_span: int = MAX_RT_BUCKET_SPAN,
+                 hot_rt_buckets: int = HOT_RT_BUCKETS, prefilter_ook0_bin_width: Optional[float] = None):
+        self.mass_bin_width = mass_bin_width
+        self.max_mass_bin_span = max_mass_bin_span
+        self.rt_bucket_width = rt_bucket_width
+        self.max_rt_bucket_span = max_rt_bucket_span
+        self.hot_rt_buckets = hot_rt_buckets
+        self.prefilter_ook0_bin_width = prefilter_ook0_bin_width
+        self.prefilter_checks = 0
+        self.prefilter_negatives = 0
+        self.prefilter_empty_passes = 0
+        self.prefilter_sampled_passes = 0
+        self.prefilter_false_positives = 0
+        self.format_version = EXCLUSION_LIST_FORMAT_VERSION
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Clear the ExclusionList.
+        """
+        for column in BOUND_COLUMNS:
+            setattr(self, column, array('d'))
+        self.charge = array('b')
+        self.exclusion = array('b')
+        self.prefix = array('i')
+        self.suffix = array('q')
+        self.uuid_high = array('Q')
+        self.uuid_low = array('Q')
+        self.prefixes: List[str] = []
+        self.prefix_ids: Dict[str, int] = {}
+        self.overflow_ids: Dict[int, str] = {}
+        self.data: Dict[int, Any] = {}
+        self.free_slots: List[int] = []
+        self.mass_bins: Dict[int, array] = {}
+        self.wide_slots = SlotList()
+        self.prefix_slots: Dict[int, SlotList] = {}
+        self.id_slots: Dict[Hashable, Union[int, List[int]]] = {}
+        self.prefilter = CountingBloomFilter(MIN_PREFILTER_SIZE, PREFILTER_HASHES)
+        self.wide_charge_counts = Counter()
+        self.prefilter_charge_counts = Counter()
+        self._clear_rt_index()
+        self._len = 0
+
+    def _clear_rt_index(self) -> None:
+        self.rt_buckets: Dict[int, SlotList] = {}
+        self.rt_wide_slots = SlotList()
+        self.hot_first_bucket: Optional[int] = None
+        self.hot_last_bucket: Optional[int] = None
+        self.hot_refs: Dict[int, int] = {}
+        self.hot_mass_bins: Dict[int, array] = {}
+        self.hot_wide_slots = SlotList()
+        self.hot_hits = 0
+        self.hot_misses = 0
+        self.hot_target: Optional[Tuple[int, int]] = None
+        self.hot_behind = 0
+        self._clear_hot_step()
+
+    def _clear_hot_step(self) -> None:
+        self.hot_step_bucket: Optional[int] = None
+        self.hot_step_entering = False
+        self.hot_pending = array('I')
+        self.hot_pending_pos = 0
+        self.hot_cancelled = set()
+
+    def add(self, ex_interval: ExclusionInterval) -> int:
+        """
+        Add an ExclusionInterval to the list. A new uuid is generated for the interval and assigned to its
+        interval_uuid, as in MassIntervalTree.add.
+
+        Args:
+            ex_interval (ExclusionInterval): The exclusion interval to be added.
+
+        Returns:
+            int: The slot of the added interval.
+
+        Raises:
+            ValueError: If the interval_id is None or the charge does not fit in an int8.
+        """
+        if ex_interval.interval_id is None:
+            raise ValueError('Cannot add an interval with id = None')
+
+        charge = NULL_CHARGE if ex_interval.charge is None else int(ex_interval.charge)
+        if ex_interval.charge is not None and not NULL_CHARGE < charge <= 127:
+            raise ValueError(f'Cannot add an interval with charge = {ex_interval.charge}')
+
+        prefix, suffix = self._encode_id(ex_interval.interval_id)
+        values = [to_float(getattr(ex_interval, column)) for column in BOUND_COLUMNS]
+        exclusion = 1 if ex_interval.exclusion else 0
+        interval_uuid = uuid.uuid4()
+        ex_interval.interval_uuid = str(interval_uuid)
+        uuid_high, uuid_low = interval_uuid.int >> 64, interval_uuid.int & UINT64_MASK
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            for column, value in zip(BOUND_COLUMNS, values):
+                getattr(self, column)[slot] = value
+            self.charge[slot] = charge
+            self.exclusion[slot] = exclusion
+            self.prefix[slot] = prefix
+            self.suffix[slot] = suffix
+            self.uuid_high[slot] = uuid_high
+            self.uuid_low[slot] = uuid_low
+        else:
+            slot = len(self.exclusion)
+            for column, value in zip(BOUND_COLUMNS, values):
+                getattr(self, column).append(value)
+            self.charge.append(charge)
+            self.exclusion.append(exclusion)
+            self.prefix.append(prefix)
+            self.suffix.append(suffix)
+            self.uuid_high.append(uuid_high)
+            self.uuid_low.append(uuid_low)
+
+        if suffix == OVERFLOW_SUFFIX:
+            self.overflow_ids[slot] = ex_interval.interval_id
+        if ex_interval.data is not None:
+            self.data[slot] = ex_interval.data
+
+        self._len += 1
+        self._index_slot(slot)
+        return slot
+
+    def remove(self, ex_interval: ExclusionInterval) -> List[ExclusionInterval]:
+        """
+        Remove the intervals matching an ExclusionInterval: the intervals with the same interval_id enveloped by it,
+        or all intervals enveloped by it if its interval_id is None.
+
+        Args:
+            ex_interval (ExclusionInterval): The exclusion interval to be removed.
+
+        Returns:
+            List[ExclusionInterval]: A list of removed exclusion intervals.
+        """
+        slots = self._get_slots(ex_interval)
+        intervals = [self._to_interval(slot) for slot in slots]
+        for slot in slots:
+            self._unindex_slot(slot)
+            self._free_slot(slot)
+        return intervals
+
+    def remove_by_uuid(self, interval_uuid: str) -> ExclusionInterval:
+        """
+        Remove an interval by its uuid. Uuids are not indexed, the uuid columns are scanned.
+
+        Args:
+            interval_uuid (str): The uuid of the interval to be removed.
+
+        Returns:
+            ExclusionInterval: The removed exclusion interval.
+
+        Raises:
+            ValueError: If no interval has this uuid.
+        """
+        slot = self._find_uuid(interval_uuid)
+        if slot is None:
+            raise ValueError(f'No interval with UUID: {interval_uuid}')
+
+        interval = self._to_interval(slot)
+        self._unindex_slot(slot)
+        self._free_slot(slot)
+        return interval
+
+    def remove_by_prefix(self, prefix: str) -> int:
+        """
+        Remove all intervals whose id starts with the given prefix (e.g. all intervals of a run uid).
+
+        The mass and rt indexes are rebuilt from the remaining intervals when more than half of the list is removed,
+        which is much faster than removing intervals one at a time.
+
+        Args:
+            prefix (str): The interval id prefix.
+
+        Returns:
+            int: The number of removed intervals.
+        """
+        prefix_id = self.prefix_ids.get(prefix)
+        if prefix_id is None or prefix_id not in self.prefix_slots:
+            return 0
+
+        slots = list(self.prefix_slots.pop(prefix_id))
+        rebuild = len(slots) > self._len // 2
+        for slot in slots:
+            self._unindex_id(slot)
+            if not rebuild:
+                self._unindex_bounds(slot)
+            self._free_slot(slot)
+
+        if rebuild:
+            self._rebuild_bounds_indexes()
+
+        return len(slots)
+
+    def query_by_interval(self, ex_interval: ExclusionInterval) -> List[ExclusionInterval]:
+        """
+        Get the intervals matching an ExclusionInterval: the intervals with the same interval_id enveloped by it,
+        or all intervals enveloped by it if its interval_id is None.
+
+        Args:
+            ex_interval (ExclusionInterval): The exclusion interval to be used as the search criteria.
+
+        Returns:
+            List[ExclusionInterval]: A list of matching exclusion intervals.
+        """
+        return [self._to_interval(slot) for slot in self._get_slots(ex_interval)]
+
+    def query_by_point(self, point: ExclusionPoint) -> Iterator[ExclusionInterval]:
+        """
+        Get the exclusion intervals that contain the given point.
+
+        Args:
+            point (ExclusionPoint): The point to be used as the search criteria.
+
+        Returns:
+            Iterator[ExclusionInterval]: The exclusion intervals that contain the point.
+        """
+        return (self._to_interval(slot) for slot in self._iter_slots_by_point(point))
+
+    def query_by_id(self, interval_id: str) -> List[ExclusionInterval]:
+        """
+        Get the exclusion intervals with the given ID.
+
+        Args:
+            interval_id (str): The ID of the intervals to be retrieved.
+
+        Returns:
+            List[ExclusionInterval]: A list of exclusion intervals with the given ID.
+        """
+        return [self._to_interval(slot) for slot in self._get_slots_by_id(interval_id)]
+
+    def is_excluded(self, point: ExclusionPoint) -> bool:
+        """
+        Check if a point is excluded by any of the exclusion intervals.
+
+        Args:
+            point (ExclusionPoint): The point to be checked.
+
+        Returns:
+            bool: True if the point is contained by an exclusion interval, False otherwise.
+        """
+        exclusion = self.exclusion
+        return any(exclusion[slot] == 1 for slot in self._iter_slots_by_point(point))
+
+    def is_included(self, point: ExclusionPoint) -> bool:
+        """
+        Check if a point is included by any of the inclusion intervals.
+
+        Args:
+            point (ExclusionPoint): The point to be checked.
+
+        Returns:
+            bool: True if the point is contained by an inclusion interval, False otherwise.
+        """
+        exclusion = self.exclusion
+        return any(exclusion[slot] == 0 for slot in self._iter_slots_by_point(point))
+
+    def point_status(self, point: ExclusionPoint) -> int:
+        """
+        Check the status of an exclusion point.
+
+        Args:
+            point (ExclusionPoint): The point to be checked.
+
+        Returns:
+            IntervalStatus: The status of the exclusion point.
+        """
+        flags = {self.exclusion[slot] for slot in self._iter_slots_by_point(point)}
+
+        if len(flags) == 0:
+            return IntervalStatus.NO_INTERVALS_FOUND
+        if flags == {1}:
+            return IntervalStatus.EXCLUDED
+        if flags == {0}:
+            return IntervalStatus.INCLUDED
+        return IntervalStatus.EXCLUDED_INCLUDED
+
+    def explain_point(self, point: ExclusionPoint) -> Dict[str, Any]:
+        """
+        Trace the search of a point: how the candidate intervals were selected and how many of them survived each
+        dimension filter. The list is not changed: the hot window is not moved and no query statistics are updated, so
+        a point outside the hot window is traced on the full index.
+
+        Args:
+            point (ExclusionPoint): The point to be traced.
+
+        Returns:
+            Dict[str, Any]: The trace of the search, containing:
+                - 'prefilter': 'rejected', 'passed' or 'skipped' (the point cannot be checked against the prefilter).
+                - 'index': 'hot' or 'full', None if the prefilter rejected the point.
+                - 'candidates_from': 'mass_bin' (a mass bin and the wide intervals), 'wide' (only the wide intervals)
+                  or 'scan' (all intervals of the index, for a point without a mass).
+                - 'stages': for each stage ('prefilter', 'candidates', then the charge and dimension filters), the
+                  number of intervals before ('in') and after ('out') it, how many of the survivors passed it only
+                  because of a null bound or charge ('null_bounds'), whether it was skipped because the point's value
+                  is null ('skipped') and the time spent in milliseconds ('ms').
+                - 'matched': the number of intervals containing the point, and 'status' its IntervalStatus.
+        """
+        start_time = time.perf_counter()
+        trace = {'kind': 'point',
+                 'point': {'charge': point.charge, 'mass': point.mass, 'rt': point.rt, 'ook0': point.ook0,
+                           'intensity': point.intensity},
+                 'interval_count': len(self),
+                 'prefilter': 'skipped',
+                 'index': None,
+                 'candidates_from': None,
+                 'stages': []}
+
+        stage_time = time.perf_counter()
+        if self._can_prefilter(point.charge, point.mass, point.ook0):
+            rejected = not self._prefilter_may_contain(point.charge, point.mass, point.ook0)
+            trace['prefilter'] = 'rejected' if rejected else 'passed'
+            trace['stages'].append(_stage('prefilter', len(self), 0 if rejected else len(self), stage_time))
+            if rejected:
+                return self._finish_trace(trace, [], start_time)
+
+        stage_time = time.perf_counter()
+        hot = point.rt is not None and math.isfinite(point.rt) and self._in_hot_window(point.rt)
+        trace['index'] = 'hot' if hot else 'full'
+        if point.mass is None:
+            trace['candidates_from'] = 'scan'
+            slots = list(itertools.chain(self.hot_refs, self.rt_wide_slots)) if hot else self._live_slots()
+        else:
+            mass_bins, wide_slots = (self.hot_mass_bins, self.hot_wide_slots) if hot else \
+                (self.mass_bins, self.wide_slots)
+            in_bin = math.isfinite(point.mass) and math.floor(point.mass / self.mass_bin_width) in mass_bins
+            trace['candidates_from'] = 'mass_bin' if in_bin else 'wide'
+            slots = list(self._get_mass_candidates(point.mass, mass_bins, wide_slots))
+        trace['stages'].append(_stage('candidates', len(self), len(slots), stage_time))
+
+        stage_time = time.perf_counter()
+        slots_in = len(slots)
+        charges = self.charge
+        if point.charge is not None:
+            slots = [slot for slot in slots if charges[slot] == point.charge or charges[slot] == NULL_CHARGE]
+        null_bounds = sum(1 for slot in slots if charges[slot] == NULL_CHARGE)
+        trace['stages'].append(_stage('charge', slots_in, len(slots), stage_time, null_bounds,
+                                      point.charge is None))
+
+        for dimension in DIMENSIONS:
+            stage_time = time.perf_counter()
+            slots_in = len(slots)
+            value = getattr(point, dimension)
+            min_bounds, max_bounds = getattr(self, 'min_' + dimension), getattr(self, 'max_' + dimension)
+            if value is not None:
+                slots = [slot for slot in slots if not (value < min_bounds[slot] or value >= max_bounds[slot])]
+            null_bounds = sum(1 for slot in slots if min_bounds[slot] != min_bounds[slot] or
+                              max_bounds[slot] != max_bounds[slot])
+            trace['stages'].append(_stage(dimension, slots_in, len(slots), stage_time, null_bounds, value is None))
+
+        return self._finish_trace(trace, slots, start_time)
+
+    def explain_interval(self, ex_interval: ExclusionInterval) -> Dict[str, Any]:
+        """
+        Trace the search of an ExclusionInterval (see query_by_interval): how the candidate intervals were selected and
+        how many of them survived the charge and each dimension envelop filter.
+
+        Args:
+            ex_interval (ExclusionInterval): The exclusion interval to be traced.
+
+        Returns:
+            Dict[str, Any]: The trace of the search, see explain_point. 'candidates_from' is 'id' (the intervals with
+            the same interval_id), 'mass_bin' (the mass bins overlapping the mass bounds and the wide intervals) or
+            'scan' (all intervals, for null or infinite mass bounds). 'null_bounds' counts the survivors with a null
+            bound or charge, which only a null bound of the searched interval envelops.
+        """
+        start_time = time.perf_counter()
+        trace = {'kind': 'interval',
+                 'interval_count': len(self),
+                 'index': 'full',
+                 'candidates_from': None,
+                 'stages': []}
+
+        stage_time = time.perf_counter()
+        if ex_interval.interval_id is not None:
+            trace['candidates_from'] = 'id'
+            slots = self._get_slots_by_id(ex_interval.interval_id)
+        else:
+            has_mass_bounds = ex_interval.min_mass is not None and ex_interval.max_mass is not None and \
+                math.isfinite(ex_interval.min_mass) and math.isfinite(ex_interval.max_mass)
+            trace['candidates_from'] = 'mass_bin' if has_mass_bounds else 'scan'
+            slots = list(self._get_mass_envelop_candidates(ex_interval))
+        trace['stages'].append(_stage('candidates', len(self), len(slots), stage_time))
+
+        stage_time = time.perf_counter()
+        slots_in = len(slots)
+        charges = self.charge
+        if ex_interval.charge is not None:
+            slots = [slot for slot in slots if charges[slot] == ex_interval.charge or charges[slot] == NULL_CHARGE]
+        null_bounds = sum(1 for slot in slots if charges[slot] == NULL_CHARGE)
+        trace['stages'].append(_stage('charge', slots_in, len(slots), stage_time, null_bounds,
+                                      ex_interval.charge is None))
+
+        for dimension in DIMENSIONS:
+            stage_time = time.perf_counter()
+            slots_in = len(slots)
+            min_bound = convert_min_bounds(getattr(ex_interval, 'min_' + dimension))
+            max_bound = convert_max_bounds(getattr(ex_interval, 'max_' + dimension))
+            min_bounds, max_bounds = getattr(self, 'min_' + dimension), getattr(self, 'max_' + dimension)
+            # null (NaN) bounds of the intervals are unbounded
+            slots = [slot for slot in slots if not (min_bounds[slot] < min_bound or max_bounds[slot] > max_bound or
+                                                    (min_bounds[slot] != min_bounds[slot] and min_bound > -math.inf) or
+                                                    (max_bounds[slot] != max_bounds[slot] and max_bound < math.inf))]
+            null_bounds = sum(1 for slot in slots if min_bounds[slot] != min_bounds[slot] or
+                              max_bounds[slot] != max_bounds[slot])
+            trace['stages'].append(_stage(dimension, slots_in, len(slots), stage_time, null_bounds,
+                                          min_bound == -math.inf and max_bound == math.inf))
+
+        return self._finish_trace(trace, slots, start_time)
+
+    def _finish_trace(self, trace: Dict[str, Any], slots: List[int], start_time: float) -> Dict[str, Any]:
+        flags = {self.exclusion[slot] for slot in slots}
+        if len(flags) == 0:
+            status = IntervalStatus.NO_INTERVALS_FOUND
+        elif flags == {1}:
+            status = IntervalStatus.EXCLUDED
+        elif flags == {0}:
+            status = IntervalStatus.INCLUDED
+        else:
+            status = IntervalStatus.EXCLUDED_INCLUDED
+        trace['matched'] = len(slots)
+        trace['status'] = int(status)
+        trace['total_ms'] = (time.perf_counter() - start_time) * 1000
+        return trace
+
+    def _iter_slots_by_point(self, point: ExclusionPoint) -> Iterator[int]:
+        """
+        Iterate over the slots of the intervals containing the point. Null point values match every interval, and null
+        interval bounds (NaN) never fail the comparisons.
+        """
+        charge, mass, rt, ook0, intensity = point.charge, point.mass, point.rt, point.ook0, point.intensity
+        prefiltered = self._can_prefilter(charge, mass, ook0)
+        if prefiltered and self._prefilter_rejects(charge, mass, ook0):
+            return
+
+        found = False
+        charges = self.charge
+        min_mass, max_mass = self.min_mass, self.max_mass
+        min_rt, max_rt = self.min_rt, self.max_rt
+        min_ook0, max_ook0 = self.min_ook0, self.max_ook0
+        min_intensity, max_intensity = self.min_intensity, self.max_intensity
+
+        for slot in self._get_candidates(mass, rt):
+            if charge is not None and charges[slot] != charge and charges[slot] != NULL_CHARGE:
+                continue
+            if mass is not None and (mass < min_mass[slot] or mass >= max_mass[slot]):
+                continue
+            if rt is not None and (rt < min_rt[slot] or rt >= max_rt[slot]):
+                continue
+            if ook0 is not None and (ook0 < min_ook0[slot] or ook0 >= max_ook0[slot]):
+                continue
+            if intensity is not None and (intensity < min_intensity[slot] or intensity >= max_intensity[slot]):
+                continue
+            found = True
+            yield slot
+
+        if prefiltered and not found:
+            # passing the prefilter is checked for a false positive on a sample of the queries
+            self.prefilter_empty_passes += 1
+            if self.prefilter_empty_passes % PREFILTER_SAMPLE_INTERVAL == 0:
+                self.prefilter_sampled_passes += 1
+                if not self._has_prefilter_key(charge, mass, ook0):
+                    self.prefilter_false_positives += 1
+
+    def _has_prefilter_key(self, charge: int, mass: float, ook0: Optional[float]) -> bool:
+        """
+        Check if an interval has one of the prefilter keys of a point, i.e. if passing the prefilter was not a false
+        positive.
+        """
+        ook0_bin = None
+        if self.prefilter_ook0_bin_width is not None:
+            ook0_bin = math.floor(ook0 / self.prefilter_ook0_bin_width)
+
+        for slot in self.mass_bins.get(math.floor(mass / self.mass_bin_width), ()):
+            if self.charge[slot] == charge or self.charge[slot] == NULL_CHARGE:
+                if ook0_bin is None or any(key[2] is None or key[2] == ook0_bin
+                                           for key in self._get_prefilter_keys(slot)):
+                    return True
+        return False
+
+    def _can_prefilter(self, charge: Optional[int], mass: Optional[float], ook0: Optional[float]) -> bool:
+        """
+        Check if a point can be checked against the prefilter: it needs a charge and a mass (and an ook0 if the
+        prefilter has ook0 bins), and no interval in wide_slots (which are not in the prefilter) may match its charge.
+        """
+        if charge is None or mass is None or not math.isfinite(mass):
+            return False
+        if self.prefilter_ook0_bin_width is not None and (ook0 is None or not math.isfinite(ook0)):
+            return False
+        return not self.wide_charge_counts or \
+            (self.wide_charge_counts[charge] == 0 and self.wide_charge_counts[NULL_CHARGE] == 0)
+
+    def _prefilter_rejects(self, charge: int, mass: float, ook0: Optional[float]) -> bool:
+        """
+        Check if the prefilter proves that no interval contains a point with the charge, mass and ook0.
+        """
+        self.prefilter_checks += 1
+        if self._prefilter_may_contain(charge, mass, ook0):
+            return False
+
+        self.prefilter_negatives += 1
+        return True
+
+    def _prefilter_may_contain(self, charge: int, mass: float, ook0: Optional[float]) -> bool:
+        """
+        Check if the prefilter has a key of a point with the charge, mass and ook0.
+        """
+        mass_bin = math.floor(mass / self.mass_bin_width)
+        ook0_bins = (None,)
+        if self.prefilter_ook0_bin_width is not None:
+            ook0_bins = (None, math.floor(ook0 / self.prefilter_ook0_bin_width))
+
+        may_contain = self.prefilter.may_contain
+        for key_charge in (charge, NULL_CHARGE):
+            if self.prefilter_charge_counts[key_charge] == 0:
+                continue
+            for ook0_bin in ook0_bins:
+                if may_contain((key_charge, mass_bin, ook0_bin)):
+                    return True
+        return False
+
+    def _get_candidates(self, mass: Optional[float], rt: Optional[float]) -> Iterable[int]:
+        """
+        Get the slots of the intervals which may contain the mass and rt, from the hot index if the rt is inside the
+        hot window, else from the full index.
+        """
+        if self._use_hot_window(rt):
+            if mass is None:
+                return itertools.chain(self.hot_refs, self.rt_wide_slots)
+            return self._get_mass_candidates(mass, self.hot_mass_bins, self.hot_wide_slots)
+
+        if mass is None:
+            return self._live_slots()
+        return self._get_mass_candidates(mass, self.mass_bins, self.wide_slots)
+
+    def _get_mass_candidates(self, mass: float, mass_bins: Dict[int, array], wide_slots: SlotList) -> Iterable[int]:
+        """
+        Get the slots of the intervals of a mass index which may contain the mass.
+        """
+        if not math.isfinite(mass):
+            return wide_slots
+
+        bin_slots = mass_bins.get(math.floor(mass / self.mass_bin_width))
+        if bin_slots is None:
+            return wide_slots
+        if len(wide_slots) == 0:
+            return bin_slots
+        return itertools.chain(bin_slots, wide_slots)
+
+    def _use_hot_window(self, rt: Optional[float]) -> bool:
+        """
+        Check if the rt is inside the hot window, counting hot hits and misses.
+        """
+        if rt is None or not math.isfinite(rt):
+            return False
+
+        if self._in_hot_window(rt):
+            self.hot_hits += 1
+            return True
+        self.hot_misses += 1
+        return False
+
+    def _in_hot_window(self, rt: float) -> bool:
+        rt_bucket = math.floor(rt / self.rt_bucket_width)
+        return self.hot_first_bucket is not None and self.hot_first_bucket <= rt_bucket <= self.hot_last_bucket
+
+    def advance_hot_window(self, rt: Optional[float]) -> bool:
+        """
+        Set the target of the hot window from the rt of a real-time point query (the current acquisition time): one
+        rt bucket behind it and the remaining buckets ahead of it. The target only moves forward; an rt behind it is
+        ignored, unless HOT_WINDOW_REWIND_QUERIES consecutive ones are (a new acquisition started). The window is moved
+        to the target by step_hot_window.
+
+        Args:
+            rt (Optional[float]): The rt of the query.
+
+        Returns:
+            bool: Whether the window has not reached its target yet.
+        """
+        if rt is not None and math.isfinite(rt):
+            self._set_hot_target(math.floor(rt / self.rt_bucket_width))
+        return self.hot_step_bucket is not None or self._next_hot_step() is not None
+
+    def _set_hot_target(self, rt_bucket: int) -> None:
+        if self.hot_target is not None:
+            if self.hot_target[0] <= rt_bucket <= self.hot_target[1]:
+                self.hot_behind = 0
+                return
+            if rt_bucket < self.hot_target[0]:
+                self.hot_behind += 1
+                if self.hot_behind < HOT_WINDOW_REWIND_QUERIES:
+                    return
+
+        self.hot_behind = 0
+        self.hot_target = (rt_bucket - 1, rt_bucket - 2 + self.hot_rt_buckets)
+
+    def step_hot_window(self, max_slots: Optional[int] = None) -> bool:
+        """
+        Move the hot window towards its target, one rt bucket at a time, entering or leaving at most max_slots slots
+        in the hot index. Between steps the hot index contains at least the intervals overlapping the hot window, so
+        queries can be answered at any point of the move.
+
+        Args:
+            max_slots (Optional[int]): The maximum number of slots to move, None to finish the move.
+
+        Returns:
+            bool: Whether the window has not reached its target yet.
+        """
+        remaining = math.inf if max_slots is None else max_slots
+        while remaining > 0:
+            if self.hot_step_bucket is None and not self._start_hot_step():
+                return False
+            remaining -= self._run_hot_step(remaining)
+        return self.advance_hot_window(None)
+
+    def _next_hot_step(self) -> Optional[Tuple[int, bool]]:
+        """
+        Get the next rt bucket to enter or leave the hot index, keeping the hot window contiguous: buckets are entered
+        at the ends of the window, and buckets outside the target leave from the ends of the window.
+        """
+        if self.hot_target is None:
+            return None
+        target_first, target_last = self.hot_target
+        if self.hot_first_bucket is None:
+            return target_first, True
+
+        first, last = self.hot_first_bucket, self.hot_last_bucket
+        if target_first <= last + 1 <= target_last:
+            return last + 1, True
+        if target_first <= first - 1 <= target_last:
+            return first - 1, True
+        if not target_first <= first <= target_last:
+            return first, False
+        if not target_first <= last <= target_last:
+            return last, False
+        return None
+
+    def _start_hot_step(self) -> bool:
+        step = self._next_hot_step()
+        if step is None:
+            return False
+
+        rt_bucket, entering = step
+        if not entering:
+            # a leaving bucket is out of the window at once, its slots stay in the hot index until they are moved
+            if rt_bucket == self.hot_first_bucket:
+                self.hot_first_bucket += 1
+            else:
+                self.hot_last_bucket -= 1
+            if self.hot_first_bucket > self.hot_last_bucket:
+                self.hot_first_bucket = self.hot_last_bucket = None
+
+        self.hot_step_bucket = rt_bucket
+        self.hot_step_entering = entering
+        self.hot_pending = array('I', self.rt_buckets.get(rt_bucket, ()))
+        self.hot_pending_pos = 0
+        self.hot_cancelled = set()
+        return True
+
+    def _run_hot_step(self, max_slots: float) -> int:
+        """
+        Move at most max_slots slots of the current step, and finish the step when all slots were moved.
+
+        Returns:
+            int: The number of slots moved.
+        """
+        start = self.hot_pending_pos
+        end = len(self.hot_pending) if max_slots >= len(self.hot_pending) - start else start + int(max_slots)
+        move = self._enter_hot_bucket if self.hot_step_entering else self._leave_hot_bucket
+        cancelled = self.hot_cancelled
+        for slot in self.hot_pending[start:end]:
+            if slot not in cancelled:
+                move(slot)
+        self.hot_pending_pos = end
+
+        if end == len(self.hot_pending):
+            if self.hot_step_entering:
+                rt_bucket = self.hot_step_bucket
+                if self.hot_first_bucket is None:
+                    self.hot_first_bucket = self.hot_last_bucket = rt_bucket
+                elif rt_bucket > self.hot_last_bucket:
+                    self.hot_last_bucket = rt_bucket
+                else:
+                    self.hot_first_bucket = rt_bucket
+            self._clear_hot_step()
+        return end - start
+
+    def _enter_hot_bucket(self, slot: int, count: int = 1) -> None:
+        refs = self.hot_refs.get(slot, 0)
+        self.hot_refs[slot] = refs + count
+        if refs == 0:
+            self._add_to_mass_index(slot, self.hot_mass_bins, self.hot_wide_slots)
+
+    def _leave_hot_bucket(self, slot: int) -> None:
+        refs = self.hot_refs.pop(slot)
+        if refs > 1:
+            self.hot_refs[slot] = refs - 1
+        else:
+            self._remove_from_mass_index(slot, self.hot_mass_bins, self.hot_wide_slots)
+
+    def _get_slots(self, ex_interval: ExclusionInterval) -> List[int]:
+        """
+        Get the slots matching an ExclusionInterval, by id if it has an interval_id, else by bounds.
+        """
+        if ex_interval.interval_id is None:
+            slots = self._get_mass_envelop_candidates(ex_interval)
+        else:
+            slots = self._get_slots_by_id(ex_interval.interval_id)
+        return [slot for slot in slots if self._is_enveloped_by(slot, ex_interval)]
+
+    def _get_mass_envelop_candidates(self, ex_interval: ExclusionInterval) -> Iterable[int]:
+        """
+        Get the slots of the intervals which may be enveloped by the mass bounds of an ExclusionInterval.
+        """
+        if ex_interval.min_mass is None or ex_interval.max_mass is None or \
+                not (math.isfinite(ex_interval.min_mass) and math.isfinite(ex_interval.max_mass)):
+            return self._live_slots()
+
+        first_bin = math.floor(ex_interval.min_mass / self.mass_bin_width)
+        last_bin = math.floor(ex_interval.max_mass / self.mass_bin_width)
+        if last_bin - first_bin + 1 <= len(self.mass_bins):
+            bins = (mass_bin for mass_bin in range(first_bin, last_bin + 1) if mass_bin in self.mass_bins)
+        else:
+            bins = (mass_bin for mass_bin in self.mass_bins if first_bin <= mass_bin <= last_bin)
+
+        slots = {slot for mass_bin in bins for slot in self.mass_bins[mass_bin]}
+        slots.update(self.wide_slots)
+        return sorted(slots)
+
+    def _get_slots_by_id(self, interval_id: str) -> List[int]:
+        prefix, suffix = self._split_id(interval_id)
+        if suffix == OVERFLOW_SUFFIX:
+            key = interval_id
+        else:
+            prefix_id = self.prefix_ids.get(prefix)
+            if prefix_id is None:
+                return []
+            key = self._get_id_key(prefix_id, suffix)
+
+        slots = self.id_slots.get(key)
+        if slots is None:
+            return []
+        return [slots] if isinstance(slots, int) else list(slots)
+
+    @staticmethod
+    def _get_id_key(prefix_id: int, suffix: int) -> int:
+        # suffixes are below 10 ** 18 (and NO_SUFFIX is -1), so suffix + 1 fits in the low 64 bits
+        return (prefix_id << 64) | (suffix + 1)
+
+    def _get_slot_id_key(self, slot: int) -> Hashable:
+        suffix = self.suffix[slot]
+        if suffix == OVERFLOW_SUFFIX:
+            return self.overflow_ids[slot]
+        return self._get_id_key(self.prefix[slot], suffix)
+
+    def _index_id(self, slot: int) -> None:
+        key = self._get_slot_id_key(slot)
+        slots = self.id_slots.get(key)
+        if slots is None:
+            self.id_slots[key] = slot
+        elif isinstance(slots, int):
+            self.id_slots[key] = [slots, slot]
+        else:
+            slots.append(slot)
+
+    def _unindex_id(self, slot: int) -> None:
+        key = self._get_slot_id_key(slot)
+        slots = self.id_slots[key]
+        if isinstance(slots, int):
+            del self.id_slots[key]
+            return
+        slots.remove(slot)
+        if len(slots) == 1:
+            self.id_slots[key] = slots[0]
+
+    def _is_enveloped_by(self, slot: int, other: ExclusionInterval) -> bool:
+        """
+        Check if the interval in the slot is enveloped by another ExclusionInterval.
+        """
+        charge = self.charge[slot]
+        if other.charge is not None and charge != NULL_CHARGE and charge != other.charge:
+            return False
+
+        for dimension in DIMENSIONS:
+            min_bound = getattr(self, 'min_' + dimension)[slot]
+            max_bound = getattr(self, 'max_' + dimension)[slot]
+            if min_bound != min_bound:
+                min_bound = -math.inf
+            if max_bound != max_bound:
+                max_bound = math.inf
+            if min_bound < convert_min_bounds(getattr(other, 'min_' + dimension)) or \
+                    max_bound > convert_max_bounds(getattr(other, 'max_' + dimension)):
+                return False
+
+        return True
+
+    def _live_slots(self) -> List[int]:
+        return [slot for slot, exclusion in enumerate(self.exclusion) if exclusion != FREE_SLOT]
+
+    @staticmethod
+    def _split_id(interval_id: str) -> Tuple[str, int]:
+        """
+        Split an interval id into its prefix and integer suffix (or NO_SUFFIX / OVERFLOW_SUFFIX).
+        """
+        prefix = get_interval_prefix(interval_id)
+        if prefix == interval_id:
+            return prefix, NO_SUFFIX
+
+        suffix = interval_id[len(prefix) + 1:]
+        if suffix.isascii() and suffix.isdigit() and len(suffix) < 19 and str(int(suffix)) == suffix:
+            return prefix, int(suffix)
+        return prefix, OVERFLOW_SUFFIX
+
+    def _encode_id(self, interval_id: str) -> Tuple[int, int]:
+        prefix, suffix = self._split_id(interval_id)
+        prefix_id = self.prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = len(self.prefixes)
+            self.prefixes.append(sys.intern(prefix))
+            self.prefix_ids[prefix] = prefix_id
+        return prefix_id, suffix
+
+    def _decode_id(self, slot: int) -> str:
+        suffix = self.suffix[slot]
+        if suffix >= 0:
+            return f'{self.prefixes[self.prefix[slot]]}_{suffix}'
+        if suffix == NO_SUFFIX:
+            return self.prefixes[self.prefix[slot]]
+        return self.overflow_ids[slot]
+
+    @staticmethod
+    def _split_uuid(interval_uuid: str) -> Tuple[int, int]:
+        value = uuid.UUID(interval_uuid).int
+        return value >> 64, value & UINT64_MASK
+
+    def _get_uuid(self, slot: int) -> str:
+        return str(uuid.UUID(int=self.uuid_high[slot] << 64 | self.uuid_low[slot]))
+
+    def _find_uuid(self, interval_uuid: str) -> Optional[int]:
+        try:
+            uuid_high, uuid_low = self._split_uuid(interval_uuid)
+        except ValueError:
+            return None
+        slot = -1
+        while True:
+            try:
+                slot = self.uuid_low.index(uuid_low, slot + 1)
+            except ValueError:
+                return None
+            if self.uuid_high[slot] == uuid_high and self.exclusion[slot] != FREE_SLOT:
+                return slot
+
+    def _generate_uuids(self, count: int) -> None:
+        self.uuid_high, self.uuid_low = array('Q'), array('Q')
+        for _ in range(count):
+            value = uuid.uuid4().int
+            self.uuid_high.append(value >> 64)
+            self.uuid_low.append(value & UINT64_MASK)
+
+    def _to_interval(self, slot: int) -> ExclusionInterval:
+        """
+        Materialize the interval in the slot as an ExclusionInterval.
+        """
+        charge = self.charge[slot]
+        return ExclusionInterval(interval_id=self._decode_id(slot),
+                                 charge=None if charge == NULL_CHARGE else charge,
+                                 min_mass=from_float(self.min_mass[slot]),
+                                 max_mass=from_float(self.max_mass[slot]),
+                                 min_rt=from_float(self.min_rt[slot]),
+                                 max_rt=from_float(self.max_rt[slot]),
+                                 min_ook0=from_float(self.min_ook0[slot]),
+                                 max_ook0=from_float(self.max_ook0[slot]),
+                                 min_intensity=from_float(self.min_intensity[slot]),
+                                 max_intensity=from_float(self.max_intensity[slot]),
+                                 exclusion=self.exclusion[slot] == 1,
+                                 data=self.data.get(slot),
+                                 interval_uuid=self._get_uuid(slot))
+
+    def _get_mass_bins(self, slot: int) -> Optional[range]:
+        """
+        Get the mass bins overlapped by the interval in the slot, or None if it belongs in wide_slots.
+        """
+        min_mass, max_mass = self.min_mass[slot], self.max_mass[slot]
+        if not (math.isfinite(min_mass) and math.isfinite(max_mass)):
+            return None
+
+        first_bin = math.floor(min_mass / self.mass_bin_width)
+        last_bin = math.floor(max_mass / self.mass_bin_width)
+        if last_bin - first_bin >= self.max_mass_bin_span:
+            return None
+        return range(first_bin, last_bin + 1)
+
+    def _get_rt_buckets(self, slot: int) -> Optional[range]:
+        """
+        Get the rt buckets overlapped by the interval in the slot, or None if it belongs in rt_wide_slots.
+        """
+        min_rt, max_rt = self.min_rt[slot], self.max_rt[slot]
+        if not (math.isfinite(min_rt) and math.isfinite(max_rt)):
+            return None
+
+        first_bucket = math.floor(min_rt / self.rt_bucket_width)
+        last_bucket = math.floor(max_rt / self.rt_bucket_width)
+        if last_bucket - first_bucket >= self.max_rt_bucket_span:
+            return None
+        return range(first_bucket, last_bucket + 1)
+
+    def _index_slot(self, slot: int) -> None:
+        self._index_bounds(slot)
+        self._index_id(slot)
+        self._get_prefix_slots(self.prefix[slot]).append(slot)
+
+    def _get_prefix_slots(self, prefix_id: int) -> SlotList:
+        prefix_slots = self.prefix_slots.get(prefix_id)
+        if prefix_slots is None:
+            prefix_slots = self.prefix_slots[prefix_id] = SlotList()
+        return prefix_slots
+
+    def _unindex_slot(self, slot: int) -> None:
+        self._unindex_bounds(slot)
+        self._unindex_id(slot)
+        prefix_id = self.prefix[slot]
+        prefix_slots = self.prefix_slots[prefix_id]
+        prefix_slots.remove(slot)
+        if len(prefix_slots) == 0:
+            self.prefix_slots.pop(prefix_id)
+
+    def _index_bounds(self, slot: int) -> None:
+        self._add_to_mass_index(slot, self.mass_bins, self.wide_slots)
+        self._index_rt(slot)
+        self._index_prefilter(slot)
+
+    def _unindex_bounds(self, slot: int) -> None:
+        self._unindex_prefilter(slot)
+        self._unindex_rt(slot)
+        self._remove_from_mass_index(slot, self.mass_bins, self.wide_slots)
+
+    def _get_prefilter_keys(self, slot: int) -> Optional[List[Tuple[int, int, Optional[int]]]]:
+        """
+        Get the prefilter keys of the interval in the slot, or None if it belongs in wide_slots.
+        """
+        mass_bins = self._get_mass_bins(slot)
+        if mass_bins is None:
+            return None
+
+        ook0_bins = [None]
+        if self.prefilter_ook0_bin_width is not None:
+            min_ook0, max_ook0 = self.min_ook0[slot], self.max_ook0[slot]
+            if math.isfinite(min_ook0) and math.isfinite(max_ook0):
+                first_bin = math.floor(min_ook0 / self.prefilter_ook0_bin_width)
+                last_bin = math.floor(max_ook0 / self.prefilter_ook0_bin_width)
+                if last_bin - first_bin < MAX_PREFILTER_OOK0_BIN_SPAN:
+                    ook0_bins = range(first_bin, last_bin + 1)
+
+        charge = self.charge[slot]
+        return [(charge, mass_bin, ook0_bin) for mass_bin in mass_bins for ook0_bin in ook0_bins]
+
+    def _index_prefilter(self, slot: int) -> None:
+        keys = self._get_prefilter_keys(slot)
+        if keys is None:
+            self.wide_charge_counts[self.charge[slot]] += 1
+            return
+
+        if (self.prefilter.keys + len(keys)) * PREFILTER_COUNTERS_PER_KEY > self.prefilter.size:
+            self._rebuild_prefilter()
+            return
+
+        self.prefilter_charge_counts[self.charge[slot]] += 1
+        for key in keys:
+            self.prefilter.add(key)
+
+    def _unindex_prefilter(self, slot: int) -> None:
+        keys = self._get_prefilter_keys(slot)
+        if keys is None:
+            self._decrement(self.wide_charge_counts, self.charge[slot])
+            return
+
+        self._decrement(self.prefilter_charge_counts, self.charge[slot])
+        for key in keys:
+            self.prefilter.remove(key)
+
+    @staticmethod
+    def _decrement(counts: Counter, charge: int) -> None:
+        counts[charge] -= 1
+        if counts[charge] == 0:
+            del counts[charge]
+
+    def _rebuild_prefilter(self) -> None:
+        """
+        Rebuild the prefilter and wide_charge_counts from the live slots, with enough counters to keep the false
+        positive rate low until the number of keys doubles.
+        """
+        keys = []
+        self.wide_charge_counts = Counter()
+        self.prefilter_charge_counts = Counter()
+        for slot in self._live_slots():
+            slot_keys = self._get_prefilter_keys(slot)
+            if slot_keys is None:
+                self.wide_charge_counts[self.charge[slot]] += 1
+            else:
+                self.prefilter_charge_counts[self.charge[slot]] += 1
+                keys.extend(slot_keys)
+
+        size = MIN_PREFILTER_SIZE
+        while size < 2 * len(keys) * PREFILTER_COUNTERS_PER_KEY:
+            size *= 2
+
+        self.prefilter = CountingBloomFilter(size, PREFILTER_HASHES)
+        for key in keys:
+            self.prefilter.add(key)
+
+    def _index_rt(self, slot: int) -> None:
+        """
+        Add the slot to the rt index, and to the hot index for each bucket of the hot window (and the bucket entering
+        it) it overlaps.
+        """
+        rt_buckets = self._get_rt_buckets(slot)
+        if rt_buckets is None:
+            self.rt_wide_slots.append(slot)
+            self._add_to_mass_index(slot, self.hot_mass_bins, self.hot_wide_slots)
+            return
+
+        for rt_bucket in rt_buckets:
+            bucket_slots = self.rt_buckets.get(rt_bucket)
+            if bucket_slots is None:
+                bucket_slots = self.rt_buckets[rt_bucket] = SlotList()
+            bucket_slots.append(slot)
+
+        if self.hot_first_bucket is not None:
+            hot_buckets = min(rt_buckets.stop, self.hot_last_bucket + 1) - max(rt_buckets.start, self.hot_first_bucket)
+            if hot_buckets > 0:
+                self._enter_hot_bucket(slot, hot_buckets)
+        # the pending slots of an entering bucket were taken before this slot was added
+        if self.hot_step_entering and self.hot_step_bucket in rt_buckets:
+            self._enter_hot_bucket(slot)
+
+    def _unindex_rt(self, slot: int) -> None:
+        rt_buckets = self._get_rt_buckets(slot)
+        if rt_buckets is None:
+            self.rt_wide_slots.remove(slot)
+            self._remove_from_mass_index(slot, self.hot_mass_bins, self.hot_wide_slots)
+            return
+
+        for rt_bucket in rt_buckets:
+            bucket_slots = self.rt_buckets[rt_bucket]
+            bucket_slots.remove(slot)
+            if len(bucket_slots) == 0:
+                self.rt_buckets.pop(rt_bucket)
+
+        if self.hot_refs.pop(slot, None) is not None:
+            self._remove_from_mass_index(slot, self.hot_mass_bins, self.hot_wide_slots)
+        if self.hot_step_bucket is not None:
+            self.hot_cancelled.add(slot)
+
+    def _add_to_mass_index(self, slot: int, mass_bins: Dict[int, array], wide_slots: SlotList) -> None:
+        slot_mass_bins = self._get_mass_bins(slot)
+        if slot_mass_bins is None:
+            wide_slots.append(slot)
+            return
+
+        for mass_bin in slot_mass_bins:
+            bin_slots = mass_bins.get(mass_bin)
+            if bin_slots is None:
+                bin_slots = mass_bins[mass_bin] = array('I')
+            bin_slots.append(slot)
+
+    def _remove_from_mass_index(self, slot: int, mass_bins: Dict[int, array], wide_slots: SlotList) -> None:
+        slot_mass_bins = self._get_mass_bins(slot)
+        if slot_mass_bins is None:
+            wide_slots.remove(slot)
+            return
+
+        for mass_bin in slot_mass_bins:
+            bin_slots = mass_bins[mass_bin]
+            bin_slots.remove(slot)
+            if len(bin_slots) == 0:
+                mass_bins.pop(mass_bin)
+
+    def _rebuild_bounds_indexes(self) -> None:
+        """
+        Rebuild the mass and rt indexes and the prefilter from the live slots, keeping the position and target of the
+        hot window. A step in progress is dropped; the next step starts it again.
+        """
+        hot_window = (self.hot_first_bucket, self.hot_last_bucket, self.hot_hits, self.hot_misses, self.hot_target,
+                      self.hot_behind)
+        self.mass_bins = {}
+        self.wide_slots = SlotList()
+        self._clear_rt_index()
+        self.hot_first_bucket, self.hot_last_bucket, self.hot_hits, self.hot_misses, self.hot_target, \
+            self.hot_behind = hot_window
+        for slot in self._live_slots():
+            self._add_to_mass_index(slot, self.mass_bins, self.wide_slots)
+            self._index_rt(slot)
+        self._rebuild_prefilter()
+
+    def _rebuild_indexes(self) -> None:
+        self._rebuild_bounds_indexes()
+        self.prefix_slots = {}
+        self.id_slots = {}
+        for slot in self._live_slots():
+            self._get_prefix_slots(self.prefix[slot]).append(slot)
+            self._index_id(slot)
+
+    def _free_slot(self, slot: int) -> None:
+        self.exclusion[slot] = FREE_SLOT
+        self.overflow_ids.pop(slot, None)
+        self.data.pop(slot, None)
+        self.free_slots.append(slot)
+        self._len -= 1
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Get a compacted copy of the stored intervals (without free slots or indexes), as saved to file.
+
+        Returns:
+            Dict[str, Any]: The format version, columns, prefixes, overflow ids and data of the list.
+        """
+        columns = {column: getattr(self, column)
+                   for column in BOUND_COLUMNS + ['charge', 'exclusion', 'prefix', 'suffix'] + UUID_COLUMNS}
+        if len(self.free_slots) == 0:
+            live_slots = None
+            columns = {name: array(values.typecode, values) for name, values in columns.items()}
+        else:
+            live_slots = self._live_slots()
+            columns = {name: array(values.typecode, (values[slot] for slot in live_slots))
+                       for name, values in columns.items()}
+
+        def new_slot(slot: int) -> int:
+            return slot if live_slots is None else bisect.bisect_left(live_slots, slot)
+
+        return {'format_version': EXCLUSION_LIST_FORMAT_VERSION,
+                'columns': columns,
+                'prefixes': list(self.prefixes),
+                'overflow_ids': {new_slot(slot): interval_id for slot, interval_id in self.overflow_ids.items()},
+                'data': {new_slot(slot): data for slot, data in self.data.items()}}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """
+        Replace the stored intervals with a state returned by to_state and rebuild the indexes. New uuids are generated
+        for states saved without uuid columns.
+
+        Args:
+            state (Dict[str, Any]): The state of an ExclusionList.
+        """
+        self.clear()
+        for name, values in state['columns'].items():
+            setattr(self, name, values)
+        self.prefixes = [sys.intern(prefix) for prefix in state['prefixes']]
+        self.prefix_ids = {prefix: prefix_id for prefix_id, prefix in enumerate(self.prefixes)}
+        self.overflow_ids = state['overflow_ids']
+        self.data = state['data']
+        self._len = len(self.exclusion)
+        if any(column not in state['columns'] for column in UUID_COLUMNS):
+            self._generate_uuids(self._len)
+        self._rebuild_indexes()
+
+    def save(self, file_path: str) -> None:
+        """
+        Save the ExclusionList to a file.
+
+        Args:
+            file_path (str): The path of the file to be saved.
+        """
+        self.write_state(self.to_state(), file_path)
+
+    @staticmethod
+    def write_state(state: Dict[str, Any], file_path: str) -> None:
+        """
+        Save a state returned by to_state to a file. This allows a snapshot taken under a lock to be written after the
+        lock is released.
+
+        Args:
+            state (Dict[str, Any]): The state of an ExclusionList.
+            file_path (str): The path of the file to be saved.
+        """
+        with open(file_path, "wb") as file:
+            pickle.dump(state, file, -1)
+
+    @staticmethod
+    def state_to_columns(state: Dict[str, Any]) -> Dict[str, list]:
+        """
+        Convert a state returned by to_state to json serializable columns, one list per ExclusionInterval field
+        (except interval_uuid and data), with None for null values. This is the snapshot format of client replicas.
+
+        Args:
+            state (Dict[str, Any]): The state of an ExclusionList.
+
+        Returns:
+            Dict[str, list]: The columns of the intervals.
+        """
+        columns = state['columns']
+        intervals = {'interval_id': ExclusionList.state_interval_ids(state),
+                     'charge': [None if charge == NULL_CHARGE else charge for charge in columns['charge']],
+                     'exclusion': [exclusion == 1 for exclusion in columns['exclusion']]}
+        for column in BOUND_COLUMNS:
+            intervals[column] = [from_float(value) for value in columns[column]]
+        return intervals
+
+    @staticmethod
+    def state_interval_ids(state: Dict[str, Any]) -> List[str]:
+        """
+        Get the interval ids of a state returned by to_state, in slot order.
+
+        Args:
+            state (Dict[str, Any]): The state of an ExclusionList.
+
+        Returns:
+            List[str]: The interval ids.
+        """
+        columns = state['columns']
+        prefixes, overflow_ids = state['prefixes'], state['overflow_ids']
+        interval_ids = []
+        for slot, (prefix, suffix) in enumerate(zip(columns['prefix'], columns['suffix'])):
+            if suffix >= 0:
+                interval_ids.append(f'{prefixes[prefix]}_{suffix}')
+            elif suffix == NO_SUFFIX:
+                interval_ids.append(prefixes[prefix])
+            else:
+                interval_ids.append(overflow_ids[slot])
+        return interval_ids
+
+    @staticmethod
+    def state_summary(state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the summary (see summary) of a state returned by to_state, without building an ExclusionList.
+
+        Args:
+            state (Dict[str, Any]): The state of an ExclusionList.
+
+        Returns:
+            Dict[str, Any]: The interval count, bounding box and charge histogram of the state.
+        """
+        columns = state['columns']
+        bounds = {}
+        for dimension in DIMENSIONS:
+            bounds[dimension] = []
+            for side, reduce in (('min', min), ('max', max)):
+                values = columns[f'{side}_{dimension}']
+                bounds[dimension].append(reduce(values) if values and not any(v != v for v in values) else None)
+        counts = Counter(columns['charge'])
+        return {'interval_count': len(columns['exclusion']),
+                'bounding_box': bounds,
+                'charge_counts': {'None' if charge == NULL_CHARGE else str(charge): count
+                                  for charge, count in counts.items()}}
+
+    @staticmethod
+    def read_state(file_path: str, progress_callback: Callable[[int], None] = None) -> Dict[str, Any]:
+        """
+        Read the state saved in a file, without building the indexes. Files saved by MassIntervalTree (format
+        version 1, a pickled IntervalTree) are converted.
+
+        Args:
+            file_path (str): The path of the file to be read.
+            progress_callback (Callable[[int], None]): Optional callback receiving the number of bytes read so far.
+
+        Returns:
+            Dict[str, Any]: The state, see to_state.
+        """
+        with open(file_path, "rb") as file:
+            reader = ProgressReader(file, progress_callback) if progress_callback is not None else file
+            state = pickle.load(reader)
+
+        if isinstance(state, IntervalTree):
+            exclusion_list = ExclusionList()
+            for interval in state:
+                interval_uuid = interval.data.interval_uuid
+                slot = exclusion_list.add(interval.data)
+                if interval_uuid is not None:
+                    exclusion_list.uuid_high[slot], exclusion_list.uuid_low[slot] = \
+                        exclusion_list._split_uuid(interval_uuid)
+            state = exclusion_list.to_state()
+            state['format_version'] = 1
+        return state
+
+    def load(self, file_path: str, progress_callback: Callable[[int], None] = None) -> None:
+        """
+        Load the ExclusionList from a file. Files saved by MassIntervalTree (format version 1, a pickled IntervalTree)
+        are converted.
+
+        Args:
+            file_path (str): The path of the file to be loaded.
+            progress_callback (Callable[[int], None]): Optional callback receiving the number of bytes read so far.
+        """
+        state = self.read_state(file_path, progress_callback)
+        self.set_state(state)
+        self.format_version = state['format_version']
+
+    def __len__(self) -> int:
+        """
+        Get the number of intervals in the ExclusionList.
+
+        Returns:
+            int: The number of intervals.
+        """
+        return self._len
+
+    def __iter__(self) -> Iterator[ExclusionInterval]:
+        """
+        Iterate over the ExclusionIntervals in the ExclusionList.
+
+        Yields:
+            ExclusionInterval: The next ExclusionInterval in the list.
+        """
+        return (self._to_interval(slot) for slot in self._live_slots())
+
+    def prefix_counts(self) -> Dict[str, int]:
+        """
+        Get the number of intervals stored for each interval id prefix.
+
+        Returns:
+            Dict[str, int]: A dictionary mapping interval id prefixes to interval counts.
+        """
+        return {self.prefixes[prefix_id]: len(slots) for prefix_id, slots in self.prefix_slots.items()}
+
+    def bounding_box(self) -> Dict[str, List[Optional[float]]]:
+        """
+        Get the [min, max] bounds covered by the intervals for each dimension (mass, rt, ook0, intensity).
+        A bound is None if any interval is unbounded on that side, or if the list is empty.
+
+        Returns:
+            Dict[str, List[Optional[float]]]: A dictionary mapping dimension names to [min, max] bounds.
+        """
+        live_slots = self._live_slots()
+        bounds = {}
+        for dimension in DIMENSIONS:
+            bounds[dimension] = []
+            for side, reduce in (('min', min), ('max', max)):
+                values = getattr(self, f'{side}_{dimension}')
+                values = [values[slot] for slot in live_slots]
+                bounds[dimension].append(reduce(values) if values and not any(v != v for v in values) else None)
+        return bounds
+
+    def charge_counts(self) -> Dict[str, int]:
+        """
+        Get a histogram of interval charges. Intervals without a charge are counted under 'None'.
+
+        Returns:
+            Dict[str, int]: A dictionary mapping charges to interval counts.
+        """
+        counts = Counter(self.charge[slot] for slot in self._live_slots())
+        return {'None' if charge == NULL_CHARGE else str(charge): count for charge, count in counts.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Get the summary of the list stored in the catalog of saved lists.
+
+        Returns:
+            Dict[str, Any]: The interval count, bounding box and charge histogram of the list.
+        """
+        return {'interval_count': len(self),
+                'bounding_box': self.bounding_box(),
+                'charge_counts': self.charge_counts()}
+
+    def hot_window(self) -> Optional[List[float]]:
+        """
+        Get the [start, end) rt range of the hot window, or None if it has no buckets yet.
+
+        Returns:
+            Optional[List[float]]: The rt range of the hot window.
+        """
+        if self.hot_first_bucket is None:
+            return None
+        return [self.hot_first_bucket * self.rt_bucket_width, (self.hot_last_bucket + 1) * self.rt_bucket_width]
+
+    def hot_window_target(self) -> Optional[List[float]]:
+        """
+        Get the [start, end) rt range the hot window is moving to, or None if advance_hot_window was not called yet.
+
+        Returns:
+            Optional[List[float]]: The rt range of the target.
+        """
+        if self.hot_target is None:
+            return None
+        return [self.hot_target[0] * self.rt_bucket_width, (self.hot_target[1] + 1) * self.rt_bucket_width]
+
+    def prefilter_stats(self) -> Dict[str, Any]:
+        """
+        Get statistics about the prefilter of point queries.
+
+        Returns:
+            Dict[str, Any]: The size and fill ratio of the prefilter, the number of point queries checked against it,
+            the ratio answered by it (definite negatives), and the observed and expected false positive rates. A false
+            positive is a query which passed the prefilter although no interval has one of its keys. It is estimated
+            from a sample of the queries which passed the prefilter and found no interval.
+        """
+        false_positives = 0.0
+        if self.prefilter_sampled_passes:
+            false_positives = self.prefilter_empty_passes * self.prefilter_false_positives / \
+                self.prefilter_sampled_passes
+        negatives = self.prefilter_negatives + false_positives
+
+        return {'size': self.prefilter.size,
+                'keys': self.prefilter.keys,
+                'fill_ratio': self.prefilter.fill_ratio(),
+                'checks': self.prefilter_checks,
+                'negatives': self.prefilter_negatives,
+                'hit_ratio': self.prefilter_negatives / self.prefilter_checks if self.prefilter_checks else 0.0,
+                'false_positive_rate': false_positives / negatives if negatives else 0.0,
+                'expected_false_positive_rate': self.prefilter.expected_false_positive_rate()}
+
+    def nbytes(self) -> int:
+        """
+        Get the memory used by the stored intervals and their indexes, in bytes.
+
+        This is a lower bound: the containers, their boxed int slots and the data values are counted with
+        sys.getsizeof, but the contents of nested data values and the allocator's overhead (free lists, fragmentation)
+        are not, so the process RSS grows by more than this per interval.
+
+        Returns:
+            int: The number of bytes.
+        """
+        columns = [getattr(self, column) for column in BOUND_COLUMNS] + \
+                  [self.charge, self.exclusion, self.prefix, self.suffix, self.uuid_high, self.uuid_low]
+        size = sum(sys.getsizeof(values) for values in columns)
+        size += sys.getsizeof(self.mass_bins) + sum(sys.getsizeof(slots) for slots in self.mass_bins.values())
+        size += self.wide_slots.nbytes()
+        size += sys.getsizeof(self.rt_buckets) + sum(slots.nbytes() for slots in self.rt_buckets.values())
+        size += self.rt_wide_slots.nbytes() + sys.getsizeof(self.hot_refs)
+        size += sum(sys.getsizeof(slot) for slot in self.hot_refs)
+        size += sys.getsizeof(self.hot_mass_bins) + sum(sys.getsizeof(slots) for slots in self.hot_mass_bins.values())
+        size += self.hot_wide_slots.nbytes() + sys.getsizeof(self.hot_pending) + sys.getsizeof(self.hot_cancelled)
+        size += sys.getsizeof(self.prefilter.counters)
+        size += sys.getsizeof(self.prefix_slots) + sum(slots.nbytes() for slots in self.prefix_slots.values())
+        size += sys.getsizeof(self.id_slots) + sum(sys.getsizeof(key) for key in self.id_slots if isinstance(key, int))
+        size += sum(sys.getsizeof(slots) for slots in self.id_slots.values())
+        size += sys.getsizeof(self.prefixes) + sys.getsizeof(self.prefix_ids)
+        size += sum(sys.getsizeof(prefix) for prefix in self.prefixes)
+        size += sys.getsizeof(self.overflow_ids) + sum(sys.getsizeof(i) for i in self.overflow_ids.values())
+        size += sys.getsizeof(self.data) + sum(sys.getsizeof(data) for data in self.data.values())
+        size += sys.getsizeof(self.free_slots) + sum(sys.getsizeof(slot) for slot in self.free_slots)
+        return size
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get statistics about the ExclusionList.
+
+        Returns:
+            Dict[str, Any]: A dictionary containing statistics about the list.
+        """
+        nbytes = self.nbytes()
+        return {'interval_tree': len(self),
+                'slots': len(self.exclusion),
+                'free_slots': len(self.free_slots),
+                'mass_bins': len(self.mass_bins),
+                'wide_intervals': len(self.wide_slots),
+                'hot_window': self.hot_window(),
+                'hot_target': self.hot_window_target(),
+                'hot_intervals': len(self.hot_refs) + len(self.rt_wide_slots),
+                'hot_hits': self.hot_hits,
+                'hot_misses': self.hot_misses,
+                'prefilter': self.prefilter_stats(),
+                'bytes': nbytes,
+                'bytes_per_interval': nbytes / len(self) if len(self) > 0 else 0.0,
+                'prefix_counts': self.prefix_counts(),
+                'class': str(type(self))}
@@ -0,0 +1,111 @@
+"""
+This module contains the aggregation of query traces (see ExclusionList.explain_point and explain_interval), used to
+find out which index strategy the data actually needs: whether the mass index prunes the list, which dimension
+filters do the remaining work, and how often null bounds make intervals match.
+
+The traces of the explained queries are kept in a rolling window. Live point queries can also be sampled: with the
+EXCLUSIONMS_TRACE_SAMPLE_INTERVAL environment variable set to n, every n-th point of the point query endpoints is traced
+after it was answered. The sampled points are traced at bulk priority once the query released the lock, so that tracing
+does not delay real-time queries; a trace may see intervals added or removed after the query.
+"""
+
+import os
+from collections import deque, Counter
+from typing import Dict, Any, List, Iterable
+
+from exclusionms.components import ExclusionPoint
+
+TRACE_WINDOW = 1000
+TRACE_SAMPLE_INTERVAL = int(os.environ.get('EXCLUSIONMS_TRACE_SAMPLE_INTERVAL', 0))
+
+
+class QueryTraces:
+    """
+    Rolling window of the last query traces.
+
+    Attributes:
+        sample_interval (int): Every sample_interval-th live point query is traced, 0 to trace none.
+        sampled_points (int): Number of live point queries seen by sample.
+    """
+
+    def __init__(self, size: int = TRACE_WINDOW, sample_interval: int = TRACE_SAMPLE_INTERVAL):
+        self.traces = deque(maxlen=size)
+        self.sample_interval = sample_interval
+        self.sampled_points = 0
+
+    def record(self, trace: Dict[str, Any]) -> None:
+        self.traces.append(trace)
+
+    def clear(self) -> None:
+        self.traces.clear()
+        self.sampled_points = 0
+
+    def sample(self, points: Iterable[ExclusionPoint]) -> List[ExclusionPoint]:
+        """
+        Select every sample_interval-th point of live point queries, to be traced with explain_point and recorded.
+        """
+        if self.sample_interval <= 0:
+            return []
+        sampled = []
+        for point in points:
+            self.sampled_points += 1
+            if self.sampled_points % self.sample_interval == 0:
+                sampled.append(point)
+        return sampled
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Aggregate the traces in the window, by kind of query ('point' or 'interval').
+
+        Returns:
+            Dict[str, Any]: For each kind of query, containing:
+                - 'queries': the number of traced queries.
+                - 'prefilter', 'index', 'candidates_from', 'status': counts of the traces by value.
+                - 'mean_interval_count': the mean number of intervals in the list.
+                - 'stages': for each stage, the number of traces which ran it, the mean number of intervals before
+                  and after it, the ratio of intervals it pruned, the ratio of its survivors which passed only because
+                  of a null bound, the ratio of traces which skipped it (null point value) and its mean time in
+                  milliseconds.
+                - 'total_ms': the mean, p95 and max time of the traced queries in milliseconds.
+        """
+        traces_by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        for trace in self.traces:
+            traces_by_kind.setdefault(trace['kind'], []).append(trace)
+
+        report = {'window': self.traces.maxlen, 'sample_interval': self.sample_interval,
+                  'sampled_points': self.sampled_points}
+        for kind, traces in traces_by_kind.items():
+            report[kind] = aggregate_traces(traces)
+        return report
+
+
+def aggregate_traces(traces: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stages: Dict[str, Dict[str, float]] = {}
+    for trace in traces:
+        for stage in trace['stages']:
+            totals = stages.setdefault(stage['stage'], Counter())
+            totals['count'] += 1
+            totals['in'] += stage['in']
+            totals['out'] += stage['out']
+            totals['null_bounds'] += stage['null_bounds']
+            totals['skipped'] += stage['skipped']
+            totals['ms'] += stage['ms']
+
+    total_ms = sorted(trace['total_ms'] for trace in traces)
+    return {'queries': len(traces),
+            'prefilter': dict(Counter(trace.get('prefilter') for trace in traces if 'prefilter' in trace)),
+            'index': dict(Counter(str(trace['index']) for trace in traces)),
+            'candidates_from': dict(Counter(str(trace['candidates_from']) for trace in traces)),
+            'status': dict(Counter(str(trace['status']) for trace in traces)),
+            'mean_interval_count': sum(trace['interval_count'] for trace in traces) / len(traces),
+            'stages': {name: {'count': totals['count'],
+                              'mean_in': totals['in'] / totals['count'],
+                              'mean_out': totals['out'] / totals['count'],
+                              'pruned_ratio': 1 - totals['out'] / totals['in'] if totals['in'] else 0.0,
+                              'null_bound_ratio': totals['null_bounds'] / totals['out'] if totals['out'] else 0.0,
+                              'skipped_ratio': totals['skipped'] / totals['count'],
+                              'mean_ms': totals['ms'] / totals['count']}
+                       for name, totals in stages.items()},
+            'total_ms': {'mean': sum(total_ms) / len(total_ms),
+                         'p95': total_ms[min(len(total_ms) - 1, int(len(total_ms) * 0.95))],
+                         'max': total_ms[-1]}}
@@ -0,0 +1,199 @@
+"""
+This module contains the bulk point jobs, used to check very large batches of points (e.g. whole runs for
+reanalysis) without holding the lock on the active exclusion list or the points in memory.
+
+A job is created by uploading the points as a csv stream (one 'charge,mass,rt,ook0,intensity' line per point, with an
+optional header line and empty or None for null values) to a file. A frozen snapshot of the active exclusion list and
+the offset is taken when the upload is complete. The points are then read in chunks and checked in a process pool,
+where each worker holds its own copy of the snapshot, and the results are written in order to an output file (one line
+per point) which can be downloaded while the job runs.
+"""
+
+import asyncio
+import dataclasses
+import itertools
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List, TextIO
+
+from exclusionms.components import ExclusionPoint
+
+from exclusion_list import ExclusionList
+from utils import Offset, apply_offset, convert_int, convert_float
+
+JOB_CHUNK_SIZE = 20000
+JOB_POLL_INTERVAL = 0.1
+HEADER_PREFIX = 'charge'
+
+
+@dataclasses.dataclass
+class BulkJob:
+    """
+    State of a bulk point job.
+
+    Attributes:
+        job_id (str): ID of the job.
+        operation (str): The point check, 'status'.
+        status (str): 'uploading', 'queued', 'running', 'done', 'cancelled' or 'failed'.
+        points_total (int): Number of points uploaded.
+        points_done (int): Number of points checked and written to the output file.
+        bytes_done (int): Size of the output written for points_done, so that downloads can follow the job.
+        workers (int): Number of worker processes.
+        error (Optional[str]): Error of a failed job.
+    """
+    job_id: str
+    input_path: str
+    output_path: str
+    operation: str = 'status'
+    status: str = 'uploading'
+    points_total: int = 0
+    points_done: int = 0
+    bytes_done: int = 0
+    workers: int = 1
+    create_time: float = dataclasses.field(default_factory=time.time)
+    start_time: Optional[float] = None
+    end_time: Optional[float] = None
+    error: Optional[str] = None
+
+    @staticmethod
+    def create(jobs_folder: str, operation: str = 'status') -> 'BulkJob':
+        job_id = uuid.uuid4().hex
+        return BulkJob(job_id=job_id, operation=operation, input_path=os.path.join(jobs_folder, f'{job_id}.csv'),
+                       output_path=os.path.join(jobs_folder, f'{job_id}.out'))
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        Get the progress of the job, including its throughput in points per second.
+        """
+        elapsed = None
+        if self.start_time is not None:
+            elapsed = (self.end_time or time.time()) - self.start_time
+        return {'job_id': self.job_id,
+                'operation': self.operation,
+                'status': self.status,
+                'points_total': self.points_total,
+                'points_done': self.points_done,
+                'progress': self.points_done / self.points_total if self.points_total else None,
+                'workers': self.workers,
+                'elapsed': elapsed,
+                'points_per_second': self.points_done / elapsed if elapsed else None,
+                'error': self.error}
+
+    def queue(self, workers: int) -> None:
+        """
+        Mark the upload as complete and create the (empty) output file, so that downloads can start.
+        """
+        self.workers = workers
+        self.status = 'queued'
+        open(self.output_path, 'wb').close()
+
+    def remove_files(self) -> None:
+        for path in (self.input_path, self.output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def is_point_line(line: str) -> bool:
+    return bool(line.strip()) and not line.startswith(HEADER_PREFIX)
+
+
+def count_points(file_path: str) -> int:
+    with open(file_path, 'r') as f:
+        return sum(1 for line in f if is_point_line(line))
+
+
+def read_chunk(file: TextIO, chunk_size: int) -> List[str]:
+    return list(itertools.islice(file, chunk_size))
+
+
+# per worker state, set by init_worker so that the snapshot is sent and indexed once per process
+_exclusion_list: Optional[ExclusionList] = None
+_offset: Optional[Offset] = None
+
+
+def init_worker(state: Dict[str, Any], offset: Dict[str, float]) -> None:
+    global _exclusion_list, _offset
+    _exclusion_list = ExclusionList()
+    _exclusion_list.set_state(state)
+    _offset = Offset(**offset)
+
+
+def status_chunk(lines: List[str]) -> bytes:
+    """
+    Get the IntervalStatus of each point of a chunk of csv lines, one status per line (its integer value).
+
+    Raises:
+        ValueError: If a line is not a valid point.
+    """
+    statuses = []
+    for line in lines:
+        try:
+            charge, mass, rt, ook0, intensity = line.strip().split(',')
+            point = ExclusionPoint(charge=convert_int(charge), mass=convert_float(mass), rt=convert_float(rt),
+                                   ook0=convert_float(ook0), intensity=convert_float(intensity))
+        except ValueError:
+            raise ValueError(f'Invalid point line: {line.strip()!r}')
+        apply_offset(point, _offset)
+        statuses.append(str(int(_exclusion_list.point_status(point))))
+    return ('\n'.join(statuses) + '\n').encode()
+
+
+async def run_job(job: BulkJob, state: Dict[str, Any], offset: Dict[str, float],
+                  chunk_size: int = JOB_CHUNK_SIZE) -> None:
+    """
+    Run a job on a snapshot of an exclusion list. Up to two chunks per worker are in flight; their results are
+    written in input order. Errors are recorded in the job rather than raised, cancellation stops the workers.
+
+    Args:
+        job (BulkJob): The queued job, with its points uploaded to job.input_path.
+        state (Dict[str, Any]): The snapshot of the exclusion list, see ExclusionList.to_state.
+        offset (Dict[str, float]): The offset applied to the points.
+        chunk_size (int): Number of points per chunk.
+    """
+    loop = asyncio.get_running_loop()
+    job.status = 'running'
+    job.start_time = time.time()
+
+    executor = ProcessPoolExecutor(max_workers=job.workers, initializer=init_worker, initargs=(state, offset))
+    pending = deque()
+    try:
+        with open(job.input_path, 'r') as input_file, open(job.output_path, 'wb') as output_file:
+            async def write_next() -> None:
+                num_points, future = pending.popleft()
+                output = await future
+                await loop.run_in_executor(None, output_file.write, output)
+                output_file.flush()
+                job.points_done += num_points
+                job.bytes_done += len(output)
+
+            while True:
+                lines = await loop.run_in_executor(None, read_chunk, input_file, chunk_size)
+                if not lines:
+                    break
+                lines = [line for line in lines if is_point_line(line)]
+                if not lines:
+                    continue
+                pending.append((len(lines), loop.run_in_executor(executor, status_chunk, lines)))
+                if len(pending) >= 2 * job.workers:
+                    await write_next()
+            while pending:
+                await write_next()
+        job.status = 'done'
+    except asyncio.CancelledError:
+        job.status = 'cancelled'
+        raise
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        job.end_time = time.time()
@@ -2,24 +2,39 @@ import logging
 import subprocess
 from logging.handlers import RotatingFileHandler
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Callable, TypeVar, Set
 
-from fastapi import HTTPException, FastAPI, BackgroundTasks
+from fastapi import HTTPException, FastAPI, BackgroundTasks, Header, Query
 from fastapi.exceptions import RequestValidationError
 
-from constants import DATA_FOLDER
+from catalog import Catalog, CatalogEntry
+from constants import DATA_FOLDER, CATALOG_FILE, EXCLUSION_LIST_FORMAT_VERSION, STATE_FILE, JOBS_FOLDER, \
+    CHECKPOINT_EXID
+from exclusion_list import ExclusionList
+from explain import QueryTraces
+from jobs import BulkJob, JOB_POLL_INTERVAL, count_points, run_job
+from mutations import MutationLog
 from exclusionms.components import ExclusionInterval, ExclusionPoint, ExclusionPointBatchMessage
-from exclusionms.db import MassIntervalTree as ExclusionList
-from utils import Offset
+from exclusionms.db import IntervalStatus
+from replication import MIN_SEQ_HEADER, MIN_SEQ_TIMEOUT, RETRY_INTERVAL, SEQ_HEADER, ReplicationState, \
+    columns_to_intervals, fetch_mutations, fetch_snapshot
+from profiling import MAX_SAMPLING_INTERVAL, MIN_SAMPLING_INTERVAL, SamplingProfiler, TimedRoute, capture_cprofile, \
+    is_cprofile_running, profile_to_bytes, profile_to_text, timed, timed_lock
+from setops import DEDUP_MODES, OPERATIONS, combine_files
+from scheduling import DEADLINE_STATUS_HEADER, DeadlineExceeded, Priority, PriorityLock, get_deadline, iter_chunks
+from utils import Offset, apply_offset
+from warmstart import ActiveListState
 
 import asyncio
 
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-from starlette.responses import Response, JSONResponse
+from starlette.responses import Response, JSONResponse, PlainTextResponse, StreamingResponse
 import time
 import json
 import os
+import dataclasses
+from collections import deque
 
 _log = logging.getLogger(__name__)
 _log.setLevel(logging.INFO)
@@ -81,6 +96,25 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class ReplicationMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        # read-your-writes: wait until the mutation the client asks for was applied
+        min_seq = request.headers.get(MIN_SEQ_HEADER)
+        if min_seq is not None:
+            try:
+                min_seq = int(min_seq)
+            except ValueError:
+                return JSONResponse(status_code=400, content={'detail': f'{MIN_SEQ_HEADER} must be an integer.'})
+            if not await wait_for_seq(min_seq, MIN_SEQ_TIMEOUT):
+                return JSONResponse(status_code=503, headers={SEQ_HEADER: str(get_seq())},
+                                    content={'detail': f'mutation {min_seq} was not applied within '
+                                                       f'{MIN_SEQ_TIMEOUT} seconds.'})
+
+        response: Response = await call_next(request)
+        response.headers[SEQ_HEADER] = str(get_seq())
+        return response
+
+
 app = FastAPI(
     title="ExclusionMS",
     description='ExclusionMS FAST API Server',
@@ -91,6 +125,8 @@ app = FastAPI(
     }
 )
 
+app.router.route_class = TimedRoute
+app.add_middleware(ReplicationMiddleware)
 app.add_middleware(LoggingMiddleware)
 
 
@@ -131,17 +167,313 @@ tags_metadata = [
         "name": "Offset",
         "description": "API calls for updating offsets",
     },
+    {
+        "name": "Jobs",
+        "description": "API calls for checking large batches of points in the background",
+    },
+    {
+        "name": "Sync",
+        "description": "API calls for keeping client replicas of the active exclusion list",
+    },
+    {
+        "name": "Admin",
+        "description": "API calls for diagnosing the server",
+    },
 ]
 
 active_exclusion_list = ExclusionList()
 offset = Offset()
-lock = asyncio.Lock()
+lock = PriorityLock()
+catalog = Catalog.from_file(CATALOG_FILE)
+catalog.sync(DATA_FOLDER)
+active_list_state = ActiveListState(state_file=STATE_FILE)
+load_task: Optional[asyncio.Task] = None
+load_lock = asyncio.Lock()
+catalog_task: Optional[asyncio.Future] = None
+mutation_log = MutationLog()
+replication_state = ReplicationState()
+replication_task: Optional[asyncio.Task] = None
+hot_window_task: Optional[asyncio.Task] = None
+hot_window_event = asyncio.Event()
+HOT_WINDOW_STEP_SLOTS = 1024
+jobs: Dict[str, BulkJob] = {}
+query_traces = QueryTraces()
+trace_tasks: Set[asyncio.Task] = set()
+job_tasks: Dict[str, asyncio.Task] = {}
+JOB_WORKERS = os.cpu_count() or 1
 
 
 def get_pickle_path(exclusion_list_name: str) -> str:
     return os.path.join(DATA_FOLDER, exclusion_list_name + '.pkl')
 
 
+def get_seq() -> int:
+    """
+    Get the sequence number of the last mutation applied to the active exclusion list: the primary's sequence number
+    on a replica, the own mutation log's on the primary.
+    """
+    return replication_state.seq if replication_state.is_replica else mutation_log.seq
+
+
+async def wait_for_seq(seq: int, timeout: float) -> bool:
+    """
+    Wait until the mutation with the given sequence number was applied, or for at most timeout seconds.
+    """
+    if replication_state.is_replica:
+        return await replication_state.wait_for_seq(seq, timeout)
+
+    deadline = time.monotonic() + timeout
+    while mutation_log.seq < seq:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await mutation_log.wait(mutation_log.seq, remaining)
+    return True
+
+
+def check_writable() -> None:
+    """
+    Raises:
+        HTTPException 403: If this server is a read-only replica.
+    """
+    if replication_state.is_replica:
+        raise HTTPException(status_code=403, detail=f'This server is a read-only replica, send changes to the '
+                                                    f'primary {replication_state.primary}.')
+
+
+def set_offset(values: Dict[str, float]) -> None:
+    offset.mass = values['mass']
+    offset.rt = values['rt']
+    offset.ook0 = values['ook0']
+    offset.intensity = values['intensity']
+
+
+async def apply_snapshot(snapshot: Dict) -> None:
+    """
+    Replaces the active exclusion list of a replica with a snapshot of the primary. The list is built in a worker
+    thread and swapped in under the lock.
+    """
+    global active_exclusion_list
+    exclusion_list = ExclusionList()
+
+    def build() -> None:
+        for interval in columns_to_intervals(snapshot['intervals']):
+            exclusion_list.add(ExclusionInterval(**interval))
+
+    await asyncio.get_running_loop().run_in_executor(None, build)
+    async with timed_lock(lock, Priority.BULK):
+        active_exclusion_list = exclusion_list
+        set_offset(snapshot['offset'])
+        mutation_log.append('reset')
+        replication_state.epoch = snapshot['epoch']
+        replication_state.primary_seq = snapshot['seq']
+        replication_state.set_seq(snapshot['seq'])
+
+
+async def apply_mutation(mutation: Dict) -> None:
+    """
+    Applies a mutation of the primary's log to the active exclusion list of a replica, and appends it to the
+    replica's own mutation log for the clients following the replica.
+    """
+    op = mutation['op']
+    async with timed_lock(lock, Priority.BULK):
+        if op == 'add':
+            intervals = [ExclusionInterval(**interval) for interval in mutation['intervals']]
+            for interval in intervals:
+                active_exclusion_list.add(interval)
+            mutation_log.append('add', intervals=intervals)
+        elif op == 'remove':
+            removed_intervals = [removed_interval for interval in mutation['intervals']
+                                 for removed_interval in active_exclusion_list.remove(ExclusionInterval(**interval))]
+            mutation_log.append('remove', intervals=removed_intervals)
+        elif op == 'remove_prefix':
+            active_exclusion_list.remove_by_prefix(mutation['prefix'])
+            mutation_log.append('remove_prefix', prefix=mutation['prefix'])
+        elif op == 'clear':
+            active_exclusion_list.clear()
+            mutation_log.append('clear')
+        elif op == 'offset':
+            set_offset(mutation['offset'])
+            mutation_log.append('offset', offset=dataclasses.asdict(offset))
+        else:
+            _log.warning(f'Unknown mutation: {op}')
+        replication_state.set_seq(mutation['seq'])
+
+
+async def replicate() -> None:
+    """
+    Follows the primary's mutation log: fetches a snapshot of the primary's active exclusion list, then applies the
+    mutations made after it. A new snapshot is fetched when the primary loads a list, restarts, or no longer has the
+    mutations the replica needs. Errors are logged and recorded in replication_state, and retried.
+    """
+    loop = asyncio.get_running_loop()
+    primary = replication_state.primary
+    needs_snapshot = True
+    while True:
+        try:
+            if needs_snapshot:
+                replication_state.status = 'syncing'
+                snapshot = await loop.run_in_executor(None, fetch_snapshot, primary)
+                await apply_snapshot(snapshot)
+                needs_snapshot = False
+                replication_state.last_contact = time.time()
+                replication_state.status = 'streaming'
+                replication_state.error = None
+                _log.info(f'Replica loaded a snapshot of {primary} at seq {snapshot["seq"]}')
+
+            result = await loop.run_in_executor(None, fetch_mutations, primary, replication_state.epoch,
+                                                replication_state.seq, replication_state.replica_id)
+            replication_state.last_contact = time.time()
+            replication_state.status = 'streaming'
+            replication_state.error = None
+            if result is None:
+                needs_snapshot = True
+                continue
+
+            replication_state.primary_seq = result['seq']
+            for mutation in result['mutations']:
+                if mutation['op'] == 'reset':
+                    needs_snapshot = True
+                    break
+                await apply_mutation(mutation)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _log.error(f'Error when replicating {primary}: {e}')
+            replication_state.status = 'error'
+            replication_state.error = str(e)
+            await asyncio.sleep(RETRY_INTERVAL)
+
+
+async def load_exclusion_list(exid: str) -> None:
+    """
+    Loads the saved exclusion list with the given ID into a new ExclusionList in a worker thread, without holding the
+    lock, so that the active list keeps serving queries while the file is read. The active exclusion list is then
+    replaced with it under the lock; changes made to the previous list in the meantime are discarded with it. Loads
+    run one at a time. Errors are logged and recorded in active_list_state rather than raised.
+    """
+    global active_exclusion_list
+    pickle_path = get_pickle_path(exid)
+
+    async with load_lock:
+        exclusion_list = ExclusionList()
+        try:
+            active_list_state.start_loading(exid, os.path.getsize(pickle_path))
+            await asyncio.get_running_loop().run_in_executor(None, exclusion_list.load, pickle_path,
+                                                             active_list_state.update_progress)
+            mtime = os.path.getmtime(pickle_path)
+        except Exception as e:
+            _log.error(f'Exception when loading exclusion list: {e}', exc_info=True)
+            active_list_state.fail_loading(e)
+            return
+
+        async with timed_lock(lock, Priority.BULK):
+            active_exclusion_list = exclusion_list
+            active_list_state.finish_loading(mtime)
+            mutation_log.append('reset')
+
+    try:
+        catalog.complete(exid, pickle_path, active_exclusion_list)
+    except Exception as e:
+        _log.error(f'Error when updating exclusion list catalog: {e}', exc_info=True)
+
+
+async def save_exclusion_list(exid: str) -> None:
+    """
+    Saves the active exclusion list with the given ID and updates the catalog. A snapshot of the list is taken under
+    the lock and written to file in a worker thread after the lock is released, so that queries are not blocked by
+    the write. The saved list becomes the active exid once the file is written; changes made during the write keep
+    the list dirty.
+    """
+    pickle_path = get_pickle_path(exid)
+
+    async with timed_lock(lock, Priority.BULK):
+        saved_list = active_exclusion_list
+        state = active_exclusion_list.to_state()
+        summary = active_exclusion_list.summary()
+        was_dirty = active_list_state.dirty
+        active_list_state.dirty = False
+
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, ExclusionList.write_state, state, pickle_path)
+    except Exception:
+        active_list_state.dirty = active_list_state.dirty or was_dirty
+        raise
+
+    # a load during the write replaced the list which was saved
+    if active_exclusion_list is saved_list:
+        changed_during_write = active_list_state.dirty
+        active_list_state.set_active(exid, os.path.getmtime(pickle_path))
+        active_list_state.dirty = changed_during_write
+
+    try:
+        catalog.update(exid, pickle_path, summary)
+    except Exception as e:
+        _log.error(f'Error when updating exclusion list catalog: {e}', exc_info=True)
+
+
+@app.on_event("startup")
+async def warm_start():
+    """
+    Preloads the exclusion list which was active before the server stopped, in the background. A replica starts
+    following its primary instead. The partial catalog entries of saved lists are completed in a worker thread.
+    """
+    global load_task, replication_task, hot_window_task, catalog_task
+    hot_window_task = asyncio.create_task(move_hot_window())
+    catalog_task = asyncio.get_running_loop().run_in_executor(None, catalog.complete_partial_entries, DATA_FOLDER)
+    if replication_state.is_replica:
+        _log.info(f'Starting as a replica of {replication_state.primary}')
+        replication_task = asyncio.create_task(replicate())
+        return
+
+    exid = active_list_state.read_exid()
+    if exid is None or not os.path.exists(get_pickle_path(exid)):
+        return
+
+    _log.info(f'Warm start: loading exclusion list {exid}')
+    load_task = asyncio.create_task(load_exclusion_list(exid))
+
+
+async def move_hot_window():
+    """
+    Moves the hot window of the active exclusion list towards the rt of the real-time point queries, in steps of at
+    most HOT_WINDOW_STEP_SLOTS intervals. The lock is taken with bulk priority for each step, so point queries wait
+    for at most one step.
+    """
+    while True:
+        await hot_window_event.wait()
+        hot_window_event.clear()
+        moving = True
+        while moving:
+            async with timed_lock(lock, Priority.BULK):
+                moving = active_exclusion_list.step_hot_window(HOT_WINDOW_STEP_SLOTS)
+            await asyncio.sleep(0)
+
+
+@app.on_event("shutdown")
+async def checkpoint():
+    """
+    Saves unsaved changes of the active exclusion list under its exid before the server stops. A list which was
+    never saved or loaded is saved under CHECKPOINT_EXID, which becomes its exid so that the next start loads it.
+    """
+    if replication_task is not None:
+        replication_task.cancel()
+    if hot_window_task is not None:
+        hot_window_task.cancel()
+    for task in list(trace_tasks):
+        task.cancel()
+
+    if not active_list_state.dirty:
+        return
+
+    exid = active_list_state.exid if active_list_state.exid is not None else CHECKPOINT_EXID
+    _log.info(f'Checkpoint: saving exclusion list {exid}')
+    try:
+        await save_exclusion_list(exid)
+    except Exception as e:
+        _log.error(f'Error when checkpointing exclusion list: {e}', exc_info=True)
+
+
 @app.get("/exclusionms/statistics", status_code=200, tags=['Exclusion List'])
 async def get_statistics() -> Dict:
     """
@@ -149,14 +481,49 @@ async def get_statistics() -> Dict:
 
     Returns:
         A dictionary containing the following keys and values:
-            - 'len': the number of exclusion intervals in the active exclusion list.
-            - 'id_table_len': the total number of entries in the ID dictionary used by the exclusion list.
+            - 'interval_tree': the number of exclusion intervals in the active exclusion list.
+            - 'slots' / 'free_slots': the number of allocated and reusable interval slots.
+            - 'mass_bins': the number of non-empty mass bins in the mass index.
+            - 'wide_intervals': the number of intervals with null or very wide mass bounds, checked by every query.
+            - 'hot_window': the [start, end) rt range of the hot index used by point queries near the current rt.
+            - 'hot_target': the rt range the hot window is moving to, following the real-time point queries.
+            - 'hot_intervals': the number of intervals in the hot index.
+            - 'hot_hits' / 'hot_misses': the number of point queries inside and outside the hot window.
+            - 'prefilter': the size, fill ratio, hit ratio (point queries answered as definite negatives) and
+              observed and expected false positive rates of the prefilter of point queries.
+            - 'bytes': a lower bound of the memory used by the intervals and their indexes (see ExclusionList.nbytes).
+            - 'bytes_per_interval': 'bytes' divided by the number of intervals.
+            - 'prefix_counts': the number of exclusion intervals for each interval id prefix (run uid).
             - 'class': a string representation of the class of the active exclusion list.
     """
     _log.info(f'Exclusion List Statistics')
     return active_exclusion_list.stats()
 
 
+@app.get("/exclusionms/ready", status_code=200, tags=['Exclusion List'])
+async def get_ready():
+    """
+    Reports whether the active exclusion list is ready to be queried. Returns a status code of 200 when ready and
+    503 while a list is loading (e.g. during the warm start after a restart) or after a failed load.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'status': 'ready', 'loading' or 'failed'.
+            - 'exid': the ID of the saved exclusion list the active list corresponds to, if any.
+            - 'dirty': whether the active list has unsaved changes.
+            - 'loading_exid': the ID of the exclusion list being (or last) loaded.
+            - 'bytes_loaded' / 'total_bytes' / 'progress': the progress of the current or last load.
+            - 'elapsed': the duration of the current or last load in seconds.
+            - 'error': the error of the last failed load.
+
+        A replica is not ready before it loaded a snapshot of its primary.
+    """
+    progress = active_list_state.progress()
+    if active_list_state.status != 'ready' or (replication_state.is_replica and replication_state.last_contact is None):
+        return JSONResponse(status_code=503, content=progress)
+    return progress
+
+
 @app.get("/exclusionms/file", status_code=200, tags=['Exclusion List'])
 async def get_files() -> List[str]:
     """
@@ -172,6 +539,50 @@ async def get_files() -> List[str]:
     return saved_files_names
 
 
+@app.get("/exclusionms/catalog", status_code=200, tags=['Exclusion List'])
+async def get_catalog() -> Dict[str, CatalogEntry]:
+    """
+    Retrieves the catalog of saved exclusion lists from memory. If successful, returns a status code of 200.
+
+    Returns:
+        A dictionary mapping each saved exclusion list ID to its catalog entry, containing:
+            - 'interval_count': the number of exclusion intervals in the saved list.
+            - 'byte_size': the size of the saved file in bytes.
+            - 'bounding_box': the [min, max] bounds covered by the intervals for mass, rt, ook0 and intensity.
+            - 'charge_counts': a histogram of interval charges.
+            - 'created' / 'updated': when the list was first and last saved (UTC).
+            - 'format_version': the version of the saved file format.
+            - 'mtime': the modification time of the saved file, used to detect files changed outside the server.
+
+    Notes:
+        Saved files found at startup are read in the background to fill in their metadata. Until then, their entries
+        only contain 'byte_size' and timestamps.
+    """
+    _log.info(f'Exclusion List Catalog')
+    return catalog.entries
+
+
+@app.get("/exclusionms/catalog/{exid}", status_code=200, tags=['Exclusion List'])
+async def get_catalog_entry(exid: str) -> CatalogEntry:
+    """
+    Retrieves the catalog entry of the saved exclusion list with the given ID. If successful, returns a status code
+    of 200.
+
+    Args:
+        exid: A string representing the ID of the saved exclusion list.
+
+    Returns:
+        The catalog entry of the saved exclusion list.
+
+    Raises:
+        HTTPException 404: If the exclusion list with the given ID is not found.
+    """
+    _log.info(f'Exclusion List Catalog Entry')
+    if exid not in catalog.entries:
+        raise HTTPException(status_code=404, detail=f"exclusion list with name: {exid} not found.")
+    return catalog.entries[exid]
+
+
 @app.post("/exclusionms/save", status_code=200, tags=['Exclusion List'])
 async def save(exid: str):
     """
@@ -189,6 +600,7 @@ async def save(exid: str):
     Notes:
         The saved file will be located in the data/pickles directory with the name '<exid>.pkl'.
         If a file with the same name already exists, it will be overwritten without warning.
+        The lock is only held while taking a snapshot of the list; the file is written after it is released.
     """
     pickle_path = get_pickle_path(exid)
 
@@ -197,7 +609,7 @@ async def save(exid: str):
         _log.warning(f'{pickle_path} already exists. Overriding.')
 
     try:
-        active_exclusion_list.save(pickle_path)
+        await save_exclusion_list(exid)
     except Exception as e:
         _log.error(f'Error when saving exclusion list: {e}')
         raise HTTPException(status_code=500, detail='Error saving active exclusion list.')
@@ -215,21 +627,37 @@ async def load(exid: str):
         None.
 
     Raises:
-        HTTPException: If the exclusion list with the given ID is not found (status code 404) or there is an error when loading it (status code 500).
+        HTTPException: If the exclusion list with the given ID is not found (status code 404), was saved with a newer
+        format version (status code 409) or there is an error when loading it (status code 500).
 
     Notes:
         The file to load is located in the data/pickles directory with the name '<exid>.pkl'.
+        The catalog entry is checked before the active exclusion list is replaced.
+        If the list is already being loaded (e.g. by the warm start) the call waits for that load, and if the active
+        list is an unmodified copy of the saved list it is not loaded again.
     """
+    global load_task
+    check_writable()
     pickle_path = get_pickle_path(exid)
 
     _log.info(f'Load Exclusion List')
     if not os.path.exists(pickle_path):
         raise HTTPException(status_code=404, detail=f"exclusion list with name: {exid} not found.")
 
-    try:
-        active_exclusion_list.load(pickle_path)
-    except Exception as e:
-        _log.error(f'Exception when loading exclusion list: {e}', exc_info=True)
+    entry = catalog.entries.get(exid)
+    if entry is not None and entry.format_version is not None and entry.format_version > EXCLUSION_LIST_FORMAT_VERSION:
+        raise HTTPException(status_code=409, detail=f"exclusion list with name: {exid} has format version "
+                                                    f"{entry.format_version}, expected {EXCLUSION_LIST_FORMAT_VERSION}.")
+
+    is_loading = active_list_state.status == 'loading' and active_list_state.loading_exid == exid
+    if not is_loading:
+        if active_list_state.is_current(exid, os.path.getmtime(pickle_path)):
+            _log.info(f'Exclusion list {exid} is already active')
+            return
+        load_task = asyncio.create_task(load_exclusion_list(exid))
+
+    await asyncio.shield(load_task)
+    if active_list_state.status == 'failed':
         raise HTTPException(status_code=500, detail='Error loading active exclusion list.')
 
 
@@ -242,8 +670,12 @@ async def clear() -> int:
         An integer representing the number of exclusion intervals that were cleared.
     """
     _log.info(f'Delete Active Exclusion List')
-    num_intervals_cleared = len(active_exclusion_list)
-    active_exclusion_list.clear()
+    check_writable()
+    async with lock:
+        num_intervals_cleared = len(active_exclusion_list)
+        active_exclusion_list.clear()
+        active_list_state.set_active(None)
+        mutation_log.append('clear')
     return num_intervals_cleared
 
 
@@ -277,6 +709,62 @@ async def delete(exid: str):
         _log.error(f'Error when deleting exclusion list: {e}')
         raise HTTPException(status_code=500, detail='Error deleting exclusion list.')
 
+    catalog.remove(exid)
+
+
+@app.post("/exclusionms/combine", status_code=200, tags=['Exclusion List'])
+async def combine(operation: str, exid: str, exids: List[str] = Query(...), dedup: str = 'geometry') -> Dict:
+    """
+    Combines saved exclusion lists with a set operation and saves the result with the given ID. If successful,
+    returns a status code of 200.
+
+    Args:
+        operation: 'union', 'difference' (the first list minus all others) or 'intersection'.
+        exid: A string representing the ID to use for the combined exclusion list.
+        exids: The IDs of the saved exclusion lists to combine, in order.
+        dedup: 'geometry' if intervals with the same charge, bounds and exclusion flag are the same interval, or
+            'id' if intervals with the same interval_id are.
+
+    Returns:
+        A dictionary containing the ID and interval count of the combined exclusion list, and the interval counts of
+        the combined lists.
+
+    Raises:
+        HTTPException 400: If the operation or dedup mode is unknown.
+        HTTPException 404: If one of the exclusion lists to combine is not found.
+        HTTPException 500: If there is an error when combining the exclusion lists.
+
+    Notes:
+        The lists are merged from their saved files in a worker thread, without loading them into the active exclusion
+        list, which is neither locked nor changed. Of intervals which are the same, the one of the first list is kept.
+        If a file with the same name as the combined list already exists, it will be overwritten without warning.
+    """
+    _log.info(f'Combine Exclusion Lists')
+    if operation not in OPERATIONS:
+        raise HTTPException(status_code=400, detail=f'Unknown operation: {operation}, expected one of {OPERATIONS}.')
+    if dedup not in DEDUP_MODES:
+        raise HTTPException(status_code=400, detail=f'Unknown dedup mode: {dedup}, expected one of {DEDUP_MODES}.')
+
+    input_paths = [get_pickle_path(input_exid) for input_exid in exids]
+    for input_exid, input_path in zip(exids, input_paths):
+        if not os.path.exists(input_path):
+            raise HTTPException(status_code=404, detail=f"exclusion list with name: {input_exid} not found.")
+
+    pickle_path = get_pickle_path(exid)
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, combine_files, operation, input_paths,
+                                                                  pickle_path, dedup)
+    except Exception as e:
+        _log.error(f'Error when combining exclusion lists: {e}', exc_info=True)
+        raise HTTPException(status_code=500, detail='Error combining exclusion lists.')
+
+    try:
+        catalog.update(exid, pickle_path, result['summary'])
+    except Exception as e:
+        _log.error(f'Error when updating exclusion list catalog: {e}', exc_info=True)
+
+    return {'exid': exid, 'interval_count': result['summary']['interval_count'], 'input_counts': result['input_counts']}
+
 
 @app.post("/exclusionms/intervals/search", response_model=List[List[ExclusionInterval]], status_code=200,
           tags=["Intervals"])
@@ -297,7 +785,8 @@ async def search_intervals(exclusion_intervals: List[ExclusionInterval]):
         its maximum bound)
 
     Notes:
-        The function acquires a lock on the active exclusion list before querying it to ensure thread safety.
+        The function acquires a lock on the active exclusion list before querying it to ensure thread safety. The
+        intervals are searched in chunks, releasing the lock between chunks for real-time requests.
     """
     for exclusion_interval in exclusion_intervals:
         if not exclusion_interval.is_valid():
@@ -305,29 +794,76 @@ async def search_intervals(exclusion_intervals: List[ExclusionInterval]):
                                 detail=f"exclusion interval invalid. Check min/max bounds. {exclusion_interval}")
 
     intervals = []
-    for exclusion_interval in exclusion_intervals:
-        async with lock:
-            intervals.append(active_exclusion_list.query_by_interval(exclusion_interval))
+    async for chunk in iter_chunks(exclusion_intervals):
+        async with timed_lock(lock, Priority.BULK):
+            with timed('query'):
+                intervals.extend(active_exclusion_list.query_by_interval(interval) for interval in chunk)
 
     return intervals
 
 
+@app.post("/exclusionms/intervals/explain", status_code=200, tags=["Intervals"])
+async def explain_intervals(exclusion_intervals: List[ExclusionInterval]) -> List[Dict]:
+    """
+    Traces the search of each given exclusion interval in the active exclusion list (see /exclusionms/intervals/search).
+    If successful, returns a status code of 200.
+
+    Args:
+        exclusion_intervals: A list of ExclusionInterval objects representing the intervals to trace.
+
+    Returns:
+        A list of traces, one per interval, containing how the candidate intervals were selected ('id', 'mass_bin' or
+        'scan'), the number of intervals before and after each stage ('candidates', 'charge', 'mass', 'rt', 'ook0',
+        'intensity'), how many survivors have a null bound, the time spent per stage in milliseconds, and the number
+        of matching intervals.
+
+    Raises:
+        HTTPException 400: If any of the input exclusion intervals is invalid (i.e. its minimum bound is greater than
+        its maximum bound)
+
+    Notes:
+        The traces are added to the aggregate at /admin/query_traces.
+    """
+    for exclusion_interval in exclusion_intervals:
+        if not exclusion_interval.is_valid():
+            raise HTTPException(status_code=400,
+                                detail=f"exclusion interval invalid. Check min/max bounds. {exclusion_interval}")
+
+    traces = []
+    async for chunk in iter_chunks(exclusion_intervals):
+        async with timed_lock(lock, Priority.BULK):
+            with timed('query'):
+                traces.extend(active_exclusion_list.explain_interval(interval) for interval in chunk)
+    for trace in traces:
+        query_traces.record(trace)
+    return traces
+
+
 async def process_intervals(exclusion_intervals: List[ExclusionInterval]):
-    for interval in exclusion_intervals:
+    async for chunk in iter_chunks(exclusion_intervals):
         async with lock:
-            try:
-                active_exclusion_list.add(interval)
-            except Exception as e:
-                _log.error(f'Error when adding interval: {e}', exc_info=True)
+            added_intervals = []
+            for interval in chunk:
+                try:
+                    active_exclusion_list.add(interval)
+                    active_list_state.dirty = True
+                    added_intervals.append(interval)
+                except Exception as e:
+                    _log.error(f'Error when adding interval: {e}', exc_info=True)
+            if added_intervals:
+                mutation_log.append('add', intervals=added_intervals)
 
 
 @app.post("/exclusionms/intervals", response_model=None, status_code=200, tags=["Intervals"])
-async def add_intervals(exclusion_intervals: List[ExclusionInterval], background_tasks: BackgroundTasks):
+async def add_intervals(exclusion_intervals: List[ExclusionInterval], background_tasks: BackgroundTasks,
+                        wait: bool = False):
     """
     Adds the given exclusion intervals to the active exclusion list. If successful, returns a status code of 200.
 
     Args:
         exclusion_intervals: A list of ExclusionInterval objects representing the intervals to add.
+        wait: Whether to add the intervals before responding instead of in the background (default: False), so that
+            the X-Exclusion-Seq header of the response covers them (for read-your-writes on replicas).
 
     Returns:
         None.
@@ -336,17 +872,22 @@ async def add_intervals(exclusion_intervals: List[ExclusionInterval], background
     Raises:
         HTTPException 400: If any of the input exclusion intervals is invalid (i.e. its minimum bound is greater than
         its maximum bound)
+        HTTPException 403: If this server is a read-only replica.
 
     Notes:
         The function acquires a lock on the active exclusion list before adding intervals to ensure thread safety.
+        The intervals are added in chunks, releasing the lock between chunks for real-time requests.
     """
-
+    check_writable()
     for exclusion_interval in exclusion_intervals:
         if not exclusion_interval.is_valid():
             raise HTTPException(status_code=400,
                                 detail=f"exclusion interval invalid. Check min/max bounds. {exclusion_interval}")
 
-    background_tasks.add_task(process_intervals, exclusion_intervals)
+    if wait:
+        await process_intervals(exclusion_intervals)
+    else:
+        background_tasks.add_task(process_intervals, exclusion_intervals)
 
 
 @app.delete("/exclusionms/intervals", response_model=List[List[ExclusionInterval]], status_code=200, tags=["Intervals"])
@@ -364,50 +905,119 @@ async def delete_intervals(exclusion_intervals: List[ExclusionInterval]):
     Raises:
         HTTPException 400: If any of the input exclusion intervals is invalid (i.e. its minimum bound is greater than
         its maximum bound)
+        HTTPException 403: If this server is a read-only replica.
 
     Notes:
         The function acquires a lock on the active exclusion list before deleting intervals to ensure thread safety.
+        The intervals are deleted in chunks, releasing the lock between chunks for real-time requests.
     """
+    check_writable()
     for exclusion_interval in exclusion_intervals:
         if not exclusion_interval.is_valid():
             raise HTTPException(status_code=400,
                                 detail=f"exclusion interval invalid. Check min/max bounds. {exclusion_interval}")
 
     deleted_intervals = []
-    for exclusion_interval in exclusion_intervals:
-        async with lock:
-            deleted_intervals.append(active_exclusion_list.remove(exclusion_interval))
+    async for chunk in iter_chunks(exclusion_intervals):
+        async with timed_lock(lock, Priority.BULK):
+            with timed('query'):
+                removed_intervals = [active_exclusion_list.remove(interval) for interval in chunk]
+            deleted_intervals.extend(removed_intervals)
+            removed_intervals = [interval for intervals in removed_intervals for interval in intervals]
+            if removed_intervals:
+                active_list_state.dirty = True
+                mutation_log.append('remove', intervals=removed_intervals)
 
     return deleted_intervals
 
 
-def apply_offset(point: ExclusionPoint, offset: Offset):
+@app.delete("/exclusionms/intervals/prefix", response_model=int, status_code=200, tags=["Intervals"])
+async def delete_intervals_by_prefix(prefix: str):
     """
-    Applies the given offset to the specified ExclusionPoint object.
+    Deletes all intervals whose interval_id prefix matches the given prefix (e.g. every dynamic exclusion interval of
+    a run, whose ids are '<uid>_<ms2_spectrum_id>'). If successful, returns a status code of 200.
 
     Args:
-        point: An ExclusionPoint object representing the point to apply the offset to.
-        offset: An Offset object representing the offset to apply to the ExclusionPoint object.
+        prefix: A string representing the interval id prefix (everything before the last underscore).
 
     Returns:
-        None.
+        An integer representing the number of exclusion intervals that were deleted.
 
     Notes:
-        The function modifies the ExclusionPoint object in place. If any of the offset values are None, they are not
-        applied to the ExclusionPoint object.
+        The intervals are removed in a single bulk operation while holding the lock on the active exclusion list.
+    """
+    _log.info(f'Delete Intervals by prefix: {prefix}')
+    check_writable()
+    async with timed_lock(lock):
+        with timed('query'):
+            num_removed = active_exclusion_list.remove_by_prefix(prefix)
+        if num_removed > 0:
+            active_list_state.dirty = True
+            mutation_log.append('remove_prefix', prefix=prefix)
+    return num_removed
+
+
+T = TypeVar('T')
+
+
+async def trace_points(points: List[ExclusionPoint]):
+    """
+    Traces sampled points of live queries and records the traces (see /admin/query_traces). The points are traced in
+    the background at bulk priority, after the query released the lock, so that tracing does not delay real-time
+    queries.
     """
-    if point.mass:
-        point.mass += offset.mass
-    if point.rt:
-        point.rt += offset.rt
-    if point.ook0:
-        point.ook0 += offset.ook0
-    if point.intensity:
-        point.intensity += offset.intensity
+    # not timed_lock: the Server-Timing header of the request was already sent
+    async with lock:
+        traces = [active_exclusion_list.explain_point(point) for point in points]
+    for trace in traces:
+        query_traces.record(trace)
+
+
+async def query_with_deadline(query: Callable[[], T], fallback: T, priority: Priority, deadline_ms: Optional[float],
+                              response: Response, points: Optional[List[ExclusionPoint]] = None) -> T:
+    """
+    Runs a query on the active exclusion list with the given priority.
+
+    Args:
+        query: A function querying the active exclusion list, called while holding the lock.
+        fallback: The answer returned if the deadline passes before the lock is acquired.
+        priority: The priority class of the request.
+        deadline_ms: The time budget of the request in milliseconds (from the X-Deadline-Ms header), or None.
+        response: The response, whose X-Deadline-Status header is set to 'shed' or 'late' when the deadline is missed.
+        points: The queried points, of which a sample is traced if trace sampling is enabled (see trace_points). The
+            points of real-time requests also advance the hot window of the list (see move_hot_window).
+
+    Returns:
+        The result of the query, or the fallback if the request was shed.
+    """
+    deadline = get_deadline(deadline_ms)
+    try:
+        async with timed_lock(lock, priority, deadline):
+            with timed('query'):
+                result = query()
+            if points is not None:
+                rts = [point.rt for point in points if point.rt is not None]
+                if priority == Priority.REALTIME and rts and active_exclusion_list.advance_hot_window(max(rts)):
+                    hot_window_event.set()
+    except DeadlineExceeded:
+        response.headers[DEADLINE_STATUS_HEADER] = 'shed'
+        return fallback
+
+    sampled_points = query_traces.sample(points) if points is not None else []
+    if sampled_points:
+        task = asyncio.create_task(trace_points(sampled_points))
+        trace_tasks.add(task)
+        task.add_done_callback(trace_tasks.discard)
+
+    if deadline is not None and time.monotonic() > deadline:
+        lock.record_late(priority)
+        response.headers[DEADLINE_STATUS_HEADER] = 'late'
+    return result
 
 
 @app.post("/exclusionms/points/search", response_model=List[List[ExclusionInterval]], status_code=200, tags=["Points"])
-async def search_points(exclusion_points: list[ExclusionPoint]):
+async def search_points(exclusion_points: list[ExclusionPoint], response: Response,
+                        x_deadline_ms: Optional[float] = Header(None)):
     """
     Searches the active exclusion list for intervals containing the specified ExclusionPoint objects.
     If successful, returns a status code of 200.
@@ -421,16 +1031,54 @@ async def search_points(exclusion_points: list[ExclusionPoint]):
     Notes:
         The function applies any offset values specified in the ExclusionPoint objects before searching the exclusion list.
         It acquires a lock on the active exclusion list before performing the search to ensure thread safety.
+        If the X-Deadline-Ms header is set and the deadline passes before the lock is acquired, an empty list is
+        returned for each point.
     """
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [list(active_exclusion_list.query_by_point(point)) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [list(active_exclusion_list.query_by_point(point)) for point in exclusion_points],
+        [[] for _ in exclusion_points], Priority.INTERACTIVE, x_deadline_ms, response, exclusion_points)
+
+
+@app.post("/exclusionms/points/explain", status_code=200, tags=["Points"])
+async def explain_points(exclusion_points: list[ExclusionPoint]) -> List[Dict]:
+    """
+    Traces the search of each specified ExclusionPoint in the active exclusion list. If successful, returns a status
+    code of 200.
+
+    Args:
+        exclusion_points: A list of ExclusionPoint objects representing the points to trace.
+
+    Returns:
+        A list of traces, one per point, containing:
+            - 'prefilter': whether the prefilter 'rejected' or 'passed' the point, or was 'skipped'.
+            - 'index' and 'candidates_from': the index ('hot' or 'full') and how the candidate intervals were selected
+              from it ('mass_bin', 'wide' or 'scan').
+            - 'stages': for each stage ('prefilter', 'candidates', 'charge', 'mass', 'rt', 'ook0', 'intensity'), the
+              number of intervals before and after it, how many survivors passed it only because of a null bound, and
+              the time spent in milliseconds.
+            - 'matched' and 'status': the number of intervals containing the point and its IntervalStatus.
+
+    Notes:
+        The offset is applied to the points as for other point queries. Explaining a point does not change the list
+        (the hot window is not moved). The traces are added to the aggregate at /admin/query_traces.
+    """
+    for point in exclusion_points:
+        apply_offset(point, offset)
+
+    async with timed_lock(lock, Priority.INTERACTIVE):
+        with timed('query'):
+            traces = [active_exclusion_list.explain_point(point) for point in exclusion_points]
+    for trace in traces:
+        query_traces.record(trace)
+    return traces
 
 
 @app.post("/exclusionms/points/exclusion_search", response_model=List[bool], status_code=200, tags=["Points"])
-async def exclusion_search_points(exclusion_points: list[ExclusionPoint]):
+async def exclusion_search_points(exclusion_points: list[ExclusionPoint], response: Response,
+                                  x_deadline_ms: Optional[float] = Header(None)):
     """
     Checks whether each specified ExclusionPoint is excluded by the active exclusion list.
     If successful, returns a status code of 200.
@@ -443,26 +1091,31 @@ async def exclusion_search_points(exclusion_points: list[ExclusionPoint]):
 
     Notes:
         The function applies any offset values specified in the ExclusionPoint objects before checking exclusion.
+        Point checks are real-time requests, scheduled and shed as described in scheduling.py.
     """
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.is_excluded(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.is_excluded(point) for point in exclusion_points],
+        [False] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response, exclusion_points)
 
 
 @app.post("/exclusionms/points/exclusion_search_batch", response_model=List[bool], status_code=200, tags=["Points"])
-async def exclusion_search_batch(batch_msg: ExclusionPointBatchMessage):
+async def exclusion_search_batch(batch_msg: ExclusionPointBatchMessage, response: Response,
+                                 x_deadline_ms: Optional[float] = Header(None)):
     exclusion_points = batch_msg.construct_points()
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.is_excluded(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.is_excluded(point) for point in exclusion_points],
+        [False] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response, exclusion_points)
 
 
 @app.post("/exclusionms/points/inclusion_search", response_model=List[bool], status_code=200, tags=["Points"])
-async def inclusion_search_points(exclusion_points: list[ExclusionPoint]):
+async def inclusion_search_points(exclusion_points: list[ExclusionPoint], response: Response,
+                                  x_deadline_ms: Optional[float] = Header(None)):
     """
     Checks whether each specified ExclusionPoint is excluded by the active exclusion list.
     If successful, returns a status code of 200.
@@ -475,26 +1128,31 @@ async def inclusion_search_points(exclusion_points: list[ExclusionPoint]):
 
     Notes:
         The function applies any offset values specified in the ExclusionPoint objects before checking exclusion.
+        Point checks are real-time requests, scheduled and shed as described in scheduling.py.
     """
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.is_included(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.is_included(point) for point in exclusion_points],
+        [False] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response, exclusion_points)
 
 
 @app.post("/exclusionms/points/inclusion_search_batch", response_model=List[bool], status_code=200, tags=["Points"])
-async def inclusion_search_batch(batch_msg: ExclusionPointBatchMessage):
+async def inclusion_search_batch(batch_msg: ExclusionPointBatchMessage, response: Response,
+                                 x_deadline_ms: Optional[float] = Header(None)):
     exclusion_points = batch_msg.construct_points()
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.is_included(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.is_included(point) for point in exclusion_points],
+        [False] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response, exclusion_points)
 
 
 @app.post("/exclusionms/points/status_search", response_model=List[int], status_code=200, tags=["Points"])
-async def status_search_points(exclusion_points: list[ExclusionPoint]):
+async def status_search_points(exclusion_points: list[ExclusionPoint], response: Response,
+                               x_deadline_ms: Optional[float] = Header(None)):
     """
     Checks whether each specified ExclusionPoint is excluded by the active exclusion list.
     If successful, returns a status code of 200.
@@ -507,22 +1165,180 @@ async def status_search_points(exclusion_points: list[ExclusionPoint]):
 
     Notes:
         The function applies any offset values specified in the ExclusionPoint objects before checking exclusion.
+        Point checks are real-time requests, scheduled and shed as described in scheduling.py.
     """
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.point_status(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.point_status(point) for point in exclusion_points],
+        [IntervalStatus.NO_INTERVALS_FOUND] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response,
+        exclusion_points)
 
 
 @app.post("/exclusionms/points/status_search_batch", response_model=List[int], status_code=200, tags=["Points"])
-async def status_search_batch(batch_msg: ExclusionPointBatchMessage):
+async def status_search_batch(batch_msg: ExclusionPointBatchMessage, response: Response,
+                              x_deadline_ms: Optional[float] = Header(None)):
     exclusion_points = batch_msg.construct_points()
     for point in exclusion_points:
         apply_offset(point, offset)
 
-    async with lock:
-        return [active_exclusion_list.point_status(point) for point in exclusion_points]
+    return await query_with_deadline(
+        lambda: [active_exclusion_list.point_status(point) for point in exclusion_points],
+        [IntervalStatus.NO_INTERVALS_FOUND] * len(exclusion_points), Priority.REALTIME, x_deadline_ms, response,
+        exclusion_points)
+
+
+def get_job(job_id: str) -> BulkJob:
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail=f'Job {job_id} not found.')
+    return jobs[job_id]
+
+
+@app.post("/exclusionms/jobs/status_search", status_code=202, tags=["Jobs"])
+async def create_status_search_job(request: Request, workers: Optional[int] = None) -> Dict:
+    """
+    Creates a job which gets the IntervalStatus of a large batch of points in the background. The points are uploaded
+    as a csv stream in the request body, one 'charge,mass,rt,ook0,intensity' line per point (with an optional header
+    line, and an empty value or None for null values). If successful, returns a status code of 202.
+
+    Args:
+        workers: An integer representing the number of worker processes (default: the number of cores).
+
+    Returns:
+        The progress of the job (see /exclusionms/jobs/{job_id}), including its 'job_id'.
+
+    Notes:
+        The job runs on a frozen snapshot of the active exclusion list and offset, taken when the upload is complete;
+        later changes to the active list do not affect it. The lock is only held while taking the snapshot, and the
+        points are never held in memory as a whole: they are checked in chunks by a pool of worker processes.
+    """
+    _log.info(f'Create status search job')
+    os.makedirs(JOBS_FOLDER, exist_ok=True)
+    job = BulkJob.create(JOBS_FOLDER, operation='status')
+    jobs[job.job_id] = job
+
+    loop = asyncio.get_running_loop()
+    try:
+        with open(job.input_path, 'wb') as f:
+            async for chunk in request.stream():
+                await loop.run_in_executor(None, f.write, chunk)
+        job.points_total = await loop.run_in_executor(None, count_points, job.input_path)
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+        raise
+
+    async with timed_lock(lock, Priority.BULK):
+        state = active_exclusion_list.to_state()
+        job_offset = dataclasses.asdict(offset)
+
+    num_workers = max(1, min(workers or JOB_WORKERS, JOB_WORKERS))
+    job.queue(num_workers)
+    job_tasks[job.job_id] = asyncio.create_task(run_job(job, state, job_offset))
+    job_tasks[job.job_id].add_done_callback(lambda _: job_tasks.pop(job.job_id, None))
+    return job.progress()
+
+
+@app.get("/exclusionms/jobs", status_code=200, tags=["Jobs"])
+async def get_jobs() -> List[Dict]:
+    """
+    Retrieves the progress of all jobs. If successful, returns a status code of 200.
+    """
+    return [job.progress() for job in jobs.values()]
+
+
+@app.get("/exclusionms/jobs/{job_id}", status_code=200, tags=["Jobs"])
+async def get_job_progress(job_id: str) -> Dict:
+    """
+    Retrieves the progress of a job. If successful, returns a status code of 200.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'job_id' / 'operation': the ID and the point check of the job.
+            - 'status': 'uploading', 'queued', 'running', 'done', 'cancelled' or 'failed'.
+            - 'points_total' / 'points_done' / 'progress': the number of points uploaded and checked.
+            - 'workers': the number of worker processes.
+            - 'elapsed' / 'points_per_second': the duration and throughput of the job.
+            - 'error': the error of a failed job.
+
+    Raises:
+        HTTPException 404: If the job is not found.
+    """
+    return get_job(job_id).progress()
+
+
+@app.get("/exclusionms/jobs/{job_id}/results", status_code=200, tags=["Jobs"])
+async def get_job_results(job_id: str):
+    """
+    Downloads the results of a job as a stream, one IntervalStatus per line in the order of the uploaded points. The
+    download can start while the job is running: it follows the job until it finishes. If successful, returns a
+    status code of 200.
+
+    Raises:
+        HTTPException 404: If the job is not found.
+        HTTPException 409: If the job is still uploading, or failed.
+    """
+    job = get_job(job_id)
+    if job.status in ('uploading', 'failed'):
+        raise HTTPException(status_code=409, detail=f'Job {job_id} is {job.status}.')
+
+    async def iter_results():
+        loop = asyncio.get_running_loop()
+        with open(job.output_path, 'rb') as f:
+            num_bytes_sent = 0
+            while True:
+                finished = job.finished
+                if job.bytes_done > num_bytes_sent:
+                    data = await loop.run_in_executor(None, f.read, job.bytes_done - num_bytes_sent)
+                    num_bytes_sent += len(data)
+                    yield data
+                elif finished:
+                    break
+                else:
+                    await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(iter_results(), media_type='text/plain')
+
+
+@app.post("/exclusionms/jobs/{job_id}/cancel", status_code=200, tags=["Jobs"])
+async def cancel_job(job_id: str) -> Dict:
+    """
+    Cancels a running job. The results written so far remain available. If successful, returns a status code of 200.
+
+    Raises:
+        HTTPException 404: If the job is not found.
+    """
+    _log.info(f'Cancel job {job_id}')
+    job = get_job(job_id)
+    task = job_tasks.get(job_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return job.progress()
+
+
+@app.delete("/exclusionms/jobs/{job_id}", status_code=200, tags=["Jobs"])
+async def delete_job(job_id: str):
+    """
+    Cancels a job if it is running and deletes it with its files. If successful, returns a status code of 200.
+
+    Raises:
+        HTTPException 404: If the job is not found.
+    """
+    _log.info(f'Delete job {job_id}')
+    await cancel_job(job_id)
+    jobs.pop(job_id).remove_files()
+
+
+@app.on_event("shutdown")
+async def cancel_jobs():
+    """
+    Cancels the running jobs before the server stops.
+    """
+    for task in list(job_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*job_tasks.values(), return_exceptions=True)
 
 
 @app.get("/exclusionms/offset", status_code=200, tags=['Offset'])
@@ -552,23 +1368,22 @@ async def update_offset(mass: float = 0, rt: float = 0, ook0: float = 0, intensi
         The function updates the global `offset` object with the specified offset values.
     """
     _log.info(f'Update offset')
+    check_writable()
     offset.mass = mass
     offset.rt = rt
     offset.ook0 = ook0
     offset.intensity = intensity
+    mutation_log.append('offset', offset=dataclasses.asdict(offset))
 
 
-@app.get('/logs/entries')
-async def get_log_entries(num_entries: int = 500):
+def read_log_entries(num_entries: int) -> List[Dict]:
     log_file = 'api_calls.log'
     entries = []
 
     if os.path.exists(log_file):
         with open(log_file, 'r') as f:
-            lines = f.readlines()
-
-        # Get the last num_entries lines (log entries)
-        last_n_lines = lines[-num_entries:]
+            # Get the last num_entries lines (log entries)
+            last_n_lines = deque(f, maxlen=num_entries)
 
         for line in last_n_lines:
             try:
@@ -580,6 +1395,97 @@ async def get_log_entries(num_entries: int = 500):
     return entries
 
 
+@app.get("/exclusionms/sync/snapshot", status_code=200, tags=['Sync'])
+async def get_snapshot() -> Dict:
+    """
+    Retrieves a snapshot of the active exclusion list for a client replica. If successful, returns a status code of
+    200. The replica then applies the mutations made after the snapshot from /exclusionms/sync/mutations.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'epoch': the ID of the mutation log, which changes when the server restarts.
+            - 'seq': the sequence number of the last mutation included in the snapshot.
+            - 'offset': the offset applied to points.
+            - 'intervals': the intervals as columns, one list per ExclusionInterval field (interval_id, charge,
+              exclusion and the min/max bounds), with null for unbounded bounds.
+
+    Notes:
+        The lock is only held while copying the list; the snapshot is serialized after it is released.
+    """
+    _log.info(f'Sync snapshot')
+    async with timed_lock(lock, Priority.BULK):
+        state = active_exclusion_list.to_state()
+        seq = mutation_log.seq
+        snapshot_offset = dataclasses.asdict(offset)
+
+    intervals = await asyncio.get_running_loop().run_in_executor(None, ExclusionList.state_to_columns, state)
+    return {'epoch': mutation_log.epoch, 'seq': seq, 'offset': snapshot_offset, 'intervals': intervals}
+
+
+@app.get("/exclusionms/sync/mutations", status_code=200, tags=['Sync'])
+async def get_mutations(since: int, timeout: float = 0, epoch: Optional[str] = None, replica_id: Optional[str] = None):
+    """
+    Retrieves the mutations of the active exclusion list made after the given sequence number. If there are none, the
+    call waits up to timeout seconds for one (long polling). If successful, returns a status code of 200.
+
+    Args:
+        since: An integer representing the sequence number of the last mutation applied by the client.
+        timeout: A float representing the maximum number of seconds to wait for a mutation (default: 0, max: 60).
+        epoch: The epoch of the snapshot the client started from. Sequence numbers of another epoch (from before a
+            restart of the server) are rejected with 410.
+        replica_id: The ID of the polling replica, reported by /exclusionms/replication.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'epoch': the ID of the mutation log.
+            - 'seq': the sequence number of the last mutation.
+            - 'mutations': the mutations after since, each with its 'seq', 'op' ('add', 'remove', 'remove_prefix',
+              'clear', 'reset' or 'offset') and its 'intervals', 'prefix' or 'offset'.
+
+    Raises:
+        HTTPException 410: If the mutations after since are no longer kept, or since is from another epoch. The client
+        must fetch a new snapshot.
+    """
+    if replica_id is not None:
+        replication_state.record_poll(replica_id, since)
+    if epoch is not None and epoch != mutation_log.epoch:
+        raise HTTPException(status_code=410, detail=f'epoch {epoch} is no longer available.')
+    await mutation_log.wait(since, min(max(timeout, 0), 60))
+    mutations = mutation_log.since(since)
+    if mutations is None:
+        raise HTTPException(status_code=410, detail=f'mutations after {since} are no longer available.')
+    return {'epoch': mutation_log.epoch, 'seq': mutation_log.seq, 'mutations': mutations}
+
+
+@app.get("/exclusionms/replication", status_code=200, tags=['Sync'])
+async def get_replication() -> Dict:
+    """
+    Retrieves the replication role and state of the server. If successful, returns a status code of 200.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'role': 'primary', or 'replica' if the server was started with EXCLUSIONMS_PRIMARY.
+            - 'seq': the sequence number of the last mutation applied (the primary's sequence number on a replica).
+            - 'replicas': the replicas following this server (by replica_id), with the sequence number they last
+              polled from, their lag in mutations and the age of their last poll in seconds.
+        On a replica, also:
+            - 'primary' / 'replica_id': the url of the primary and the id of this replica.
+            - 'epoch': the epoch of the primary's mutation log the replica follows.
+            - 'status': 'syncing' (fetching a snapshot), 'streaming' or 'error'.
+            - 'primary_seq' / 'lag': the primary's sequence number as of the last poll, and the number of mutations
+              the replica is behind it.
+            - 'last_contact_age': seconds since the last successful poll of the primary.
+            - 'error': the last replication error.
+    """
+    return replication_state.report(mutation_log.seq)
+
+
+@app.get('/logs/entries')
+async def get_log_entries(num_entries: int = 500):
+    # The log file is read in a worker thread so that real-time requests are not blocked
+    return await asyncio.get_running_loop().run_in_executor(None, read_log_entries, num_entries)
+
+
 def get_installed_packages():
     result = subprocess.run(['pip', 'list'], stdout=subprocess.PIPE)
     return result.stdout.decode('utf-8')
@@ -589,3 +1495,123 @@ async def get_version():
     ipackages = get_installed_packages()
     return ipackages
 
+
+@app.get("/admin/scheduler", status_code=200, tags=['Admin'])
+async def get_scheduler() -> Dict:
+    """
+    Retrieves the state of the lock on the active exclusion list and the counters of each priority class
+    (REALTIME, INTERACTIVE, BULK). If successful, returns a status code of 200.
+
+    Returns:
+        A dictionary containing the following keys and values:
+            - 'locked': whether the lock is held.
+            - 'waiting': the number of requests of each priority class waiting for the lock.
+            - 'stats': for each priority class, the number of admitted, shed and late requests and the total and
+              maximum time spent waiting for the lock (seconds).
+    """
+    return lock.report()
+
+
+@app.get("/admin/query_traces", status_code=200, tags=['Admin'])
+async def get_query_traces() -> Dict:
+    """
+    Retrieves aggregate counters over the recent query traces: the explained points and intervals, and the sampled
+    live point queries if EXCLUSIONMS_TRACE_SAMPLE_INTERVAL is set. If successful, returns a status code of 200.
+
+    Returns:
+        A dictionary containing the window size, sample interval and number of live points seen, and for each kind of
+        query ('point', 'interval'):
+            - 'queries': the number of traced queries in the window.
+            - 'prefilter', 'index', 'candidates_from', 'status': counts of the traces by value.
+            - 'mean_interval_count': the mean size of the active exclusion list.
+            - 'stages': for each stage, the mean number of intervals before and after it, the ratio it pruned, the
+              ratio of its survivors which only passed because of a null bound, the ratio of queries which skipped it
+              (null point value) and its mean time in milliseconds.
+            - 'total_ms': the mean, p95 and max time of the traced queries in milliseconds.
+    """
+    return query_traces.report()
+
+
+@app.delete("/admin/query_traces", status_code=200, tags=['Admin'])
+async def clear_query_traces():
+    """
+    Clears the recent query traces. If successful, returns a status code of 200.
+    """
+    query_traces.clear()
+
+
+sampling_profiler = SamplingProfiler()
+
+
+@app.post("/admin/profiler/start", status_code=200, tags=['Admin'])
+async def start_profiler(interval: float = 0.005, all_threads: bool = False):
+    """
+    Starts the sampling profiler over the live process. If successful, returns a status code of 200.
+
+    Args:
+        interval: A float representing the sampling interval in seconds, between 0.001 and 1 (default: 0.005).
+        all_threads: Whether to sample all threads instead of only the event loop thread (default: False).
+
+    Raises:
+        HTTPException 400: If interval is not between 0.001 and 1 second.
+        HTTPException 409: If the sampling profiler is already running.
+    """
+    _log.info(f'Start sampling profiler')
+    if not MIN_SAMPLING_INTERVAL <= interval <= MAX_SAMPLING_INTERVAL:
+        raise HTTPException(status_code=400, detail=f'interval must be between {MIN_SAMPLING_INTERVAL} and '
+                                                    f'{MAX_SAMPLING_INTERVAL} seconds.')
+    if sampling_profiler.running:
+        raise HTTPException(status_code=409, detail='Sampling profiler is already running.')
+    sampling_profiler.start(interval=interval, all_threads=all_threads)
+
+
+@app.post("/admin/profiler/stop", response_class=PlainTextResponse, status_code=200, tags=['Admin'])
+async def stop_profiler():
+    """
+    Stops the sampling profiler. If successful, returns a status code of 200.
+
+    Returns:
+        The sampled call stacks in the collapsed stack format ('frame;frame;frame count' per line), which can be
+        rendered with flamegraph.pl or speedscope.
+
+    Raises:
+        HTTPException 409: If the sampling profiler is not running.
+    """
+    _log.info(f'Stop sampling profiler')
+    if not sampling_profiler.running:
+        raise HTTPException(status_code=409, detail='Sampling profiler is not running.')
+    return PlainTextResponse(sampling_profiler.stop(), headers={
+        'Content-Disposition': 'attachment; filename="profile.folded"'})
+
+
+@app.post("/admin/profiler/cprofile", status_code=200, tags=['Admin'])
+async def cprofile(duration: float = 10, output: str = 'pstats'):
+    """
+    Profiles the event loop thread with cProfile for the given duration. If successful, returns a status code of 200.
+
+    Args:
+        duration: A float representing the capture duration in seconds (default: 10).
+        output: 'pstats' to return a profile file (for snakeviz or flameprof) or 'text' to return the profile
+            sorted by cumulative time (default: 'pstats').
+
+    Returns:
+        The profile, as a file or as text.
+
+    Raises:
+        HTTPException 400: If duration is not between 0 and 300 seconds or output is invalid.
+        HTTPException 409: If a cProfile capture is already running.
+    """
+    _log.info(f'cProfile capture')
+    if not 0 < duration <= 300:
+        raise HTTPException(status_code=400, detail='duration must be between 0 and 300 seconds.')
+    if output not in ('pstats', 'text'):
+        raise HTTPException(status_code=400, detail="output must be 'pstats' or 'text'.")
+    if is_cprofile_running():
+        raise HTTPException(status_code=409, detail='cProfile capture is already running.')
+
+    profile = await capture_cprofile(duration)
+    if output == 'text':
+        return PlainTextResponse(profile_to_text(profile))
+    return Response(profile_to_bytes(profile), media_type='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename="profile.prof"'})
+
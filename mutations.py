@@ -0,0 +1,96 @@
+"""
+This module contains the MutationLog, a bounded in-memory log of the changes made to the active exclusion list. Each
+change gets a sequence number. Clients keep a replica of the active exclusion list by fetching a snapshot (taken at a
+sequence number) and then polling the log for the changes made after it.
+
+Mutation operations:
+    - 'add': the intervals were added.
+    - 'remove': the intervals were removed (the removed intervals, not the query used to remove them).
+    - 'remove_prefix': all intervals with the id prefix were removed.
+    - 'clear': all intervals were removed.
+    - 'reset': the active list was replaced (e.g. loaded), replicas must fetch a new snapshot.
+    - 'offset': the offset applied to points changed.
+"""
+
+import asyncio
+import dataclasses
+import uuid
+from collections import deque
+from typing import List, Optional, Dict
+
+from exclusionms.components import ExclusionInterval
+
+
+@dataclasses.dataclass
+class Mutation:
+    seq: int
+    op: str
+    intervals: Optional[List[ExclusionInterval]] = None
+    prefix: Optional[str] = None
+    offset: Optional[Dict[str, float]] = None
+
+
+class MutationLog:
+    """
+    Keeps the last mutations of the active exclusion list, up to `capacity` mutations or intervals.
+
+    Attributes:
+        seq (int): Sequence number of the last mutation, 0 if there was none.
+        epoch (str): Random ID of the log. Sequence numbers restart at 0 with a new epoch when the server restarts.
+    """
+
+    def __init__(self, capacity: int = 50000):
+        self.seq = 0
+        self.epoch = uuid.uuid4().hex
+        self.capacity = capacity
+        self.mutations = deque()
+        self._size = 0
+        self._changed = asyncio.Event()
+
+    def append(self, op: str, intervals: Optional[List[ExclusionInterval]] = None, prefix: Optional[str] = None,
+               offset: Optional[Dict[str, float]] = None) -> int:
+        """
+        Append a mutation and wake up the clients waiting for it.
+
+        Returns:
+            int: The sequence number of the mutation.
+        """
+        self.seq += 1
+        self.mutations.append(Mutation(seq=self.seq, op=op, intervals=intervals, prefix=prefix, offset=offset))
+        self._size += self._get_size(self.mutations[-1])
+        while self._size > self.capacity and len(self.mutations) > 1:
+            self._size -= self._get_size(self.mutations.popleft())
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return self.seq
+
+    @staticmethod
+    def _get_size(mutation: Mutation) -> int:
+        return max(1, len(mutation.intervals or ()))
+
+    def since(self, seq: int) -> Optional[List[Mutation]]:
+        """
+        Get the mutations made after the sequence number.
+
+        Args:
+            seq (int): The sequence number of the last mutation the client has applied.
+
+        Returns:
+            Optional[List[Mutation]]: The mutations after seq, or None if some of them are no longer in the log (the
+            client must fetch a new snapshot).
+        """
+        first_seq = self.mutations[0].seq if self.mutations else self.seq + 1
+        if seq < first_seq - 1 or seq > self.seq:
+            return None
+        return [mutation for mutation in self.mutations if mutation.seq > seq]
+
+    async def wait(self, seq: int, timeout: float) -> None:
+        """
+        Wait until there are mutations after the sequence number, or for at most timeout seconds.
+        """
+        if self.seq > seq:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,71 @@
+"""
+This module contains the CountingBloomFilter used by the ExclusionList as a prefilter for point queries. The filter
+holds a key for every (charge, mass bin[, ook0 bin]) covered by an interval, so that a point whose keys are all absent
+is known not to be contained by any interval without searching the indexes.
+"""
+
+import math
+from array import array
+from typing import Hashable
+
+MAX_COUNT = 255
+
+
+class CountingBloomFilter:
+    """
+    A counting Bloom filter with 8 bit counters, supporting removal. Counters which reach MAX_COUNT are never
+    decremented, so that they cannot cause false negatives.
+
+    Attributes:
+        size (int): Number of counters, a power of two.
+        hashes (int): Number of counters per key.
+        keys (int): Number of keys added and not removed.
+    """
+
+    def __init__(self, size: int, hashes: int = 3):
+        if size & (size - 1):
+            raise ValueError(f'Size must be a power of two, got {size}')
+        self.size = size
+        self.hashes = hashes
+        self.keys = 0
+        self.counters = array('B', bytes(size))
+        self._mask = size - 1
+
+    def add(self, key: Hashable) -> None:
+        # double hashing: the positions are h, h + step, h + 2 * step, ... modulo size
+        counters, mask = self.counters, self._mask
+        h = hash(key)
+        step = (h >> 17) | 1
+        for i in range(self.hashes):
+            position = (h + i * step) & mask
+            if counters[position] < MAX_COUNT:
+                counters[position] += 1
+        self.keys += 1
+
+    def remove(self, key: Hashable) -> None:
+        counters, mask = self.counters, self._mask
+        h = hash(key)
+        step = (h >> 17) | 1
+        for i in range(self.hashes):
+            position = (h + i * step) & mask
+            if counters[position] < MAX_COUNT:
+                counters[position] -= 1
+        self.keys -= 1
+
+    def may_contain(self, key: Hashable) -> bool:
+        """
+        Check if the key may have been added. False is a definite negative.
+        """
+        counters, mask = self.counters, self._mask
+        h = hash(key)
+        step = (h >> 17) | 1
+        for i in range(self.hashes):
+            if counters[(h + i * step) & mask] == 0:
+                return False
+        return True
+
+    def fill_ratio(self) -> float:
+        return 1 - self.counters.count(0) / self.size
+
+    def expected_false_positive_rate(self) -> float:
+        return math.pow(self.fill_ratio(), self.hashes)
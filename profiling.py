@@ -0,0 +1,282 @@
+"""
+This module contains tools for diagnosing where server time goes without restarting the server:
+
+- SamplingProfiler: a low overhead sampling profiler which periodically records the call stacks of the live process
+  and reports them as collapsed stacks (the input format of flamegraph.pl and speedscope).
+- capture_cprofile: a time-boxed cProfile capture of the event loop thread.
+- TimedRoute: an APIRoute which, when the request carries the X-Server-Timing header, returns a Server-Timing response
+  header with the time spent parsing, validating, waiting for the lock, querying and serializing.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Callable
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from scheduling import PriorityLock, Priority
+
+SERVER_TIMING_HEADER = 'X-Server-Timing'
+MIN_SAMPLING_INTERVAL = 0.001
+MAX_SAMPLING_INTERVAL = 1.0
+
+# only one cProfile capture can run at a time: enabling a second profiler replaces the first one's hook
+_cprofile_running = False
+
+
+class SamplingProfiler:
+    """
+    Samples the call stacks of the event loop thread (or of all threads) at a fixed interval from a background thread.
+    """
+
+    def __init__(self):
+        self.samples = Counter()
+        self.interval = 0.005
+        self.thread_id = None
+        self.all_threads = False
+        self.start_time = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.005, all_threads: bool = False) -> None:
+        """
+        Start sampling. When all_threads is False only the calling thread (the event loop thread) is sampled.
+        """
+        if self.running:
+            raise RuntimeError('Sampling profiler is already running')
+        if not MIN_SAMPLING_INTERVAL <= interval <= MAX_SAMPLING_INTERVAL:
+            raise ValueError(f'Sampling interval must be between {MIN_SAMPLING_INTERVAL} and {MAX_SAMPLING_INTERVAL} '
+                             f'seconds')
+
+        self.samples = Counter()
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.all_threads = all_threads
+        self.start_time = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """
+        Stop sampling and return the collapsed stacks, one 'frame;frame;frame count' line per unique stack.
+        """
+        if not self.running:
+            raise RuntimeError('Sampling profiler is not running')
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        return self.collapsed_stacks()
+
+    def collapsed_stacks(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+    def _run(self) -> None:
+        own_thread_id = threading.get_ident()
+        thread_names = {}
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id or (not self.all_threads and thread_id != self.thread_id):
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+
+                if self.all_threads:
+                    if thread_id not in thread_names:
+                        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    stack.append(thread_names.get(thread_id, str(thread_id)))
+
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+async def capture_cprofile(duration: float) -> cProfile.Profile:
+    """
+    Profile the event loop thread with cProfile for the given number of seconds. Work done in other threads (e.g.
+    background loads) is not included.
+
+    Raises:
+        RuntimeError: If a capture is already running.
+    """
+    global _cprofile_running
+    if _cprofile_running:
+        raise RuntimeError('cProfile capture is already running')
+
+    _cprofile_running = True
+    try:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profile.disable()
+    finally:
+        _cprofile_running = False
+    return profile
+
+
+def is_cprofile_running() -> bool:
+    return _cprofile_running
+
+
+def profile_to_bytes(profile: cProfile.Profile) -> bytes:
+    """
+    Serialize a profile in the pstats format, which can be opened with snakeviz, flameprof or pstats.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'profile.prof')
+        profile.dump_stats(file_path)
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+
+def profile_to_text(profile: cProfile.Profile, sort_by: str = 'cumulative', limit: int = 100) -> str:
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats(sort_by).print_stats(limit)
+    return stream.getvalue()
+
+
+class ServerTiming:
+    """
+    Durations of the stages of a single request, in seconds.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self.endpoint_start: Optional[float] = None
+        self.endpoint_end: Optional[float] = None
+
+    def add(self, stage: str, duration: float) -> None:
+        self.durations[stage] = self.durations.get(stage, 0.0) + duration
+
+    def header(self) -> str:
+        return ', '.join(f'{stage};dur={duration * 1000:.3f}' for stage, duration in self.durations.items())
+
+
+_server_timing: ContextVar[Optional[ServerTiming]] = ContextVar('server_timing', default=None)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Record the duration of the enclosed block as the given stage of the current request's server timing. Does nothing
+    when the request did not ask for server timing.
+    """
+    timing = _server_timing.get()
+    if timing is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(stage, time.perf_counter() - start_time)
+
+
+@asynccontextmanager
+async def timed_lock(lock: PriorityLock, priority: Priority = Priority.BULK, deadline: Optional[float] = None):
+    """
+    Acquire the lock with the given priority and deadline, recording the time spent waiting for it as the 'lock'
+    stage.
+    """
+    with timed('lock'):
+        await lock.acquire(priority, deadline)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def time_endpoint(endpoint: Callable) -> Callable:
+    """
+    Wrap an async endpoint so that the start and end of its execution are recorded in the server timing.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        timing = _server_timing.get()
+        if timing is None:
+            return await endpoint(*args, **kwargs)
+
+        timing.endpoint_start = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timing.endpoint_end = time.perf_counter()
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    An APIRoute which returns a Server-Timing header when the request has the X-Server-Timing header. The stages are:
+        - parse: reading and decoding the json body.
+        - validation: validating the body and parameters.
+        - lock: waiting for the active exclusion list lock (recorded by the endpoint).
+        - query: querying or modifying the active exclusion list (recorded by the endpoint).
+        - serialization: validating and serializing the response.
+        - total: the total time spent in the route.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = time_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        route_handler = super().get_route_handler()
+
+        async def timed_route_handler(request: Request) -> Response:
+            if SERVER_TIMING_HEADER not in request.headers:
+                return await route_handler(request)
+
+            timing = ServerTiming()
+            token = _server_timing.set(timing)
+            try:
+                start_time = time.perf_counter()
+                if request.headers.get('content-type', '').startswith('application/json') and await request.body():
+                    try:
+                        await request.json()
+                    except json.JSONDecodeError:
+                        pass
+                parse_end_time = time.perf_counter()
+
+                response = await route_handler(request)
+                end_time = time.perf_counter()
+            finally:
+                _server_timing.reset(token)
+
+            endpoint_durations = timing.durations
+            timing.durations = {'parse': parse_end_time - start_time}
+            if timing.endpoint_start is not None:
+                timing.add('validation', timing.endpoint_start - parse_end_time)
+                timing.durations.update(endpoint_durations)
+                timing.add('serialization', end_time - timing.endpoint_end)
+            timing.add('total', end_time - start_time)
+            response.headers['Server-Timing'] = timing.header()
+            return response
+
+        return timed_route_handler
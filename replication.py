@@ -0,0 +1,153 @@
+"""
+This module contains the primary/replica replication of the active exclusion list between servers.
+
+A server started with the EXCLUSIONMS_PRIMARY environment variable set to the url of another server is a read-only
+replica of it. The replica fetches a snapshot of the primary's active list (/exclusionms/sync/snapshot) and then
+follows the primary's mutation log (/exclusionms/sync/mutations): adds, removes, clears, loads and offset changes.
+Point and interval queries are served by the replica; mutations are rejected and must be sent to the primary.
+
+Every response carries the sequence number of the last mutation applied by the server in the X-Exclusion-Seq header.
+A client which wrote to the primary can pass the sequence number of its write in the X-Min-Seq header of a query to
+any server, to read its own writes: the query waits until the server has applied that mutation.
+"""
+
+import asyncio
+import dataclasses
+import os
+import socket
+import time
+from typing import Optional, Dict, Any, List
+
+import requests
+
+SEQ_HEADER = 'X-Exclusion-Seq'
+MIN_SEQ_HEADER = 'X-Min-Seq'
+MIN_SEQ_TIMEOUT = 5.0
+POLL_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 30.0
+RETRY_INTERVAL = 1.0
+
+PRIMARY_URL = os.environ.get('EXCLUSIONMS_PRIMARY')
+REPLICA_ID = os.environ.get('EXCLUSIONMS_REPLICA_ID', socket.gethostname())
+
+
+@dataclasses.dataclass
+class ReplicaPosition:
+    """
+    Position of a replica (or other client) following the mutation log, as seen by the primary.
+    """
+    seq: int
+    last_poll: float
+
+
+@dataclasses.dataclass
+class ReplicationState:
+    """
+    Replication state of the server.
+
+    Attributes:
+        primary (Optional[str]): Url of the primary, None if this server is the primary.
+        epoch (Optional[str]): Epoch of the primary's mutation log the replica follows.
+        seq (int): Sequence number (in the primary's mutation log) of the last mutation applied by this replica.
+        primary_seq (int): Sequence number of the primary's last mutation, as of the last poll.
+        status (str): 'syncing' (fetching a snapshot), 'streaming' or 'error'.
+        last_contact (Optional[float]): time.time() of the last successful poll of the primary.
+        replicas (Dict[str, ReplicaPosition]): Positions of the replicas following this server.
+    """
+    primary: Optional[str] = PRIMARY_URL
+    replica_id: str = REPLICA_ID
+    epoch: Optional[str] = None
+    seq: int = 0
+    primary_seq: int = 0
+    status: str = 'syncing'
+    last_contact: Optional[float] = None
+    error: Optional[str] = None
+    replicas: Dict[str, ReplicaPosition] = dataclasses.field(default_factory=dict)
+    _changed: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    @property
+    def is_replica(self) -> bool:
+        return self.primary is not None
+
+    def set_seq(self, seq: int) -> None:
+        """
+        Record the last applied mutation and wake up the queries waiting for it.
+        """
+        self.seq = seq
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_for_seq(self, seq: int, timeout: float) -> bool:
+        """
+        Wait until the replica applied the mutation with the sequence number, or for at most timeout seconds.
+
+        Returns:
+            bool: Whether the mutation was applied.
+        """
+        deadline = time.monotonic() + timeout
+        while self.seq < seq:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def record_poll(self, replica_id: str, seq: int) -> None:
+        self.replicas[replica_id] = ReplicaPosition(seq=seq, last_poll=time.time())
+
+    def report(self, seq: int) -> Dict[str, Any]:
+        """
+        Get the role, position and lag of the server, and the lag of the replicas following it.
+
+        Args:
+            seq (int): The sequence number of the server's own mutation log.
+        """
+        now = time.time()
+        report = {'role': 'replica' if self.is_replica else 'primary', 'seq': self.seq if self.is_replica else seq,
+                  'replicas': {replica_id: {'seq': position.seq, 'lag': max(0, seq - position.seq),
+                                            'last_poll_age': now - position.last_poll}
+                               for replica_id, position in self.replicas.items()}}
+        if self.is_replica:
+            report.update({'primary': self.primary,
+                           'replica_id': self.replica_id,
+                           'epoch': self.epoch,
+                           'status': self.status,
+                           'primary_seq': self.primary_seq,
+                           'lag': max(0, self.primary_seq - self.seq),
+                           'last_contact_age': None if self.last_contact is None else now - self.last_contact,
+                           'error': self.error})
+        return report
+
+
+def fetch_snapshot(primary: str) -> Dict[str, Any]:
+    response = requests.get(url=f'{primary}/exclusionms/sync/snapshot', timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_mutations(primary: str, epoch: Optional[str], since: int, replica_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Long poll the primary for the mutations after since.
+
+    Returns:
+        Optional[Dict[str, Any]]: The primary's sequence number and mutations, or None if the mutations are no longer
+        available (or the primary restarted) and a new snapshot must be fetched.
+    """
+    response = requests.get(url=f'{primary}/exclusionms/sync/mutations',
+                            params={'since': since, 'timeout': POLL_TIMEOUT, 'epoch': epoch, 'replica_id': replica_id},
+                            timeout=POLL_TIMEOUT + REQUEST_TIMEOUT)
+    if response.status_code == 410:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def columns_to_intervals(columns: Dict[str, List]) -> List[Dict[str, Any]]:
+    """
+    Convert the interval columns of a snapshot to interval dicts.
+    """
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*(columns[field] for field in fields))]
@@ -0,0 +1,178 @@
+"""
+This module contains the scheduling of requests on the active exclusion list. Requests are divided into priority
+classes, and the lock on the active exclusion list is handed to the most urgent waiter first:
+
+- REALTIME: point checks from the instrument (exclusion, inclusion and status searches).
+- INTERACTIVE: point searches returning intervals.
+- BULK: interval searches, additions and deletions, save, load and clear. Bulk work releases the lock between chunks
+  so that real-time requests do not wait for a whole bulk request.
+
+Real-time requests can carry a deadline (the X-Deadline-Ms header). A request which cannot get the lock before its
+deadline is shed: it gets a fast fallback answer instead of a late one, and the X-Deadline-Status response header is
+set to 'shed'. The fallback reports every point as not found: not excluded for exclusion searches, not included for
+inclusion searches, NO_INTERVALS_FOUND for status searches, and no intervals for point searches. A request which got
+the lock but finished after its deadline is answered normally, with the header set to 'late'.
+"""
+
+import asyncio
+import dataclasses
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Dict, Optional, List, Any, AsyncIterator, Sequence
+
+DEADLINE_HEADER = 'X-Deadline-Ms'
+DEADLINE_STATUS_HEADER = 'X-Deadline-Status'
+BULK_CHUNK_SIZE = 256
+
+
+class Priority(IntEnum):
+    REALTIME = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def get_deadline(deadline_ms: Optional[float]) -> Optional[float]:
+    """
+    Convert a deadline in milliseconds from now to a time.monotonic() deadline.
+    """
+    if deadline_ms is None:
+        return None
+    return time.monotonic() + deadline_ms / 1000
+
+
+@dataclasses.dataclass
+class PriorityStats:
+    """
+    Counters of a priority class.
+
+    Attributes:
+        admitted (int): Number of lock acquisitions.
+        shed (int): Number of requests answered with a fallback because their deadline passed while waiting.
+        late (int): Number of requests which got the lock in time but finished after their deadline.
+        total_wait (float): Total time spent waiting for the lock, in seconds.
+        max_wait (float): Longest time spent waiting for the lock, in seconds.
+    """
+    admitted: int = 0
+    shed: int = 0
+    late: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record_wait(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class PriorityLock:
+    """
+    An asyncio lock whose waiters are served by priority, then in arrival order. The lock is handed directly to the
+    next waiter on release, so a newly arriving request cannot overtake a waiting one of the same or higher priority.
+    """
+
+    def __init__(self):
+        self._locked = False
+        self._waiters: List[list] = []  # heap of [priority, sequence, future]
+        self._sequence = itertools.count()
+        self.stats: Dict[Priority, PriorityStats] = {priority: PriorityStats() for priority in Priority}
+
+    def locked(self) -> bool:
+        return self._locked
+
+    async def acquire(self, priority: Priority = Priority.BULK, deadline: Optional[float] = None) -> None:
+        """
+        Acquire the lock.
+
+        Args:
+            priority (Priority): The priority class of the caller.
+            deadline (Optional[float]): time.monotonic() after which the caller gives up waiting.
+
+        Raises:
+            DeadlineExceeded: If the deadline passed before the lock was acquired.
+        """
+        start_time = time.monotonic()
+        if deadline is not None and start_time >= deadline:
+            self.stats[priority].shed += 1
+            raise DeadlineExceeded()
+
+        if not self._locked and not self._waiters:
+            self._locked = True
+            self.stats[priority].record_wait(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), future])
+        try:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            await asyncio.wait([future], timeout=timeout)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+        if not future.done():
+            future.cancel()
+            self.stats[priority].shed += 1
+            raise DeadlineExceeded()
+
+        self.stats[priority].record_wait(time.monotonic() - start_time)
+
+    def release(self) -> None:
+        """
+        Release the lock, handing it to the most urgent waiter if there is one.
+        """
+        if not self._locked:
+            raise RuntimeError('Lock is not acquired.')
+
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._locked = False
+
+    def record_late(self, priority: Priority) -> None:
+        self.stats[priority].late += 1
+
+    def waiting(self) -> Dict[str, int]:
+        """
+        Get the number of waiters of each priority class.
+        """
+        counts = {priority.name: 0 for priority in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                counts[Priority(priority).name] += 1
+        return counts
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Get the lock state, queue lengths and counters of each priority class.
+        """
+        return {'locked': self._locked,
+                'waiting': self.waiting(),
+                'stats': {priority.name: dataclasses.asdict(stats) for priority, stats in self.stats.items()}}
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+async def iter_chunks(items: Sequence, chunk_size: int = BULK_CHUNK_SIZE) -> AsyncIterator[Sequence]:
+    """
+    Iterate over the items in chunks, giving the event loop a chance to run other requests between chunks. Bulk work
+    acquires the lock once per chunk, so that queued real-time requests get the lock between chunks.
+    """
+    for start in range(0, len(items), chunk_size):
+        if start > 0:
+            await asyncio.sleep(0)
+        yield items[start:start + chunk_size]
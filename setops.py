@@ -0,0 +1,163 @@
+"""
+This module contains the set operations between saved exclusion lists: union, difference and intersection.
+
+The operations work on the saved states of the lists (see ExclusionList.to_state) rather than on ExclusionList objects,
+so no indexes are built and the active exclusion list is not involved. The rows of each list are sorted by a key, and
+the sorted lists are merged in a single pass:
+
+- union: the rows whose key is in any list.
+- intersection: the rows whose key is in every list.
+- difference: the rows of the first list whose key is in none of the other lists.
+
+The key of a row is its interval id (dedup 'id') or its geometry (dedup 'geometry'): its charge, bounds and exclusion
+flag, so that the same interval saved under different ids (e.g. in replicate runs) is counted once. Rows with the same
+key are deduplicated; the row of the first list which has the key is kept, with its interval id and data.
+"""
+
+import heapq
+import itertools
+import math
+from array import array
+from typing import List, Dict, Any, Hashable, Iterator, Tuple
+
+from constants import EXCLUSION_LIST_FORMAT_VERSION
+from exclusion_list import ExclusionList, BOUND_COLUMNS, OVERFLOW_SUFFIX, UUID_COLUMNS
+
+OPERATIONS = ('union', 'difference', 'intersection')
+DEDUP_MODES = ('id', 'geometry')
+
+# columns copied row by row, the prefix column is renumbered
+COLUMNS = BOUND_COLUMNS + ['charge', 'exclusion', 'suffix']
+
+
+def get_keys(state: Dict[str, Any], dedup: str) -> List[Hashable]:
+    """
+    Get the key of each row of a state.
+
+    Args:
+        state (Dict[str, Any]): The state of an ExclusionList.
+        dedup (str): 'id' or 'geometry'.
+
+    Returns:
+        List[Hashable]: The keys, in row order.
+    """
+    if dedup == 'id':
+        return ExclusionList.state_interval_ids(state)
+
+    # null bounds are NaN, which do not compare: a null min bound is -inf and a null max bound inf
+    columns = state['columns']
+    bounds = []
+    for column in BOUND_COLUMNS:
+        null_bound = -math.inf if column.startswith('min') else math.inf
+        bounds.append([null_bound if value != value else value for value in columns[column]])
+    return list(zip(columns['charge'], *bounds, columns['exclusion']))
+
+
+def merge_rows(keys: List[List[Hashable]], operation: str) -> Iterator[Tuple[int, int]]:
+    """
+    Merge the sorted rows of the lists.
+
+    Args:
+        keys (List[List[Hashable]]): The keys of the rows of each list.
+        operation (str): 'union', 'difference' or 'intersection'.
+
+    Returns:
+        Iterator[Tuple[int, int]]: The (list index, row) of each row of the result, sorted by key.
+    """
+    def sorted_rows(list_index: int) -> Iterator[Tuple[Hashable, int, int]]:
+        list_keys = keys[list_index]
+        for row in sorted(range(len(list_keys)), key=list_keys.__getitem__):
+            yield list_keys[row], list_index, row
+
+    merged = heapq.merge(*(sorted_rows(list_index) for list_index in range(len(keys))))
+    for _, group in itertools.groupby(merged, key=lambda item: item[0]):
+        group = list(group)
+        list_indexes = {list_index for _, list_index, _ in group}
+        _, first_list_index, first_row = group[0]
+
+        if operation == 'union':
+            yield first_list_index, first_row
+        elif operation == 'intersection':
+            if len(list_indexes) == len(keys):
+                yield first_list_index, first_row
+        elif operation == 'difference':
+            if list_indexes == {0}:
+                yield first_list_index, first_row
+        else:
+            raise ValueError(f'Unknown operation {operation}')
+
+
+def combine_states(operation: str, states: List[Dict[str, Any]], dedup: str = 'geometry') -> Dict[str, Any]:
+    """
+    Combine the states of exclusion lists.
+
+    Args:
+        operation (str): 'union', 'difference' (the first list minus the others) or 'intersection'.
+        states (List[Dict[str, Any]]): The states of the lists, see ExclusionList.to_state.
+        dedup (str): Whether rows are the same interval if they have the same 'id' or the same 'geometry'.
+
+    Returns:
+        Dict[str, Any]: The state of the combined list.
+
+    Raises:
+        ValueError: If the operation or dedup mode is unknown, or no states are given.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f'Unknown operation {operation}, expected one of {OPERATIONS}')
+    if dedup not in DEDUP_MODES:
+        raise ValueError(f'Unknown dedup mode {dedup}, expected one of {DEDUP_MODES}')
+    if not states:
+        raise ValueError('No exclusion lists to combine')
+
+    # the uuids of the intervals are kept, unless a list was saved without them (new uuids are generated on load)
+    copied_columns = list(COLUMNS)
+    if all(column in state['columns'] for state in states for column in UUID_COLUMNS):
+        copied_columns += UUID_COLUMNS
+    columns = {column: array(states[0]['columns'][column].typecode) for column in copied_columns + ['prefix']}
+    prefixes, prefix_ids = [], {}
+    overflow_ids, data = {}, {}
+
+    keys = [get_keys(state, dedup) for state in states]
+    for slot, (list_index, row) in enumerate(merge_rows(keys, operation)):
+        state = states[list_index]
+        state_columns = state['columns']
+        for column in copied_columns:
+            columns[column].append(state_columns[column][row])
+
+        prefix = state['prefixes'][state_columns['prefix'][row]]
+        if prefix not in prefix_ids:
+            prefix_ids[prefix] = len(prefixes)
+            prefixes.append(prefix)
+        columns['prefix'].append(prefix_ids[prefix])
+
+        if state_columns['suffix'][row] == OVERFLOW_SUFFIX:
+            overflow_ids[slot] = state['overflow_ids'][row]
+        if row in state['data']:
+            data[slot] = state['data'][row]
+
+    return {'format_version': EXCLUSION_LIST_FORMAT_VERSION,
+            'columns': columns,
+            'prefixes': prefixes,
+            'overflow_ids': overflow_ids,
+            'data': data}
+
+
+def combine_files(operation: str, input_paths: List[str], output_path: str, dedup: str = 'geometry') -> Dict[str, Any]:
+    """
+    Combine saved exclusion lists and save the result.
+
+    Args:
+        operation (str): 'union', 'difference' (the first list minus the others) or 'intersection'.
+        input_paths (List[str]): The paths of the saved lists.
+        output_path (str): The path of the combined list.
+        dedup (str): 'id' or 'geometry'.
+
+    Returns:
+        Dict[str, Any]: The summary of the combined list (see ExclusionList.summary) and the interval counts of the
+        input lists.
+    """
+    states = [ExclusionList.read_state(input_path) for input_path in input_paths]
+    state = combine_states(operation, states, dedup)
+    ExclusionList.write_state(state, output_path)
+    return {'summary': ExclusionList.state_summary(state),
+            'input_counts': [len(input_state['columns']['exclusion']) for input_state in states]}
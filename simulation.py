@@ -0,0 +1,309 @@
+"""
+This module contains an offline simulation of dynamic exclusion, used to tune DynamicExclusionTolerance settings
+without instrument time. A recorded stream of candidates (and optionally MS2 events) is replayed through the same
+exclusion logic as the acquisition plugin, in-process on an ExclusionList:
+
+- each cycle, the valid candidates (charge, m/z and ook0 not None or 0) are checked against the list and the excluded
+  ones are dropped. The remaining candidates, optionally only the top_n most intense ones, are sampled (fragmented).
+- each sampled candidate adds a dynamic exclusion interval constructed by the tolerance around it, after all candidates
+  of the cycle were checked (the plugin adds them when the MS2 spectra arrive). As in the plugin, no interval is added
+  for a precursor whose charge, mass, ook0, rt or intensity is None or 0.
+- a recorded 'ms2' event is a precursor which was fragmented regardless of the candidates, it only adds its interval.
+  Invalid ones (as above) are dropped.
+
+A grid of tolerances is simulated in parallel in a process pool. For each tolerance the number of samples, unique
+precursors sampled and redundant samples (samples of an already sampled precursor) are reported.
+
+The recorded stream is a csv file with the columns rt, charge, mass (or mz), ook0 and intensity, and optionally
+event ('candidate' or 'ms2', default 'candidate'), cycle (default: consecutive rows with the same rt) and precursor_id
+(default: charge, mass rounded to 0.01 and ook0 rounded to 0.01).
+
+Usage:
+    python simulation.py run.csv grid.json [--top-n 10] [--workers 8] [--exclusion-list data/pickles/exid.pkl]
+
+where grid.json is either a list of tolerances, or a dict of lists of values which is expanded to all combinations,
+e.g. {"charge": [true], "mass": [10, 20], "rt": [30, 60], "ook0": [0.05], "intensity": [null]}.
+"""
+
+import argparse
+import csv
+import dataclasses
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Dict, Any, Hashable, Iterable, Tuple
+
+from exclusionms.components import DynamicExclusionTolerance, ExclusionPoint
+
+from exclusion_list import ExclusionList
+
+_log = logging.getLogger(__name__)
+
+PROTON_MASS = 1.00727647
+INTERVAL_ID_PREFIX = 'sim'
+
+
+@dataclasses.dataclass
+class Event:
+    """
+    A recorded candidate or MS2 event.
+    """
+    cycle: int
+    event: str
+    charge: Optional[int]
+    mass: Optional[float]
+    rt: Optional[float]
+    ook0: Optional[float]
+    intensity: Optional[float]
+    precursor_id: Hashable
+
+
+@dataclasses.dataclass
+class SimulationResult:
+    """
+    Result of simulating a tolerance.
+
+    Attributes:
+        tolerance (Dict[str, Any]): The DynamicExclusionTolerance, as a dict.
+        candidates (int): Number of valid candidates checked.
+        excluded (int): Number of candidates dropped because they were excluded.
+        samples (int): Number of precursors fragmented (sampled candidates and recorded MS2 events).
+        unique_precursors (int): Number of distinct precursors fragmented.
+        redundant_samples (int): samples - unique_precursors.
+        redundancy (float): redundant_samples / samples.
+        seconds (float): Duration of the simulation.
+    """
+    tolerance: Dict[str, Any]
+    candidates: int = 0
+    excluded: int = 0
+    samples: int = 0
+    unique_precursors: int = 0
+    redundant_samples: int = 0
+    redundancy: float = 0.0
+    seconds: float = 0.0
+
+
+def calculate_mass(mz: float, charge: int) -> float:
+    return mz * charge - charge * PROTON_MASS
+
+
+def get_precursor_id(charge: Optional[int], mass: Optional[float], ook0: Optional[float]) -> Hashable:
+    return charge, None if mass is None else round(mass, 2), None if ook0 is None else round(ook0, 2)
+
+
+def read_events(file_path: str) -> List[Event]:
+    """
+    Read a recorded stream of candidates and MS2 events from a csv file.
+
+    Args:
+        file_path (str): Path of the csv file.
+
+    Returns:
+        List[Event]: The events, in recorded order.
+
+    Raises:
+        ValueError: If a row has neither a mass nor an mz, or an unknown event.
+    """
+    def to_float(value: Optional[str]) -> Optional[float]:
+        return None if value in (None, '', 'None') else float(value)
+
+    events = []
+    cycle, last_rt = -1, None
+    with open(file_path, newline='') as f:
+        for row in csv.DictReader(f):
+            event = row.get('event') or 'candidate'
+            if event not in ('candidate', 'ms2'):
+                raise ValueError(f'Unknown event {event}')
+
+            charge = None if row.get('charge') in (None, '', 'None') else int(row['charge'])
+            mass = to_float(row.get('mass'))
+            if mass is None:
+                mz = to_float(row.get('mz'))
+                if mz is None:
+                    raise ValueError(f'Event without mass or mz: {row}')
+                mass = calculate_mass(mz, charge) if charge else None
+            rt, ook0 = to_float(row.get('rt')), to_float(row.get('ook0'))
+
+            if row.get('cycle') not in (None, ''):
+                cycle = int(row['cycle'])
+            elif rt != last_rt or cycle < 0:
+                cycle += 1
+            last_rt = rt
+
+            precursor_id = row.get('precursor_id') or get_precursor_id(charge, mass, ook0)
+            events.append(Event(cycle=cycle, event=event, charge=charge, mass=mass, rt=rt, ook0=ook0,
+                                intensity=to_float(row.get('intensity')), precursor_id=precursor_id))
+    return events
+
+
+def expand_grid(grid: Any) -> List[Dict[str, Any]]:
+    """
+    Expand a tolerance grid: a list of tolerances is returned as is, a dict of lists of values is expanded to all
+    combinations of values.
+    """
+    if isinstance(grid, list):
+        return grid
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def is_candidate_valid(event: Event) -> bool:
+    # the plugin drops candidates without charge, m/z or ook0 before checking them
+    return bool(event.charge) and bool(event.mass) and bool(event.ook0)
+
+
+def is_ms2_valid(event: Event) -> bool:
+    # the plugin does not exclude MS2 precursors with a charge, m/z, ook0, rt or intensity of None or 0
+    return is_candidate_valid(event) and bool(event.rt) and bool(event.intensity)
+
+
+# per worker state, set by init_worker so that the events are sent and converted to points once per process
+_cycles: List[List[Tuple[Event, ExclusionPoint]]] = []
+_exclusion_list_path: Optional[str] = None
+
+
+def group_cycles(events: Iterable[Event]) -> List[List[Tuple[Event, ExclusionPoint]]]:
+    cycles = []
+    for _, cycle_events in itertools.groupby(events, key=lambda event: event.cycle):
+        cycles.append([(event, ExclusionPoint(charge=event.charge, mass=event.mass, rt=event.rt, ook0=event.ook0,
+                                              intensity=event.intensity))
+                       for event in cycle_events
+                       if (is_ms2_valid(event) if event.event == 'ms2' else is_candidate_valid(event))])
+    return cycles
+
+
+def init_worker(events: List[Event], exclusion_list_path: Optional[str]) -> None:
+    global _cycles, _exclusion_list_path
+    _cycles = group_cycles(events)
+    _exclusion_list_path = exclusion_list_path
+
+
+def simulate(tolerance: Dict[str, Any], cycles: List[List[Tuple[Event, ExclusionPoint]]], top_n: Optional[int] = None,
+             exclusion_list_path: Optional[str] = None) -> SimulationResult:
+    """
+    Replay the cycles with a dynamic exclusion tolerance.
+
+    Args:
+        tolerance (Dict[str, Any]): The DynamicExclusionTolerance, as a dict.
+        cycles: The events of each cycle with their points, see group_cycles.
+        top_n (Optional[int]): Maximum number of candidates sampled per cycle (the most intense ones), None for all.
+        exclusion_list_path (Optional[str]): Saved exclusion list to start from, None to start from an empty list.
+
+    Returns:
+        SimulationResult: The result.
+    """
+    start_time = time.perf_counter()
+    dynamic_tolerance = DynamicExclusionTolerance.from_dict(tolerance)
+    exclusion_list = ExclusionList()
+    if exclusion_list_path is not None:
+        exclusion_list.load(exclusion_list_path)
+
+    result = SimulationResult(tolerance=tolerance)
+    sampled_precursors = set()
+    interval_ids = itertools.count(1)
+    for cycle in cycles:
+        # the hot window follows the acquisition, as the server moves it between real-time queries
+        cycle_rt = max((point.rt for _, point in cycle if point.rt is not None), default=None)
+        if exclusion_list.advance_hot_window(cycle_rt):
+            exclusion_list.step_hot_window()
+
+        sampled = []
+        candidates = []
+        for event, point in cycle:
+            if event.event == 'ms2':
+                sampled.append((event, point))
+                continue
+            result.candidates += 1
+            if exclusion_list.is_excluded(point):
+                result.excluded += 1
+            else:
+                candidates.append((event, point))
+
+        if top_n is not None and len(candidates) > top_n:
+            candidates.sort(key=lambda candidate: candidate[0].intensity or 0, reverse=True)
+            candidates = candidates[:top_n]
+        sampled.extend(candidates)
+
+        for event, point in sampled:
+            result.samples += 1
+            sampled_precursors.add(event.precursor_id)
+            if not is_ms2_valid(event):
+                continue
+            exclusion_list.add(dynamic_tolerance.construct_interval(
+                interval_id=f'{INTERVAL_ID_PREFIX}_{next(interval_ids)}', exclusion_point=point))
+
+    result.unique_precursors = len(sampled_precursors)
+    result.redundant_samples = result.samples - result.unique_precursors
+    result.redundancy = result.redundant_samples / result.samples if result.samples else 0.0
+    result.seconds = time.perf_counter() - start_time
+    return result
+
+
+def simulate_in_worker(tolerance: Dict[str, Any], top_n: Optional[int]) -> SimulationResult:
+    return simulate(tolerance, _cycles, top_n, _exclusion_list_path)
+
+
+def simulate_grid(events: List[Event], tolerances: List[Dict[str, Any]], top_n: Optional[int] = None,
+                  workers: Optional[int] = None, exclusion_list_path: Optional[str] = None) -> List[SimulationResult]:
+    """
+    Simulate each tolerance in a process pool.
+
+    Args:
+        events (List[Event]): The recorded events.
+        tolerances (List[Dict[str, Any]]): The tolerances, as dicts.
+        top_n (Optional[int]): Maximum number of candidates sampled per cycle, None for all.
+        workers (Optional[int]): Number of processes, default os.cpu_count(). With 1, the tolerances are simulated in
+            this process.
+        exclusion_list_path (Optional[str]): Saved exclusion list to start each simulation from.
+
+    Returns:
+        List[SimulationResult]: The results, in the order of the tolerances.
+    """
+    # validate the tolerances before starting the workers
+    for tolerance in tolerances:
+        DynamicExclusionTolerance.from_dict(tolerance)
+
+    if workers == 1:
+        cycles = group_cycles(events)
+        return [simulate(tolerance, cycles, top_n, exclusion_list_path) for tolerance in tolerances]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(events, exclusion_list_path)) as executor:
+        return list(executor.map(simulate_in_worker, tolerances, itertools.repeat(top_n)))
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Simulate dynamic exclusion tolerances on a recorded run.')
+    parser.add_argument('events', help='csv file of recorded candidates and MS2 events')
+    parser.add_argument('grid', help='json file with a list of tolerances or a dict of lists of tolerance values')
+    parser.add_argument('--top-n', type=int, default=None, help='maximum number of candidates sampled per cycle')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: cpu count)')
+    parser.add_argument('--exclusion-list', default=None, help='saved exclusion list to start from')
+    parser.add_argument('--output', default=None, help='json file for the results (default: stdout)')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    events = read_events(args.events)
+    with open(args.grid) as f:
+        tolerances = expand_grid(json.load(f))
+    _log.info(f'Simulating {len(tolerances)} tolerances on {len(events)} events with {args.workers or os.cpu_count()} '
+              f'workers')
+
+    start_time = time.perf_counter()
+    results = simulate_grid(events, tolerances, args.top_n, args.workers, args.exclusion_list)
+    _log.info(f'Simulated {len(results)} tolerances in {time.perf_counter() - start_time:.1f} s')
+
+    results = sorted(results, key=lambda result: (-result.unique_precursors, result.redundancy))
+    output = json.dumps([dataclasses.asdict(result) for result in results], indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Tests of the catalog of saved exclusion lists.
+"""
+
+import os
+import random
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from catalog import Catalog
+from exclusion_list import ExclusionList
+from test_exclusion_list import random_interval
+
+
+def save_list(file_path: str, num_intervals: int, seed: int = 0) -> ExclusionList:
+    rng = random.Random(seed)
+    exclusion_list = ExclusionList()
+    for _ in range(num_intervals):
+        exclusion_list.add(random_interval(rng))
+    exclusion_list.save(file_path)
+    return exclusion_list
+
+
+@pytest.fixture
+def data_folder(tmp_path) -> str:
+    data_folder = str(tmp_path / 'pickles')
+    os.makedirs(data_folder)
+    return data_folder
+
+
+def test_sync_and_complete(tmp_path, data_folder):
+    exclusion_list = save_list(os.path.join(data_folder, 'run1.pkl'), 100)
+    catalog = Catalog(file_path=str(tmp_path / 'catalog.json'))
+    catalog.sync(data_folder)
+    entry = catalog.entries['run1']
+    assert not entry.is_complete()
+    assert entry.byte_size == os.path.getsize(os.path.join(data_folder, 'run1.pkl'))
+
+    assert catalog.complete_partial_entries(data_folder) == 1
+    entry = catalog.entries['run1']
+    assert entry.is_complete()
+    assert entry.interval_count == len(exclusion_list)
+    assert entry.charge_counts == exclusion_list.summary()['charge_counts']
+    assert entry.format_version == exclusion_list.format_version
+
+    # the completed entries are persisted and not read again
+    catalog = Catalog.from_file(catalog.file_path)
+    catalog.sync(data_folder)
+    assert catalog.entries['run1'].is_complete()
+    assert catalog.complete_partial_entries(data_folder) == 0
+
+
+def test_sync_detects_rewrites(tmp_path, data_folder):
+    file_path = os.path.join(data_folder, 'run1.pkl')
+    save_list(file_path, 100)
+    catalog = Catalog(file_path=str(tmp_path / 'catalog.json'))
+    catalog.sync(data_folder)
+    catalog.complete_partial_entries(data_folder)
+
+    # a rewrite of the same size is detected by its modification time
+    mtime = os.path.getmtime(file_path)
+    os.utime(file_path, (mtime + 10, mtime + 10))
+    catalog.sync(data_folder)
+    assert not catalog.entries['run1'].is_complete()
+
+    os.remove(file_path)
+    catalog.sync(data_folder)
+    assert 'run1' not in catalog.entries
+
+
+def test_update_and_remove(tmp_path, data_folder):
+    file_path = os.path.join(data_folder, 'run1.pkl')
+    exclusion_list = save_list(file_path, 50)
+    catalog = Catalog(file_path=str(tmp_path / 'catalog.json'))
+    entry = catalog.update('run1', file_path, exclusion_list.summary())
+    assert entry.interval_count == 50
+    assert entry.mtime == os.path.getmtime(file_path)
+
+    catalog.remove('run1')
+    assert Catalog.from_file(catalog.file_path).entries == {}
+
+
+def test_startup_completes_partial_entries(server):
+    exclusion_list = save_list(server.get_pickle_path('run1'), 100)
+    server.catalog.sync(server.DATA_FOLDER)
+    with TestClient(server.app) as client:
+        deadline = time.monotonic() + 10
+        while not server.catalog.entries['run1'].is_complete() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        entry = client.get('/exclusionms/catalog/run1').json()
+    assert entry['interval_count'] == len(exclusion_list)
@@ -0,0 +1,122 @@
+"""
+Tests of the budgeted server check of the plugin (data/exclusion_budget.py), against a live server and a slow stub
+server.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from exclusionms.components import ExclusionPoint
+
+from test_exclusion_replica import import_plugin_module
+from test_main import make_interval, make_point
+
+exclusion_budget = import_plugin_module('exclusion_budget')
+BudgetedExclusionChecker = exclusion_budget.BudgetedExclusionChecker
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    Answers every point as excluded after a delay, recording the X-Deadline-Ms header of each request.
+    """
+    delay = 0.0
+    status_code = 200
+    deadline_status = None
+    deadline_headers = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        SlowHandler.deadline_headers.append(self.headers.get('X-Deadline-Ms'))
+        time.sleep(self.delay)
+        count = len(payload['mass']) if isinstance(payload, dict) else len(payload)
+        body = json.dumps([True] * count).encode()
+        try:
+            self.send_response(self.status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if self.deadline_status is not None:
+                self.send_header('X-Deadline-Status', self.deadline_status)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    monkeypatch.setattr(SlowHandler, 'deadline_headers', [])
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{http_server.server_address[1]}'
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def points(count: int):
+    return [ExclusionPoint(**make_point(mass=500.01 + i)) for i in range(count)]
+
+
+def test_checks_on_server_within_budget(live_server):
+    requests.post(f'{live_server.url}/exclusionms/intervals', params={'wait': True},
+                  json=[make_interval('run1_1')]).raise_for_status()
+    checker = BudgetedExclusionChecker(live_server.url, budget_ms=5000, batch_size=2)
+    assert checker.get_excluded_points(points(5)) == [True, False, False, False, False]
+    report = checker.report()
+    assert report['cycles'] == 1 and report['misses'] == 0 and report['degraded_points'] == 0
+    assert report['batch_latency_ms']['count'] == 3
+
+
+def test_unchecked_points_fail_open(slow_server, monkeypatch):
+    monkeypatch.setattr(SlowHandler, 'delay', 0.5)
+    checker = BudgetedExclusionChecker(slow_server, budget_ms=50)
+    start_time = time.monotonic()
+    assert checker.get_excluded_points(points(3)) == [False] * 3
+    assert time.monotonic() - start_time < 0.4
+    assert checker.misses == 1 and checker.degraded_points == 3 and checker.errors == 0
+    assert float(SlowHandler.deadline_headers[0]) <= 50
+
+    # the fallback checks the points the server did not answer
+    assert checker.get_excluded_points(points(2), fallback=lambda unchecked: [True] * len(unchecked)) == [True] * 2
+    assert checker.misses == 2
+
+
+def test_shed_points_are_checked_by_fallback(slow_server, monkeypatch):
+    monkeypatch.setattr(SlowHandler, 'deadline_status', 'shed')
+    checker = BudgetedExclusionChecker(slow_server, budget_ms=1000)
+    assert checker.get_excluded_points(points(2), fallback=lambda unchecked: [False] * len(unchecked)) == [False] * 2
+    assert checker.misses == 1
+
+
+def test_no_budget_waits_for_server(slow_server, monkeypatch):
+    monkeypatch.setattr(SlowHandler, 'delay', 0.2)
+    checker = BudgetedExclusionChecker(slow_server)
+    assert checker.budget_ms is None
+    assert checker.get_excluded_points(points(3)) == [True] * 3
+    assert checker.misses == 0
+    assert SlowHandler.deadline_headers == [None]
+
+    # without a budget, only failed requests fall back
+    monkeypatch.setattr(SlowHandler, 'status_code', 500)
+    assert checker.get_excluded_points(points(3)) == [False] * 3
+    assert checker.errors == 1 and checker.misses == 1
+
+
+def test_batches_shrink_when_budget_at_risk(slow_server, monkeypatch):
+    monkeypatch.setattr(SlowHandler, 'delay', 0.03)
+    checker = BudgetedExclusionChecker(slow_server, budget_ms=50, batch_size=64)
+    for _ in range(8):
+        checker.get_excluded_points(points(1))
+    assert checker.endpoint == exclusion_budget.ENDPOINTS[1]
+    assert checker.batch_size == 32
+
+    # the compact batch endpoint is used from then on
+    monkeypatch.setattr(SlowHandler, 'delay', 0.0)
+    assert checker.get_excluded_points(points(2)) == [True] * 2
@@ -0,0 +1,190 @@
+"""
+Tests of ExclusionList against the reference MassIntervalTree of exclusionms.db.
+
+The lists are filled with random intervals covering the edge cases of the indexes: null bounds and charges, intervals
+wider than the mass and rt bins, duplicate ids, ids without a prefix and overflowing id suffixes.
+"""
+
+import random
+from typing import List, Tuple
+
+import pytest
+from exclusionms.components import ExclusionInterval, ExclusionPoint
+from exclusionms.db import MassIntervalTree
+
+from exclusion_list import ExclusionList
+
+NUM_INTERVALS = 500
+NUM_POINTS = 500
+PREFIXES = ['run0', 'run1', 'run2', 'run3']
+
+
+def random_bounds(rng: random.Random, low: float, high: float, widths: List[float],
+                  null_probability: float) -> Tuple:
+    if rng.random() < null_probability:
+        return None, None
+    value = rng.uniform(low, high)
+    return value, value + rng.choice(widths)
+
+
+def random_interval_id(rng: random.Random) -> str:
+    prefix = rng.choice(PREFIXES)
+    return rng.choice([f'{prefix}_{rng.randrange(500)}', prefix, f'x_{rng.randrange(5)}_y',
+                       f'{prefix}_0{rng.randrange(9)}', f'{prefix}_{2 ** 70 + rng.randrange(3)}'])
+
+
+def random_interval(rng: random.Random) -> ExclusionInterval:
+    min_mass, max_mass = random_bounds(rng, 500, 520, [0.01, 0.05, 5, 100], 0.05)
+    min_rt, max_rt = random_bounds(rng, 0, 3000, [10, 60, 2000], 0.2)
+    min_ook0, max_ook0 = random_bounds(rng, 0.8, 1.2, [0.05], 0.3)
+    min_intensity, max_intensity = random_bounds(rng, 0, 1e5, [1e4, 1e6], 0.7)
+    return ExclusionInterval(interval_id=random_interval_id(rng), charge=rng.choice([None, 1, 2]),
+                             min_mass=min_mass, max_mass=max_mass, min_rt=min_rt, max_rt=max_rt,
+                             min_ook0=min_ook0, max_ook0=max_ook0, min_intensity=min_intensity,
+                             max_intensity=max_intensity, exclusion=rng.random() < 0.8)
+
+
+def random_point(rng: random.Random) -> ExclusionPoint:
+    def value(low: float, high: float, null_probability: float):
+        return None if rng.random() < null_probability else rng.uniform(low, high)
+
+    return ExclusionPoint(charge=rng.choice([None, 1, 2]), mass=value(500, 520, 0.05), rt=value(0, 3000, 0.1),
+                          ook0=value(0.8, 1.2, 0.1), intensity=value(0, 2e5, 0.5))
+
+
+def id_query(interval_id: str) -> ExclusionInterval:
+    return ExclusionInterval(interval_id=interval_id, charge=None, min_mass=None, max_mass=None, min_rt=None,
+                             max_rt=None, min_ook0=None, max_ook0=None, min_intensity=None, max_intensity=None)
+
+
+def interval_key(interval: ExclusionInterval) -> str:
+    return repr((interval.interval_id, interval.charge, interval.min_mass, interval.max_mass, interval.min_rt,
+                 interval.max_rt, interval.min_ook0, interval.max_ook0, interval.min_intensity, interval.max_intensity,
+                 interval.exclusion))
+
+
+def interval_keys(intervals) -> List[str]:
+    return sorted(map(interval_key, intervals))
+
+
+@pytest.fixture
+def rng() -> random.Random:
+    return random.Random(0)
+
+
+@pytest.fixture
+def filled_lists(rng) -> Tuple[ExclusionList, MassIntervalTree]:
+    exclusion_list, tree = ExclusionList(), MassIntervalTree()
+    for _ in range(NUM_INTERVALS):
+        interval = random_interval(rng)
+        exclusion_list.add(interval)
+        tree.add(interval)
+    return exclusion_list, tree
+
+
+def assert_same_points(exclusion_list: ExclusionList, tree: MassIntervalTree, rng: random.Random) -> None:
+    for _ in range(NUM_POINTS):
+        point = random_point(rng)
+        assert int(exclusion_list.point_status(point)) == int(tree.point_status(point)), point
+        assert exclusion_list.is_excluded(point) == tree.is_excluded(point), point
+        assert interval_keys(exclusion_list.query_by_point(point)) == interval_keys(tree.query_by_point(point)), point
+
+
+def assert_same_ids(exclusion_list: ExclusionList, tree: MassIntervalTree, rng: random.Random) -> None:
+    for _ in range(200):
+        interval_id = random_interval_id(rng)
+        assert interval_keys(exclusion_list.query_by_id(interval_id)) == interval_keys(tree.query_by_id(interval_id))
+
+
+def test_point_status(filled_lists, rng):
+    exclusion_list, tree = filled_lists
+    assert len(exclusion_list) == len(tree)
+    assert_same_points(exclusion_list, tree, rng)
+
+
+def test_hot_window(filled_lists, rng):
+    exclusion_list, tree = filled_lists
+    rt = 0.0
+    for _ in range(NUM_POINTS):
+        rt += rng.uniform(0, 5)
+        exclusion_list.advance_hot_window(rt)
+        exclusion_list.step_hot_window(rng.randint(1, 50))
+        if rng.random() < 0.1:
+            interval = random_interval(rng)
+            exclusion_list.add(interval)
+            tree.add(interval)
+
+        point = random_point(rng)
+        point.rt = rt + rng.uniform(-60, 60)
+        assert interval_keys(exclusion_list.query_by_point(point)) == interval_keys(tree.query_by_point(point)), point
+    assert exclusion_list.hot_hits > 0
+
+
+def test_remove_by_id(filled_lists, rng):
+    exclusion_list, tree = filled_lists
+    for _ in range(500):
+        query = id_query(random_interval_id(rng))
+        assert interval_keys(exclusion_list.remove(query)) == interval_keys(tree.remove(query))
+        assert len(exclusion_list) == len(tree)
+
+    # slots freed by removes are reused by adds
+    for _ in range(500):
+        interval = random_interval(rng)
+        exclusion_list.add(interval)
+        tree.add(interval)
+    assert_same_ids(exclusion_list, tree, rng)
+    assert_same_points(exclusion_list, tree, rng)
+
+
+def test_remove_by_prefix(filled_lists, rng):
+    exclusion_list, tree = filled_lists
+    for prefix in PREFIXES[:2] + ['unknown']:
+        interval_ids = {interval.interval_id for interval in tree if interval.interval_id.rsplit('_', 1)[0] == prefix}
+        removed = sum(len(tree.remove(id_query(interval_id))) for interval_id in interval_ids)
+        assert exclusion_list.remove_by_prefix(prefix) == removed
+        assert len(exclusion_list) == len(tree)
+
+    assert exclusion_list.prefix_counts().keys().isdisjoint(PREFIXES[:2])
+    assert_same_ids(exclusion_list, tree, rng)
+    assert_same_points(exclusion_list, tree, rng)
+
+
+def test_save_load(filled_lists, rng, tmp_path):
+    exclusion_list, tree = filled_lists
+    for _ in range(200):
+        exclusion_list.remove(id_query(random_interval_id(rng)))
+    file_path = str(tmp_path / 'exclusion_list.pkl')
+    exclusion_list.save(file_path)
+
+    loaded = ExclusionList()
+    loaded.load(file_path)
+    assert len(loaded) == len(exclusion_list)
+    assert loaded.prefix_counts() == exclusion_list.prefix_counts()
+    assert interval_keys(loaded) == interval_keys(exclusion_list)
+    for _ in range(NUM_POINTS):
+        point = random_point(rng)
+        assert int(loaded.point_status(point)) == int(exclusion_list.point_status(point)), point
+        assert interval_keys(loaded.query_by_point(point)) == interval_keys(exclusion_list.query_by_point(point))
+
+
+def test_uuids(filled_lists, rng, tmp_path):
+    exclusion_list, tree = filled_lists
+    uuids = {interval.interval_uuid for interval in exclusion_list}
+    assert len(uuids) == len(exclusion_list) and None not in uuids
+
+    removed = next(iter(exclusion_list))
+    assert exclusion_list.remove_by_uuid(removed.interval_uuid).interval_uuid == removed.interval_uuid
+    assert len(exclusion_list) == NUM_INTERVALS - 1
+    with pytest.raises(ValueError):
+        exclusion_list.remove_by_uuid(removed.interval_uuid)
+
+    # uuids survive a save and load, and reused slots get new uuids
+    interval = random_interval(rng)
+    exclusion_list.add(interval)
+    assert interval.interval_uuid not in uuids
+    file_path = str(tmp_path / 'exclusion_list.pkl')
+    exclusion_list.save(file_path)
+    loaded = ExclusionList()
+    loaded.load(file_path)
+    assert {i.interval_uuid for i in loaded} == uuids - {removed.interval_uuid} | {interval.interval_uuid}
+    assert loaded.remove_by_uuid(interval.interval_uuid).interval_uuid == interval.interval_uuid
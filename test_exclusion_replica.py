@@ -0,0 +1,99 @@
+"""
+Tests of the exclusion list replica of the plugin (data/exclusion_replica.py) against a live server.
+
+The plugin modules import the exclusionms package vendored in the plugin folder (data/exclusionms) when deployed; the
+installed exclusionms package is registered under that name.
+"""
+
+import importlib
+import sys
+import time
+from typing import Callable
+
+import exclusionms
+import exclusionms.components
+import pytest
+import requests
+from exclusionms.components import ExclusionInterval, ExclusionPoint
+
+from conftest import LiveServer
+from test_main import make_interval, make_point, restart
+
+
+def import_plugin_module(name: str):
+    sys.modules.setdefault('data.exclusionms', exclusionms)
+    sys.modules.setdefault('data.exclusionms.components', exclusionms.components)
+    return importlib.import_module(f'data.{name}')
+
+
+ExclusionReplica = import_plugin_module('exclusion_replica').ExclusionReplica
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def replica(live_server):
+    replica = ExclusionReplica(live_server.url, poll_timeout=0.5, request_timeout=5, retry_interval=0.05)
+    yield replica
+    replica.stop()
+
+
+def test_replica_follows_server(live_server, server, replica):
+    requests.post(f'{live_server.url}/exclusionms/intervals', params={'wait': True},
+                  json=[make_interval('run1_1'), make_interval('run2_1', mass=600)]).raise_for_status()
+    replica.start()
+    assert replica.ready and len(replica) == 2
+
+    requests.delete(f'{live_server.url}/exclusionms/intervals/prefix', params={'prefix': 'run2'}).raise_for_status()
+    wait_until(lambda: replica.seq == server.mutation_log.seq)
+    assert len(replica) == 1
+    assert replica.get_excluded_points([ExclusionPoint(**make_point()), ExclusionPoint(**make_point(mass=600.01))]) \
+        == [True, False]
+
+
+def test_echo_of_local_add_is_skipped(live_server, server, replica):
+    replica.start()
+    interval = make_interval('run1_1')
+    replica.add_local(ExclusionInterval(**interval))
+    assert len(replica) == 1
+    assert replica.get_excluded_points([ExclusionPoint(**make_point())]) == [True]
+
+    requests.post(f'{live_server.url}/exclusionms/intervals', params={'wait': True}, json=[interval]).raise_for_status()
+    wait_until(lambda: replica.seq == server.mutation_log.seq)
+    assert len(replica) == 1
+
+    # an add of the same interval by another client is not an echo
+    requests.post(f'{live_server.url}/exclusionms/intervals', params={'wait': True}, json=[interval]).raise_for_status()
+    wait_until(lambda: replica.seq == server.mutation_log.seq)
+    assert len(replica) == 2
+
+
+def test_not_ready_after_failed_reload(live_server, server, replica):
+    requests.post(f'{live_server.url}/exclusionms/intervals', params={'wait': True},
+                  json=[make_interval('run1_1')]).raise_for_status()
+    # the snapshot is loaded without the polling thread, the reloads are applied directly
+    replica._load_snapshot()
+    assert replica.ready
+
+    live_server.stop()
+    with pytest.raises(requests.ConnectionError):
+        replica._apply({'op': 'reset', 'seq': server.mutation_log.seq + 1})
+    assert not replica.ready
+
+    # the restarted server warm starts from its checkpoint, with a new epoch
+    restarted_server = restart(server)
+    restarted = LiveServer(restarted_server.app, port=live_server.port).start()
+    try:
+        requests.post(f'{restarted.url}/exclusionms/intervals', params={'wait': True},
+                      json=[make_interval('run2_1')]).raise_for_status()
+        replica._apply({'op': 'reset', 'seq': restarted_server.mutation_log.seq})
+        assert replica.ready
+        assert len(replica) == 2
+        assert replica.seq == restarted_server.mutation_log.seq
+    finally:
+        restarted.stop()
@@ -0,0 +1,99 @@
+"""
+Tests of the query traces: the explain endpoints, the sampling of live point queries and the aggregate report.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from explain import QueryTraces, aggregate_traces
+from test_main import add_intervals, make_interval, make_point
+
+POINTS = [make_point(), make_point(mass=900.0), make_point(mass=None)]
+
+
+def test_explain_points(client):
+    add_intervals(client, [make_interval('run1_1'), make_interval('run1_2', mass=500.005, charge=None)])
+    traces = client.post('/exclusionms/points/explain', json=POINTS).json()
+
+    assert [trace['prefilter'] for trace in traces] == ['passed', 'rejected', 'skipped']
+    assert [trace['matched'] for trace in traces] == [2, 0, 2]
+    assert [trace['status'] for trace in traces] == [0, -1, 0]
+    assert [trace['candidates_from'] for trace in traces] == ['mass_bin', None, 'scan']
+    charge_stage = next(stage for stage in traces[0]['stages'] if stage['stage'] == 'charge')
+    assert (charge_stage['in'], charge_stage['out'], charge_stage['null_bounds']) == (2, 2, 1)
+
+
+def test_query_traces_report(client):
+    add_intervals(client, [make_interval('run1_1')])
+    client.post('/exclusionms/points/explain', json=POINTS)
+    client.post('/exclusionms/intervals/explain', json=[make_interval('run1_1'), make_interval(None, mass=700)])
+
+    report = client.get('/admin/query_traces').json()
+    assert report['sample_interval'] == 0 and report['sampled_points'] == 0
+    assert report['point']['queries'] == 3
+    assert report['point']['status'] == {'0': 2, '-1': 1}
+    assert report['point']['prefilter'] == {'passed': 1, 'rejected': 1, 'skipped': 1}
+    assert report['point']['mean_interval_count'] == 1
+    assert report['interval']['queries'] == 2
+    assert report['interval']['candidates_from'] == {'id': 1, 'mass_bin': 1}
+
+    client.delete('/admin/query_traces')
+    assert client.get('/admin/query_traces').json() == {'window': 1000, 'sample_interval': 0, 'sampled_points': 0}
+
+
+def test_aggregate_traces():
+    def stage(name, stage_in, stage_out, null_bounds=0, skipped=False, ms=1.0):
+        return {'stage': name, 'in': stage_in, 'out': stage_out, 'null_bounds': null_bounds, 'skipped': skipped,
+                'ms': ms}
+
+    traces = [{'kind': 'point', 'index': 'full', 'candidates_from': 'mass_bin', 'status': 0, 'interval_count': 10,
+               'prefilter': 'passed', 'total_ms': 1.0, 'stages': [stage('candidates', 10, 4), stage('rt', 4, 1, 1)]},
+              {'kind': 'point', 'index': 'hot', 'candidates_from': 'mass_bin', 'status': -1, 'interval_count': 20,
+               'prefilter': 'passed', 'total_ms': 3.0, 'stages': [stage('candidates', 20, 0, ms=3.0),
+                                                                  stage('rt', 0, 0, skipped=True)]}]
+    report = aggregate_traces(traces)
+    assert report['queries'] == 2
+    assert report['index'] == {'full': 1, 'hot': 1}
+    assert report['mean_interval_count'] == 15
+    assert report['stages']['candidates'] == {'count': 2, 'mean_in': 15, 'mean_out': 2, 'pruned_ratio': 1 - 4 / 30,
+                                              'null_bound_ratio': 0.0, 'skipped_ratio': 0.0, 'mean_ms': 2.0}
+    assert report['stages']['rt']['null_bound_ratio'] == 1.0
+    assert report['stages']['rt']['skipped_ratio'] == 0.5
+    assert report['total_ms'] == {'mean': 2.0, 'p95': 3.0, 'max': 3.0}
+
+
+def test_sample_selects_every_nth_point():
+    query_traces = QueryTraces(sample_interval=3)
+    assert query_traces.sample(range(7)) == [2, 5]
+    assert query_traces.sample(range(2)) == [1]
+    assert query_traces.sampled_points == 9
+    assert QueryTraces(sample_interval=0).sample(range(7)) == []
+
+
+@pytest.mark.parametrize('endpoint', ['/exclusionms/points/status_search', '/exclusionms/points/exclusion_search'])
+def test_live_points_are_traced_after_the_query(client, server, endpoint):
+    add_intervals(client, [make_interval('run1_1')])
+    server.query_traces.sample_interval = 2
+    explain_point = server.active_exclusion_list.explain_point
+    traced_in_background = []
+
+    def record_explain_point(point):
+        traced_in_background.append(asyncio.current_task() in server.trace_tasks)
+        return explain_point(point)
+
+    server.active_exclusion_list.explain_point = record_explain_point
+
+    response = client.post(endpoint, json=[make_point(), make_point(mass=900.0)] * 2)
+    assert response.status_code == 200
+    deadline = time.monotonic() + 10
+    while server.trace_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # the sampled points were traced by a background task, after the query released the lock
+    assert traced_in_background == [True, True]
+    report = client.get('/admin/query_traces').json()
+    assert report['sampled_points'] == 4
+    assert report['point']['queries'] == 2
+    assert report['point']['status'] == {'-1': 2}
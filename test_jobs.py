@@ -0,0 +1,52 @@
+"""
+Tests of the bulk point status jobs.
+"""
+
+import asyncio
+import dataclasses
+import random
+
+import jobs
+from exclusion_list import ExclusionList
+from utils import Offset
+from test_exclusion_list import random_interval, random_point
+
+
+def write_points(file_path: str, points) -> None:
+    with open(file_path, 'w') as f:
+        f.write('charge,mass,rt,ook0,intensity\n')
+        for point in points:
+            f.write(','.join('' if value is None else str(value)
+                             for value in (point.charge, point.mass, point.rt, point.ook0, point.intensity)) + '\n')
+
+
+def test_status_job(tmp_path):
+    rng = random.Random(0)
+    exclusion_list = ExclusionList()
+    for _ in range(500):
+        exclusion_list.add(random_interval(rng))
+    points = [random_point(rng) for _ in range(300)]
+    job = jobs.BulkJob.create(str(tmp_path))
+    write_points(job.input_path, points)
+    job.points_total = jobs.count_points(job.input_path)
+    job.queue(workers=2)
+
+    asyncio.run(jobs.run_job(job, exclusion_list.to_state(), dataclasses.asdict(Offset()), chunk_size=64))
+    assert job.status == 'done', job.error
+    assert job.points_done == job.points_total == len(points)
+    with open(job.output_path) as f:
+        statuses = [line.strip() for line in f]
+    # statuses are written as integers, not enum names
+    assert statuses == [str(int(exclusion_list.point_status(point))) for point in points]
+
+
+def test_status_job_invalid_line(tmp_path):
+    job = jobs.BulkJob.create(str(tmp_path))
+    with open(job.input_path, 'w') as f:
+        f.write('2,500.0,10.0,1.0,\nnot,a,point\n')
+    job.points_total = jobs.count_points(job.input_path)
+    job.queue(workers=1)
+
+    asyncio.run(jobs.run_job(job, ExclusionList().to_state(), dataclasses.asdict(Offset())))
+    assert job.status == 'failed'
+    assert 'Invalid point line' in job.error
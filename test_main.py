@@ -0,0 +1,133 @@
+"""
+Tests of the server endpoints.
+"""
+
+import asyncio
+import importlib
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, Optional
+
+from fastapi.testclient import TestClient
+
+from constants import CHECKPOINT_EXID
+from exclusion_list import ExclusionList
+from profiling import timed_lock
+from scheduling import Priority
+from test_exclusion_list import random_interval
+
+
+def make_interval(interval_id: str, mass: float = 500.0, rt: Optional[float] = 100.0, charge: Optional[int] = 2,
+                  exclusion: bool = True) -> Dict[str, Any]:
+    return {'interval_id': interval_id, 'charge': charge, 'min_mass': mass, 'max_mass': mass + 0.02,
+            'min_rt': rt, 'max_rt': None if rt is None else rt + 60, 'min_ook0': 0.9, 'max_ook0': 1.1,
+            'min_intensity': None, 'max_intensity': None, 'exclusion': exclusion}
+
+
+def make_point(mass: float = 500.01, rt: Optional[float] = 120.0, charge: Optional[int] = 2) -> Dict[str, Any]:
+    return {'charge': charge, 'mass': mass, 'rt': rt, 'ook0': 1.0, 'intensity': None}
+
+
+def add_intervals(client, intervals) -> None:
+    response = client.post('/exclusionms/intervals', params={'wait': True}, json=intervals)
+    assert response.status_code == 200, response.text
+
+
+def test_delete_intervals_by_prefix(client, server):
+    add_intervals(client, [make_interval(f'run1_{i}', mass=500 + i) for i in range(5)] +
+                  [make_interval(f'run2_{i}', mass=600 + i) for i in range(3)] + [make_interval('run1')])
+    assert client.get('/exclusionms/statistics').json()['prefix_counts'] == {'run1': 6, 'run2': 3}
+
+    seq = server.mutation_log.seq
+    response = client.delete('/exclusionms/intervals/prefix', params={'prefix': 'run1'})
+    assert response.status_code == 200
+    assert response.json() == 6
+    assert server.mutation_log.since(seq)[0].op == 'remove_prefix'
+    assert client.get('/exclusionms/statistics').json()['prefix_counts'] == {'run2': 3}
+    assert client.post('/exclusionms/points/exclusion_search', json=[make_point(500.01), make_point(600.01)]).json() \
+        == [False, True]
+
+    # an unknown prefix removes nothing and is not logged
+    seq = server.mutation_log.seq
+    assert client.delete('/exclusionms/intervals/prefix', params={'prefix': 'run3'}).json() == 0
+    assert server.mutation_log.seq == seq
+
+
+def test_delete_intervals_by_prefix_on_replica(client, server):
+    server.replication_state.primary = 'http://primary'
+    assert client.delete('/exclusionms/intervals/prefix', params={'prefix': 'run1'}).status_code == 403
+
+
+def restart(server):
+    """
+    Import a fresh server module in the same working directory, as after a restart of the server.
+    """
+    sys.modules.pop('main', None)
+    return importlib.import_module('main')
+
+
+def test_checkpoint_and_warm_start(server):
+    with TestClient(server.app) as client:
+        add_intervals(client, [make_interval(f'run1_{i}', mass=500 + i) for i in range(10)])
+        assert server.active_list_state.exid is None
+
+    # a list which was never saved is checkpointed under the default exid
+    assert server.active_list_state.exid == CHECKPOINT_EXID
+    assert os.path.exists(server.get_pickle_path(CHECKPOINT_EXID))
+
+    server = restart(server)
+    with TestClient(server.app) as client:
+        deadline = time.monotonic() + 10
+        while client.get('/exclusionms/ready').status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(server.active_exclusion_list) == 10
+        assert server.active_list_state.exid == CHECKPOINT_EXID
+        assert not server.active_list_state.dirty
+
+
+def test_failed_save_keeps_active_exid(client, server):
+    add_intervals(client, [make_interval('run1_1')])
+    assert client.post('/exclusionms/save', params={'exid': 'saved'}).status_code == 200
+    assert server.active_list_state.read_exid() == 'saved'
+
+    # the file of 'broken' cannot be written
+    add_intervals(client, [make_interval('run1_2')])
+    os.makedirs(server.get_pickle_path('broken'))
+    assert client.post('/exclusionms/save', params={'exid': 'broken'}).status_code == 500
+    assert server.active_list_state.read_exid() == 'saved'
+    assert server.active_list_state.exid == 'saved'
+    assert server.active_list_state.dirty
+
+
+def test_delete_nothing_keeps_list_clean(client, server):
+    add_intervals(client, [make_interval('run1_1')])
+    assert client.post('/exclusionms/save', params={'exid': 'saved'}).status_code == 200
+    assert client.request('DELETE', '/exclusionms/intervals', json=[make_interval('run2_1')]).status_code == 200
+    assert client.delete('/exclusionms/intervals/prefix', params={'prefix': 'run2'}).json() == 0
+    assert not server.active_list_state.dirty
+
+    assert client.delete('/exclusionms/intervals/prefix', params={'prefix': 'run1'}).json() == 1
+    assert server.active_list_state.dirty
+
+
+def test_queries_are_served_while_loading(server):
+    rng = random.Random(0)
+    exclusion_list = ExclusionList()
+    for _ in range(50000):
+        exclusion_list.add(random_interval(rng))
+    exclusion_list.save(server.get_pickle_path('large'))
+
+    async def query_while_loading() -> str:
+        load_task = asyncio.create_task(server.load_exclusion_list('large'))
+        while server.active_list_state.status != 'loading':
+            await asyncio.sleep(0)
+        async with timed_lock(server.lock, Priority.REALTIME):
+            status = server.active_list_state.status
+        await load_task
+        return status
+
+    assert asyncio.run(query_while_loading()) == 'loading'
+    assert len(server.active_exclusion_list) == 50000
+    assert server.active_list_state.exid == 'large'
@@ -0,0 +1,116 @@
+"""
+Tests of the prefilter of point queries: the answers of an ExclusionList using it must match the reference
+MassIntervalTree, and most points outside the intervals must be rejected by it.
+"""
+
+import random
+
+import pytest
+from exclusionms.components import ExclusionInterval, ExclusionPoint
+from exclusionms.db import MassIntervalTree
+
+from exclusion_list import ExclusionList, MIN_PREFILTER_SIZE
+from prefilter import CountingBloomFilter
+from test_exclusion_list import id_query, interval_keys
+
+NUM_INTERVALS = 6000
+NUM_POINTS = 2000
+
+
+def charged_interval(rng: random.Random, interval_id: str) -> ExclusionInterval:
+    """
+    A narrow interval with a charge, as added by the instrument: it is indexed by the prefilter.
+    """
+    mass, rt, ook0 = rng.uniform(400, 1200), rng.uniform(0, 3000), rng.uniform(0.7, 1.3)
+    return ExclusionInterval(interval_id=interval_id, charge=rng.randint(1, 4), min_mass=mass,
+                             max_mass=mass + rng.choice([0.01, 0.05]), min_rt=rt, max_rt=rt + 60,
+                             min_ook0=ook0 - 0.025, max_ook0=ook0 + 0.025, min_intensity=None, max_intensity=None,
+                             exclusion=rng.random() < 0.9)
+
+
+def charged_point(rng: random.Random, intervals) -> ExclusionPoint:
+    """
+    A point inside one of the intervals (half of the points), or a random point.
+    """
+    if rng.random() < 0.5:
+        interval = rng.choice(intervals)
+        return ExclusionPoint(charge=interval.charge, mass=(interval.min_mass + interval.max_mass) / 2,
+                              rt=interval.min_rt + 1, ook0=(interval.min_ook0 + interval.max_ook0) / 2,
+                              intensity=None)
+    return ExclusionPoint(charge=rng.randint(1, 4), mass=rng.uniform(400, 1200), rt=rng.uniform(0, 3000),
+                          ook0=rng.uniform(0.7, 1.3), intensity=None)
+
+
+def assert_same_points(exclusion_list: ExclusionList, tree: MassIntervalTree, intervals, rng: random.Random) -> None:
+    for _ in range(NUM_POINTS):
+        point = charged_point(rng, intervals)
+        assert int(exclusion_list.point_status(point)) == int(tree.point_status(point)), point
+        assert interval_keys(exclusion_list.query_by_point(point)) == interval_keys(tree.query_by_point(point)), point
+
+
+@pytest.mark.parametrize('ook0_bin_width', [None, 0.05])
+def test_prefilter_answers_match_tree(ook0_bin_width):
+    rng = random.Random(0)
+    exclusion_list, tree = ExclusionList(prefilter_ook0_bin_width=ook0_bin_width), MassIntervalTree()
+    intervals = [charged_interval(rng, f'run{i % 3}_{i}') for i in range(NUM_INTERVALS)]
+    for interval in intervals:
+        exclusion_list.add(interval)
+        tree.add(interval)
+
+    # the keys of the intervals do not fit in the initial prefilter, which was rebuilt larger
+    assert exclusion_list.prefilter.size > MIN_PREFILTER_SIZE
+    assert_same_points(exclusion_list, tree, intervals, rng)
+    stats = exclusion_list.prefilter_stats()
+    assert stats['checks'] == 2 * NUM_POINTS
+    assert stats['negatives'] > NUM_POINTS // 2
+    assert stats['false_positive_rate'] < 0.1
+
+    # removed intervals are removed from the prefilter
+    for interval in intervals[:NUM_INTERVALS // 2]:
+        assert interval_keys(exclusion_list.remove(id_query(interval.interval_id))) == \
+            interval_keys(tree.remove(id_query(interval.interval_id)))
+    assert exclusion_list.remove_by_prefix('run0') == sum(len(tree.remove(id_query(interval.interval_id)))
+                                                          for interval in intervals[NUM_INTERVALS // 2::3])
+    remaining = [interval for interval in intervals[NUM_INTERVALS // 2:] if not interval.interval_id.startswith('run0')]
+    assert len(exclusion_list) == len(tree) == len(remaining)
+    assert_same_points(exclusion_list, tree, remaining, rng)
+    assert_same_points(exclusion_list, tree, intervals[:NUM_INTERVALS // 2], rng)
+
+
+def test_wide_interval_disables_prefilter_for_its_charge():
+    rng = random.Random(1)
+    exclusion_list = ExclusionList()
+    intervals = [charged_interval(rng, f'run0_{i}') for i in range(100)]
+    for interval in intervals:
+        exclusion_list.add(interval)
+    exclusion_list.add(ExclusionInterval(interval_id='wide', charge=2, min_mass=None, max_mass=None, min_rt=None,
+                                         max_rt=None, min_ook0=None, max_ook0=None, min_intensity=None,
+                                         max_intensity=None))
+
+    assert exclusion_list.point_status(ExclusionPoint(charge=2, mass=5000.0, rt=None, ook0=None, intensity=None)) == 0
+    assert exclusion_list.prefilter_checks == 0
+    assert exclusion_list.point_status(ExclusionPoint(charge=3, mass=5000.0, rt=None, ook0=None, intensity=None)) == -1
+    assert exclusion_list.prefilter_checks == exclusion_list.prefilter_negatives == 1
+
+    # points without a charge or a mass are not prefiltered
+    exclusion_list.point_status(ExclusionPoint(charge=None, mass=5000.0, rt=None, ook0=None, intensity=None))
+    exclusion_list.point_status(ExclusionPoint(charge=3, mass=None, rt=None, ook0=None, intensity=None))
+    assert exclusion_list.prefilter_checks == 1
+
+
+def test_counting_bloom_filter():
+    bloom_filter = CountingBloomFilter(1024)
+    keys = [(charge, mass_bin, None) for charge in range(1, 3) for mass_bin in range(50)]
+    for key in keys + keys[:10]:
+        bloom_filter.add(key)
+    assert all(bloom_filter.may_contain(key) for key in keys)
+
+    # a key added twice stays until it is removed twice
+    for key in keys[:10]:
+        bloom_filter.remove(key)
+    assert all(bloom_filter.may_contain(key) for key in keys)
+    for key in keys:
+        bloom_filter.remove(key)
+    assert bloom_filter.keys == 0
+    assert not any(bloom_filter.may_contain(key) for key in keys)
+    assert bloom_filter.fill_ratio() == 0.0
@@ -0,0 +1,68 @@
+"""
+Tests of the profiling endpoints and server timing.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from profiling import SamplingProfiler, capture_cprofile
+
+
+def test_sampling_profiler(client):
+    assert client.post('/admin/profiler/start', params={'interval': 0.001}).status_code == 200
+    assert client.post('/admin/profiler/start').status_code == 409
+    for _ in range(20):
+        client.get('/exclusionms/statistics')
+    response = client.post('/admin/profiler/stop')
+    assert response.status_code == 200
+    # collapsed stacks: 'frame;frame;frame count' per line
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(' ', 1)
+        assert stack and int(count) > 0
+    assert client.post('/admin/profiler/stop').status_code == 409
+
+
+@pytest.mark.parametrize('interval', [0, -1, 0.0001, 2])
+def test_sampling_profiler_invalid_interval(client, interval):
+    assert client.post('/admin/profiler/start', params={'interval': interval}).status_code == 400
+    with pytest.raises(ValueError):
+        SamplingProfiler().start(interval=interval)
+
+
+def test_cprofile(client):
+    response = client.post('/admin/profiler/cprofile', params={'duration': 0.05, 'output': 'text'})
+    assert response.status_code == 200
+    assert 'function calls' in response.text
+    assert client.post('/admin/profiler/cprofile', params={'duration': 0}).status_code == 400
+    assert client.post('/admin/profiler/cprofile', params={'output': 'html'}).status_code == 400
+
+
+def test_cprofile_one_capture_at_a_time(server):
+    async def capture_twice():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await asyncio.gather(
+                client.post('/admin/profiler/cprofile', params={'duration': 0.2}),
+                client.post('/admin/profiler/cprofile', params={'duration': 0.2}))
+
+    status_codes = sorted(response.status_code for response in asyncio.run(capture_twice()))
+    assert status_codes == [200, 409]
+
+    async def capture_directly():
+        first = asyncio.create_task(capture_cprofile(0.1))
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError):
+            await capture_cprofile(0.1)
+        await first
+
+    asyncio.run(capture_directly())
+
+
+def test_server_timing(client):
+    assert 'Server-Timing' not in client.get('/exclusionms/statistics').headers
+    response = client.post('/exclusionms/points/exclusion_search', headers={'X-Server-Timing': '1'},
+                           json=[{'charge': 2, 'mass': 500.0, 'rt': 10.0, 'ook0': 1.0, 'intensity': None}])
+    assert 'lock' in response.headers['Server-Timing']
+    assert 'query' in response.headers['Server-Timing']
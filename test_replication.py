@@ -0,0 +1,66 @@
+"""
+Tests of the replication of the active exclusion list: snapshots, the mutation log and the replica position.
+"""
+
+import asyncio
+import random
+
+from exclusionms.components import ExclusionInterval
+from exclusionms.db import MassIntervalTree
+
+from exclusion_list import ExclusionList
+from mutations import MutationLog
+from replication import ReplicationState, columns_to_intervals
+from test_exclusion_list import random_interval, assert_same_points
+
+
+def test_snapshot_round_trip():
+    rng = random.Random(0)
+    exclusion_list, tree = ExclusionList(), MassIntervalTree()
+    for _ in range(500):
+        interval = random_interval(rng)
+        exclusion_list.add(interval)
+        tree.add(interval)
+
+    replica = ExclusionList()
+    for interval in columns_to_intervals(ExclusionList.state_to_columns(exclusion_list.to_state())):
+        replica.add(ExclusionInterval(**interval))
+    assert len(replica) == len(exclusion_list)
+    assert_same_points(replica, tree, rng)
+
+
+def test_mutation_log():
+    rng = random.Random(0)
+    mutation_log = MutationLog(capacity=10)
+    first_seq = mutation_log.append('add', intervals=[random_interval(rng)])
+    mutation_log.append('remove_prefix', prefix='run0')
+    assert [mutation.op for mutation in mutation_log.since(first_seq - 1)] == ['add', 'remove_prefix']
+    assert mutation_log.since(mutation_log.seq) == []
+    assert mutation_log.since(mutation_log.seq + 1) is None
+
+    # mutations past the capacity are dropped, a client behind them must fetch a new snapshot
+    mutation_log.append('add', intervals=[random_interval(rng) for _ in range(20)])
+    assert mutation_log.since(first_seq - 1) is None
+    assert [mutation.seq for mutation in mutation_log.since(mutation_log.seq - 1)] == [mutation_log.seq]
+
+
+def test_wait_for_seq():
+    async def wait() -> bool:
+        state = ReplicationState(primary='http://primary')
+        waiting = asyncio.create_task(state.wait_for_seq(2, timeout=1.0))
+        state.set_seq(1)
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        state.set_seq(2)
+        return await waiting
+
+    assert asyncio.run(wait())
+    assert not asyncio.run(ReplicationState(primary='http://primary').wait_for_seq(1, timeout=0.01))
+
+
+def test_report():
+    state = ReplicationState(primary=None)
+    state.record_poll('replica-1', 3)
+    report = state.report(5)
+    assert report['role'] == 'primary'
+    assert report['replicas']['replica-1']['lag'] == 2
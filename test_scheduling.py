@@ -0,0 +1,103 @@
+"""
+Tests of the scheduling of requests on the active exclusion list.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from scheduling import DEADLINE_STATUS_HEADER, DeadlineExceeded, Priority, PriorityLock, get_deadline
+from test_main import add_intervals, make_interval, make_point
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def serve_waiters():
+        lock, order = PriorityLock(), []
+
+        async def waiter(name: str, priority: Priority):
+            await lock.acquire(priority)
+            order.append(name)
+            lock.release()
+
+        await lock.acquire(Priority.BULK)
+        tasks = []
+        for name, priority in [('bulk', Priority.BULK), ('interactive', Priority.INTERACTIVE),
+                               ('realtime1', Priority.REALTIME), ('realtime2', Priority.REALTIME)]:
+            tasks.append(asyncio.create_task(waiter(name, priority)))
+            await asyncio.sleep(0)
+        assert lock.waiting() == {'REALTIME': 2, 'INTERACTIVE': 1, 'BULK': 1}
+
+        lock.release()
+        await asyncio.gather(*tasks)
+        assert not lock.locked()
+        return order
+
+    assert asyncio.run(serve_waiters()) == ['realtime1', 'realtime2', 'interactive', 'bulk']
+
+
+def test_waiter_is_shed_at_its_deadline():
+    async def wait_past_deadline():
+        lock = PriorityLock()
+        await lock.acquire(Priority.BULK)
+        start_time = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await lock.acquire(Priority.REALTIME, get_deadline(20))
+        assert 0.015 < time.monotonic() - start_time < 1
+        with pytest.raises(DeadlineExceeded):
+            await lock.acquire(Priority.REALTIME, get_deadline(-1))
+
+        # the shed waiter does not get the lock on release
+        assert lock.waiting()['REALTIME'] == 0
+        lock.release()
+        assert not lock.locked()
+        return lock.stats
+
+    stats = asyncio.run(wait_past_deadline())
+    assert stats[Priority.REALTIME].shed == 2
+    assert stats[Priority.REALTIME].admitted == 0
+    assert stats[Priority.BULK].admitted == 1
+
+
+def test_cancelled_waiter_hands_lock_on():
+    async def cancel_waiter():
+        lock = PriorityLock()
+        await lock.acquire(Priority.BULK)
+        cancelled = asyncio.create_task(lock.acquire(Priority.REALTIME))
+        waiting = asyncio.create_task(lock.acquire(Priority.BULK))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        lock.release()
+        await waiting
+        assert cancelled.cancelled()
+        assert lock.locked()
+        lock.release()
+        assert not lock.locked()
+
+    asyncio.run(cancel_waiter())
+
+
+def test_point_checks_are_shed(client, server):
+    add_intervals(client, [make_interval('run1_1')])
+
+    async def check_while_locked():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as async_client:
+            await server.lock.acquire(Priority.BULK)
+            try:
+                shed = await async_client.post('/exclusionms/points/status_search', json=[make_point()],
+                                               headers={'X-Deadline-Ms': '20'})
+            finally:
+                server.lock.release()
+            answered = await async_client.post('/exclusionms/points/status_search', json=[make_point()],
+                                               headers={'X-Deadline-Ms': '1000'})
+        return shed, answered
+
+    shed, answered = asyncio.run(check_while_locked())
+    assert shed.status_code == 200
+    assert shed.headers[DEADLINE_STATUS_HEADER] == 'shed'
+    assert shed.json() == [-1]
+    assert DEADLINE_STATUS_HEADER not in answered.headers
+    assert answered.json() == [0]
+    assert client.get('/admin/scheduler').json()['stats']['REALTIME']['shed'] == 1
@@ -0,0 +1,78 @@
+"""
+Tests of the set operations between saved exclusion lists.
+"""
+
+import random
+from typing import List
+
+import pytest
+from exclusionms.components import ExclusionInterval
+
+from exclusion_list import ExclusionList
+from setops import combine_files, combine_states
+from test_exclusion_list import random_interval
+
+
+def ids(intervals: List[ExclusionInterval]) -> List[str]:
+    return sorted({interval.interval_id for interval in intervals})
+
+
+@pytest.fixture
+def states():
+    rng = random.Random(0)
+    intervals = [random_interval(rng) for _ in range(300)]
+    first, second = ExclusionList(), ExclusionList()
+    for interval in intervals[:200]:
+        first.add(interval)
+    for interval in intervals[100:]:
+        second.add(interval)
+    return intervals, [first.to_state(), second.to_state()]
+
+
+def combined_ids(operation: str, states, dedup: str) -> List[str]:
+    combined = ExclusionList()
+    combined.set_state(combine_states(operation, states, dedup=dedup))
+    return sorted(ExclusionList.state_interval_ids(combined.to_state()))
+
+
+def test_combine_by_id(states):
+    intervals, states = states
+    first, second = set(ids(intervals[:200])), set(ids(intervals[100:]))
+    assert combined_ids('union', states, 'id') == ids(intervals)
+    assert combined_ids('intersection', states, 'id') == sorted(first & second)
+    assert combined_ids('difference', states, 'id') == sorted(first - second)
+
+
+def test_combine_by_geometry():
+    interval, same_interval = random_interval(random.Random(1)), random_interval(random.Random(1))
+    # the same interval saved under another id is counted once
+    same_interval.interval_id = 'other_1'
+    first, second = ExclusionList(), ExclusionList()
+    first.add(interval)
+    second.add(same_interval)
+    states = [first.to_state(), second.to_state()]
+    assert combined_ids('union', states, 'geometry') == [interval.interval_id]
+    assert combined_ids('intersection', states, 'geometry') == [interval.interval_id]
+    assert combined_ids('difference', states, 'geometry') == []
+
+
+def test_combine_files(states, tmp_path):
+    intervals, states = states
+    paths = [str(tmp_path / f'{name}.pkl') for name in ('first', 'second')]
+    for state, path in zip(states, paths):
+        ExclusionList.write_state(state, path)
+
+    result = combine_files('union', paths, str(tmp_path / 'union.pkl'), dedup='id')
+    assert result['input_counts'] == [200, 200]
+    combined = ExclusionList()
+    combined.load(str(tmp_path / 'union.pkl'))
+    assert ids(list(combined)) == ids(intervals)
+
+
+def test_combine_invalid():
+    with pytest.raises(ValueError):
+        combine_states('xor', [ExclusionList().to_state()])
+    with pytest.raises(ValueError):
+        combine_states('union', [ExclusionList().to_state()], dedup='name')
+    with pytest.raises(ValueError):
+        combine_states('union', [])
@@ -0,0 +1,75 @@
+"""
+Tests of the offline simulation of dynamic exclusion tolerances.
+"""
+
+from simulation import Event, expand_grid, get_precursor_id, group_cycles, read_events, simulate, simulate_grid
+
+TOLERANCE = {'charge': True, 'mass': 20, 'rt': 60, 'ook0': 0.05, 'intensity': None}
+
+
+def make_event(cycle: int, mass: float = 1000.0, rt: float = 100.0, event: str = 'candidate', charge=2, ook0=1.0,
+               intensity=1e5) -> Event:
+    return Event(cycle=cycle, event=event, charge=charge, mass=mass, rt=rt, ook0=ook0, intensity=intensity,
+                 precursor_id=get_precursor_id(charge, mass, ook0))
+
+
+def test_resampled_precursor_is_excluded():
+    # the same precursor in three cycles, the last one after the rt tolerance
+    events = [make_event(0, rt=100.0), make_event(1, rt=110.0), make_event(2, rt=200.0)]
+    result = simulate(TOLERANCE, group_cycles(events))
+    assert (result.candidates, result.excluded, result.samples, result.unique_precursors) == (3, 1, 2, 1)
+    assert result.redundancy == 0.5
+
+    narrow = simulate(dict(TOLERANCE, rt=1), group_cycles(events))
+    assert (narrow.excluded, narrow.samples, narrow.redundant_samples) == (0, 3, 2)
+
+
+def test_invalid_events_are_dropped():
+    events = [make_event(0, mass=500.0, ook0=0.0), make_event(0, mass=600.0, charge=None),
+              make_event(0, mass=700.0, event='ms2', intensity=None), make_event(0, mass=800.0, event='ms2')]
+    assert [event.mass for event, _ in group_cycles(events)[0]] == [800.0]
+
+
+def test_sampled_precursor_without_intensity_adds_no_interval():
+    events = [make_event(0, intensity=None), make_event(1, rt=110.0, intensity=None)]
+    result = simulate(TOLERANCE, group_cycles(events))
+    assert (result.excluded, result.samples, result.redundant_samples) == (0, 2, 1)
+
+
+def test_top_n_samples_most_intense_candidates():
+    events = [make_event(0, mass=1000.0, intensity=1e3), make_event(0, mass=1100.0, intensity=1e5),
+              make_event(0, mass=1200.0, intensity=1e4),
+              make_event(1, mass=1000.0, rt=110.0), make_event(1, mass=1100.0, rt=110.0)]
+    result = simulate(TOLERANCE, group_cycles(events), top_n=1)
+    # cycle 0 samples 1100 only, so cycle 1 samples 1000 and excludes 1100
+    assert (result.samples, result.excluded, result.unique_precursors) == (2, 1, 2)
+
+
+def test_recorded_ms2_adds_its_interval():
+    events = [make_event(0, event='ms2'), make_event(1, rt=110.0)]
+    result = simulate(TOLERANCE, group_cycles(events))
+    assert (result.candidates, result.excluded, result.samples) == (1, 1, 1)
+
+
+def test_read_events(tmp_path):
+    file_path = tmp_path / 'run.csv'
+    file_path.write_text('rt,charge,mz,ook0,intensity,event\n'
+                         '10.0,2,501.0,1.0,1000,\n'
+                         '10.0,2,601.0,1.0,,ms2\n'
+                         '11.0,None,701.0,1.0,1000,candidate\n')
+    events = read_events(str(file_path))
+    assert [event.cycle for event in events] == [0, 0, 1]
+    assert [event.event for event in events] == ['candidate', 'ms2', 'candidate']
+    assert abs(events[0].mass - (501.0 * 2 - 2 * 1.00727647)) < 1e-9
+    assert events[1].intensity is None
+    assert events[2].charge is None and events[2].mass is None
+
+
+def test_simulate_grid():
+    tolerances = expand_grid({'charge': [True], 'mass': [20], 'rt': [1, 60], 'ook0': [0.05], 'intensity': [None]})
+    assert [tolerance['rt'] for tolerance in tolerances] == [1, 60]
+
+    events = [make_event(cycle, rt=100.0 + 10 * cycle) for cycle in range(5)]
+    results = simulate_grid(events, tolerances, workers=1)
+    assert [result.samples for result in results] == [5, 1]
+    assert [result.tolerance for result in simulate_grid(events, tolerances, workers=2)] == tolerances
@@ -1,5 +1,7 @@
 import dataclasses
 
+from exclusionms.components import ExclusionPoint
+
 
 def convert_int(val):
     if val == 'None' or val == '':
@@ -30,4 +32,59 @@ class Offset:
         self.mass = 0
         self.rt = 0
         self.ook0 = 0
-        self.intensity = 0
\ No newline at end of file
+        self.intensity = 0
+
+
+def apply_offset(point: ExclusionPoint, offset: Offset):
+    """
+    Applies the given offset to the specified ExclusionPoint object.
+
+    Args:
+        point: An ExclusionPoint object representing the point to apply the offset to.
+        offset: An Offset object representing the offset to apply to the ExclusionPoint object.
+
+    Returns:
+        None.
+
+    Notes:
+        The function modifies the ExclusionPoint object in place. If any of the offset values are None, they are not
+        applied to the ExclusionPoint object.
+    """
+    if point.mass:
+        point.mass += offset.mass
+    if point.rt:
+        point.rt += offset.rt
+    if point.ook0:
+        point.ook0 += offset.ook0
+    if point.intensity:
+        point.intensity += offset.intensity
+
+
+class ProgressReader:
+    """
+    A read-only file wrapper which counts the bytes read, used to report pickle loading progress.
+    """
+
+    def __init__(self, file, callback):
+        self._file = file
+        self._callback = callback
+        self.bytes_read = 0
+
+    def _update(self, num_bytes: int):
+        self.bytes_read += num_bytes
+        self._callback(self.bytes_read)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._update(len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        num_bytes = self._file.readinto(buffer)
+        self._update(num_bytes)
+        return num_bytes
+
+    def readline(self, size: int = -1) -> bytes:
+        data = self._file.readline(size)
+        self._update(len(data))
+        return data
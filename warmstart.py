@@ -0,0 +1,114 @@
+"""
+This module keeps track of which saved exclusion list is active, whether it has unsaved changes, and the progress of
+loading it. The active exid is persisted so that the server can preload it in the background after a restart, and
+checkpoint unsaved changes on shutdown.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import time
+from typing import Optional, Dict, Any
+
+_log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class ActiveListState:
+    """
+    State of the active exclusion list.
+
+    Attributes:
+        state_file (str): json file used to persist the active exid across restarts.
+        exid (Optional[str]): ID of the saved exclusion list the active list was loaded from or saved to.
+        dirty (bool): Whether the active list has changes which are not saved under exid.
+        mtime (Optional[float]): Modification time of the saved file when it was loaded or saved.
+        status (str): 'ready', 'loading' or 'failed'.
+    """
+    state_file: str
+    exid: Optional[str] = None
+    dirty: bool = False
+    mtime: Optional[float] = None
+    status: str = 'ready'
+    loading_exid: Optional[str] = None
+    bytes_loaded: int = 0
+    total_bytes: int = 0
+    load_start_time: Optional[float] = None
+    load_end_time: Optional[float] = None
+    error: Optional[str] = None
+
+    def read_exid(self) -> Optional[str]:
+        """
+        Read the last active exid from the state file.
+        """
+        if not os.path.exists(self.state_file):
+            return None
+
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get('exid')
+        except Exception as e:
+            _log.error(f'Error when reading active exclusion list state: {e}')
+            return None
+
+    def write_exid(self) -> None:
+        try:
+            with open(self.state_file, 'w') as f:
+                json.dump({'exid': self.exid}, f)
+        except Exception as e:
+            _log.error(f'Error when writing active exclusion list state: {e}')
+
+    def set_active(self, exid: Optional[str], mtime: Optional[float] = None) -> None:
+        """
+        Mark the active list as an unmodified copy of the saved list exid (or of no saved list if exid is None).
+        """
+        self.exid = exid
+        self.mtime = mtime
+        self.dirty = False
+        self.write_exid()
+
+    def is_current(self, exid: str, mtime: float) -> bool:
+        """
+        Whether the active list already holds an unmodified copy of the saved list exid.
+        """
+        return self.status == 'ready' and self.exid == exid and not self.dirty and self.mtime == mtime
+
+    def start_loading(self, exid: str, total_bytes: int) -> None:
+        self.status = 'loading'
+        self.loading_exid = exid
+        self.bytes_loaded = 0
+        self.total_bytes = total_bytes
+        self.load_start_time = time.time()
+        self.load_end_time = None
+        self.error = None
+
+    def update_progress(self, bytes_loaded: int) -> None:
+        self.bytes_loaded = bytes_loaded
+
+    def finish_loading(self, mtime: float) -> None:
+        self.status = 'ready'
+        self.load_end_time = time.time()
+        self.set_active(self.loading_exid, mtime)
+
+    def fail_loading(self, error: Exception) -> None:
+        self.status = 'failed'
+        self.load_end_time = time.time()
+        self.error = str(error)
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        Get the readiness of the active list and the progress of the current or last load.
+        """
+        end_time = self.load_end_time if self.load_end_time is not None else time.time()
+        return {
+            'status': self.status,
+            'exid': self.exid,
+            'dirty': self.dirty,
+            'loading_exid': self.loading_exid,
+            'bytes_loaded': self.bytes_loaded,
+            'total_bytes': self.total_bytes,
+            'progress': self.bytes_loaded / self.total_bytes if self.total_bytes else 1.0,
+            'elapsed': end_time - self.load_start_time if self.load_start_time is not None else 0.0,
+            'error': self.error,
+        }